@@ -0,0 +1,116 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+
+class TokenCache:
+    """Per-process LRU of authenticated tokens, each entry kept for a short TTL.
+
+    Entries are dropped as soon as their token is deleted or their user is
+    saved, deleted or logged out (see accounts.signals), so deactivations and
+    password changes take effect on the next request. Other processes only
+    notice such a change once their own entry expires, which is why the TTL
+    (TOKEN_AUTH_CACHE_TTL) is kept short. Changes made with
+    QuerySet.update() send no signals; call clear() after them.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._keys_by_user = {}
+        self._generation = 0
+        self._stats = {'hits': 0, 'misses': 0, 'expirations': 0, 'evictions': 0, 'invalidations': 0}
+
+    @property
+    def max_entries(self):
+        return getattr(settings, 'TOKEN_AUTH_CACHE_MAX_ENTRIES', 10000)
+
+    @property
+    def ttl(self):
+        return getattr(settings, 'TOKEN_AUTH_CACHE_TTL', 60)
+
+    @property
+    def generation(self):
+        """Changes on every invalidation; pass it back to set() to drop reads that raced one."""
+        return self._generation
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] <= time.monotonic():
+                self._discard(key)
+                self._stats['expirations'] += 1
+                entry = None
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return entry[0]
+
+    def set(self, key, token, generation):
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._discard(key)
+            self._entries[key] = (token, time.monotonic() + self.ttl)
+            self._keys_by_user.setdefault(token.user_id, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._discard(next(iter(self._entries)))
+                self._stats['evictions'] += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            self._generation += 1
+            self._discard(key)
+            self._stats['invalidations'] += 1
+
+    def invalidate_user(self, user_id):
+        with self._lock:
+            self._generation += 1
+            for key in list(self._keys_by_user.get(user_id, ())):
+                self._discard(key)
+            self._stats['invalidations'] += 1
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            keys = self._keys_by_user[entry[0].user_id]
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_user[entry[0].user_id]
+
+    def stats(self):
+        with self._lock:
+            return {**self._stats, 'size': len(self._entries), 'max_entries': self.max_entries}
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._keys_by_user.clear()
+            for name in self._stats:
+                self._stats[name] = 0
+
+
+token_cache = TokenCache()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication that skips the token/user query for recently seen tokens."""
+
+    def authenticate_credentials(self, key):
+        token = token_cache.get(key)
+        if token is None:
+            generation = token_cache.generation
+            user, token = super().authenticate_credentials(key)
+            token_cache.set(key, token, generation)
+        elif not token.user.is_active:
+            raise exceptions.AuthenticationFailed('User inactive or deleted.')
+        # the cached user is shared between requests; hand each one its own copy
+        return (copy.copy(token.user), token)
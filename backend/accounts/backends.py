@@ -0,0 +1,49 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.db.models import Q
+
+UserModel = get_user_model()
+
+
+class UsernameOrEmailBackend(ModelBackend):
+    """Log in with either the username or the email address.
+
+    Both columns are unique and indexed, so the user is found with a single
+    query and the password is hashed exactly once, including for unknown
+    users (to keep their response time indistinguishable). Should one user's
+    username equal another's email, the username match wins.
+    """
+
+    def candidates(self, identifier):
+        lookup = Q(**{UserModel.USERNAME_FIELD: identifier})
+        if '@' in identifier:
+            lookup |= Q(email=identifier)
+        return UserModel._default_manager.filter(lookup)[:2]
+
+    def pick(self, users, identifier):
+        for user in users:
+            if user.get_username() == identifier:
+                return user
+        return users[0] if users else None
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return
+        user = self.pick(list(self.candidates(username)), username)
+        if user is None:
+            UserModel().set_password(password)
+        elif user.check_password(password) and self.user_can_authenticate(user):
+            return user
+
+    async def aauthenticate(self, request, username=None, password=None, **kwargs):
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return
+        user = self.pick([user async for user in self.candidates(username)], username)
+        if user is None:
+            UserModel().set_password(password)
+        elif await user.acheck_password(password) and self.user_can_authenticate(user):
+            return user
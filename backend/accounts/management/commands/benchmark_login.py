@@ -0,0 +1,75 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from shop.seed import SEED_PASSWORD
+
+
+def summarize(latencies, elapsed):
+    latencies = sorted(latencies)
+    return {
+        'logins': len(latencies),
+        'throughput': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(latencies[len(latencies) // 2] * 1000, 2),
+        'p99_ms': round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000, 2),
+    }
+
+
+class Command(BaseCommand):
+    help = "Measure login throughput by username, by email and for unknown users."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=100, help="Logins per scenario.")
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--username', default='bench0')
+        parser.add_argument('--password', default=SEED_PASSWORD)
+
+    def handle(self, *args, **options):
+        try:
+            user = get_user_model().objects.get(username=options['username'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f"No user {options['username']!r}; run seed_benchmark_data first.")
+
+        # failed logins are part of the run; keep their 400 warnings out of the report
+        logging.getLogger('django.request').setLevel(logging.ERROR)
+        scenarios = {
+            'username': (user.username, options['password'], 200),
+            'email': (user.email, options['password'], 200),
+            'wrong password': (user.email, options['password'] + '!', 400),
+            'unknown user': ('nobody@example.com', options['password'], 400),
+        }
+        # the test client sends Host: testserver, as setup_test_environment() would allow
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            for name, (identifier, password, expected) in scenarios.items():
+                payload = {'username_or_email': identifier, 'password': password}
+                with CaptureQueriesContext(connection) as captured:
+                    self.login(Client(), payload, expected)
+                result = self.run(payload, expected, options['requests'], options['concurrency'])
+                self.stdout.write(
+                    f"{name:<15} {result['throughput']:>8} logins/s  p50 {result['p50_ms']:>8} ms  "
+                    f"p99 {result['p99_ms']:>8} ms  {len(captured)} queries"
+                )
+
+    def login(self, client, payload, expected):
+        response = client.post(reverse('login'), payload)
+        if response.status_code != expected:
+            raise CommandError(f"Login as {payload['username_or_email']} returned {response.status_code}.")
+
+    def run(self, payload, expected, requests, concurrency):
+        def attempt(_):
+            started = time.perf_counter()
+            self.login(Client(), payload, expected)
+            return time.perf_counter() - started
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as pool:
+            latencies = list(pool.map(attempt, range(requests)))
+        return summarize(latencies, time.perf_counter() - started)
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.5 on 2026-10-18 18:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_address'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='address',
+            index=models.Index(fields=['user', 'default'], name='address_user_default_idx'),
+        ),
+    ]
@@ -23,5 +23,11 @@ class Address(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # address book and default-address lookups: WHERE user_id = ? [AND default]
+            models.Index(fields=['user', 'default'], name='address_user_default_idx'),
+        ]
+
     def __str__(self):
         return f"{self.full_name}, {self.street_address}, {self.city}"
\ No newline at end of file
@@ -26,15 +26,8 @@ class LoginSerializer(serializers.Serializer):
         username_or_email = data.get('username_or_email')
         password = data.get('password')
 
-        # Allow login with username or email
-        user = authenticate(username=username_or_email, password=password)
-        if not user:
-            # try email login
-            try:
-                user_obj = CustomUser.objects.get(email=username_or_email)
-                user = authenticate(username=user_obj.username, password=password)
-            except CustomUser.DoesNotExist:
-                pass
+        # accounts.backends.UsernameOrEmailBackend accepts either in one lookup
+        user = authenticate(self.context.get('request'), username=username_or_email, password=password)
 
         if not user:
             raise serializers.ValidationError("Invalid credentials")
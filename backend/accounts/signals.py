@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.contrib.auth.signals import user_logged_out
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .authentication import token_cache
+
+
+def _invalidate_user(user_id):
+    token_cache.invalidate_user(user_id)
+    # a request that read the user before this transaction commits could
+    # cache the old row again; drop it once more after commit
+    transaction.on_commit(lambda: token_cache.invalidate_user(user_id))
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_token(sender, instance, **kwargs):
+    token_cache.invalidate(instance.key)
+    transaction.on_commit(lambda: token_cache.invalidate(instance.key))
+
+
+@receiver([post_save, post_delete], sender=settings.AUTH_USER_MODEL)
+def invalidate_changed_user(sender, instance, **kwargs):
+    _invalidate_user(instance.pk)
+
+
+@receiver(user_logged_out)
+def invalidate_logged_out_user(sender, user, **kwargs):
+    if user is not None:
+        _invalidate_user(user.pk)
@@ -1,3 +1,150 @@
-from django.test import TestCase
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import get_hasher
+from django.core.management import call_command
+from django.test import TransactionTestCase, override_settings
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+
+from shop.seed import SEED_PASSWORD
+
+from .authentication import token_cache
+
+
+class CachedTokenAuthenticationTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.user = User.objects.create_user(username='regular', email='regular@example.com', password='pass1234')
+        cls.admin = User.objects.create_user(
+            username='boss', email='boss@example.com', password='pass1234', is_staff=True,
+        )
+        cls.token = Token.objects.create(user=cls.user)
+
+    def setUp(self):
+        token_cache.clear()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.url = reverse('user-addresses')
+
+    def test_repeat_requests_skip_the_token_query(self):
+        # token joined to user, addresses
+        with self.assertNumQueries(2):
+            self.assertEqual(self.client.get(self.url).status_code, 200)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(self.url).status_code, 200)
+        self.assertEqual(
+            {name: token_cache.stats()[name] for name in ('hits', 'misses', 'size')},
+            {'hits': 1, 'misses': 1, 'size': 1},
+        )
+
+    def test_deactivated_user_is_rejected_at_once(self):
+        self.client.get(self.url)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+    def test_deleted_token_is_rejected_at_once(self):
+        self.client.get(self.url)
+        Token.objects.filter(pk=self.token.pk).delete()
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+    def test_logout_revokes_the_token(self):
+        self.client.get(self.url)
+        self.assertEqual(self.client.post(reverse('logout')).status_code, 200)
+        self.assertFalse(Token.objects.filter(user=self.user).exists())
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+    def test_requests_get_their_own_user(self):
+        self.client.get(self.url)
+        cached = token_cache.get(self.token.key).user
+        self.client.get(self.url)
+        response = self.client.get(self.url)
+        self.assertIsNot(response.wsgi_request.user, cached)
+        self.assertEqual(response.wsgi_request.user, self.user)
+
+    @override_settings(TOKEN_AUTH_CACHE_MAX_ENTRIES=2)
+    def test_least_recently_used_token_is_evicted(self):
+        tokens = [self.token] + [
+            Token.objects.create(user=get_user_model().objects.create_user(
+                username=f'extra{i}', email=f'extra{i}@example.com', password='pass1234',
+            ))
+            for i in range(2)
+        ]
+        token_cache.clear()
+        for token in tokens:
+            self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+            self.client.get(self.url)
+        stats = token_cache.stats()
+        self.assertEqual((stats['size'], stats['evictions']), (2, 1))
+        self.assertIsNone(token_cache.get(self.token.key))
+
+    @override_settings(TOKEN_AUTH_CACHE_TTL=0)
+    def test_expired_entries_are_reloaded(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(2):
+            self.client.get(self.url)
+        self.assertEqual(token_cache.stats()['expirations'], 1)
+
+    def test_stale_read_is_not_cached(self):
+        generation = token_cache.generation
+        token_cache.invalidate_user(self.user.pk)
+        token_cache.set(self.token.key, self.token, generation)
+        self.assertIsNone(token_cache.get(self.token.key))
+
+    def test_stats_are_admin_only(self):
+        self.assertEqual(self.client.get(reverse('token-cache-stats')).status_code, 403)
+        self.client.credentials()
+        self.client.force_authenticate(self.admin)
+        response = self.client.get(reverse('token-cache-stats'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('evictions', response.data)
+
+
+class LoginTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(
+            username='walker', email='walker@example.com', password='pass1234',
+        )
+        Token.objects.create(user=cls.user)
+
+    def login(self, identifier, password='pass1234'):
+        hasher = type(get_hasher())
+        with mock.patch.object(hasher, 'encode', autospec=True, side_effect=hasher.encode) as encode:
+            response = self.client.post(reverse('login'), {'username_or_email': identifier, 'password': password})
+        return response, encode.call_count
+
+    def test_username_and_email_each_hash_once(self):
+        for identifier in ('walker', 'walker@example.com'):
+            # user by username or email, token
+            with self.assertNumQueries(2):
+                response, hashes = self.login(identifier)
+            self.assertEqual((response.status_code, response.data['username'], hashes), (200, 'walker', 1))
+
+    def test_failures_hash_once(self):
+        for identifier, password in (('walker@example.com', 'wrong'), ('ghost@example.com', 'pass1234'), ('ghost', 'x')):
+            with self.assertNumQueries(1):
+                response, hashes = self.login(identifier, password)
+            self.assertEqual((response.status_code, hashes), (400, 1), identifier)
+
+    def test_inactive_user_cannot_log_in(self):
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.login('walker@example.com')[0].status_code, 400)
+
+    def test_username_match_wins_over_email(self):
+        get_user_model().objects.create_user(username='walker@example.com', email='other@example.com', password='other')
+        response, _ = self.login('walker@example.com', 'other')
+        self.assertEqual(response.data['username'], 'walker@example.com')
+
+
+class LoginBenchmarkCommandTests(TransactionTestCase):
+    @override_settings(ALLOWED_HOSTS=[])  # as in backend/settings.py
+    def test_runs_against_default_settings(self):
+        get_user_model().objects.create_user(username='bench0', email='bench0@example.com', password=SEED_PASSWORD)
+        out = StringIO()
+        call_command('benchmark_login', requests=4, concurrency=2, stdout=out)
+        self.assertIn('unknown user', out.getvalue())
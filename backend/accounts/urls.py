@@ -1,10 +1,12 @@
 from django.urls import path
-from .views import RegisterView, LoginView , UserAddressListCreateView, UserAddressRetrieveUpdateDestroyView
+from .views import RegisterView, LoginView, LogoutView, TokenCacheStatsView, UserAddressListCreateView, UserAddressRetrieveUpdateDestroyView
 
 
 urlpatterns = [
     path('register/', RegisterView.as_view(), name='register'),
     path('login/', LoginView.as_view(), name='login'),
+    path('logout/', LogoutView.as_view(), name='logout'),
+    path('token-cache-stats/', TokenCacheStatsView.as_view(), name='token-cache-stats'),
     path('addresses/', UserAddressListCreateView.as_view(), name='user-addresses'),
     path('addresses/<int:pk>/', UserAddressRetrieveUpdateDestroyView.as_view(), name='user-address-detail'),
 ]
@@ -2,6 +2,8 @@ from rest_framework import generics, status, permissions
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.authtoken.models import Token  # Import Token model
+from django.contrib.auth import logout
+from .authentication import token_cache
 from .models import Address
 from .serializers import RegisterSerializer, LoginSerializer
 from .serializers import AddressSerializer
@@ -12,7 +14,7 @@ class LoginView(APIView):
     serializer_class = LoginSerializer
 
     def post(self, request):
-        serializer = LoginSerializer(data=request.data)
+        serializer = LoginSerializer(data=request.data, context={'request': request})
         serializer.is_valid(raise_exception=True)
         user = serializer.validated_data['user']
 
@@ -27,6 +29,24 @@ class LoginView(APIView):
         }, status=status.HTTP_200_OK)
     
 
+class LogoutView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        # deleting the token also drops it from the token cache (accounts.signals)
+        if isinstance(request.auth, Token):
+            request.auth.delete()
+        logout(request)
+        return Response({"message": "Logout successful"}, status=status.HTTP_200_OK)
+
+
+class TokenCacheStatsView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response(token_cache.stats())
+
+
 class UserAddressListCreateView(generics.ListCreateAPIView):
     serializer_class = AddressSerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -0,0 +1,227 @@
+"""Per-route request metrics, served in the Prometheus text format at /metrics.
+
+MetricsMiddleware times every request and records, per route and method,
+latency, database queries and query time, response size and status codes.
+Queries are counted by an execute wrapper that the middleware installs once
+on each database connection, which adds to the counters of the request it
+runs for (found through a context variable, so async views whose queries run
+in a worker thread are counted too). Series are created the first time a
+route is seen; after that a request only increments existing counters.
+
+Setting METRICS_ENABLED to False removes the middleware, the query wrapper
+and the endpoint. The endpoint answers scrapers that send METRICS_TOKEN as a
+bearer token, and staff users signed in to the admin; everyone else gets 403.
+The numbers are per process: scrape every worker, or run a single one.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed, PermissionDenied
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import Http404, HttpResponse
+from django.utils.crypto import constant_time_compare
+
+from accounts.authentication import token_cache
+from shop.cache import catalog_cache
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+# [queries, seconds] of the request being handled in this context
+_request_queries = ContextVar('request_queries', default=None)
+
+
+def enabled():
+    return getattr(settings, 'METRICS_ENABLED', True)
+
+
+def _time_query(execute, sql, params, many, context):
+    counters = _request_queries.get()
+    if counters is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        counters[0] += 1
+        counters[1] += time.perf_counter() - started
+
+
+def install_query_timer(connection, **kwargs):
+    if _time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_time_query)
+
+
+class _Series:
+    """Every counter for one (route, method) pair."""
+
+    __slots__ = ('latency', 'queries', 'size', 'seconds', 'query_count', 'query_seconds', 'bytes', 'statuses')
+
+    def __init__(self):
+        # one slot per bucket plus +Inf; cumulated when rendered
+        self.latency = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.queries = [0] * (len(QUERY_BUCKETS) + 1)
+        self.size = [0] * (len(SIZE_BUCKETS) + 1)
+        self.seconds = 0.0
+        self.query_count = 0
+        self.query_seconds = 0.0
+        self.bytes = 0
+        self.statuses = {}
+
+
+def _labels(**labels):
+    escaped = (
+        (name, str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n'))
+        for name, value in labels.items()
+    )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, route, method, status, seconds, queries, query_seconds, size):
+        with self._lock:
+            series = self._series.get((route, method))
+            if series is None:
+                series = self._series[(route, method)] = _Series()
+            series.latency[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+            series.queries[bisect_left(QUERY_BUCKETS, queries)] += 1
+            series.seconds += seconds
+            series.query_count += queries
+            series.query_seconds += query_seconds
+            if size is not None:
+                series.size[bisect_left(SIZE_BUCKETS, size)] += 1
+                series.bytes += size
+            series.statuses[status] = series.statuses.get(status, 0) + 1
+
+    def render(self):
+        lines = []
+
+        def family(name, kind, help_text):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+
+        def histogram(name, buckets, counts, total, labels):
+            cumulative = 0
+            for bound, count in zip(buckets + ('+Inf',), counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{_labels(**labels, le=bound)} {cumulative}')
+            lines.append(f'{name}_sum{_labels(**labels)} {total}')
+            lines.append(f'{name}_count{_labels(**labels)} {cumulative}')
+
+        with self._lock:
+            series = [({'route': route, 'method': method}, values) for (route, method), values in sorted(self._series.items())]
+            family('http_requests_total', 'counter', 'Requests handled, by route, method and status.')
+            for labels, values in series:
+                for status, count in sorted(values.statuses.items()):
+                    lines.append(f'http_requests_total{_labels(**labels, status=status)} {count}')
+            family('http_request_duration_seconds', 'histogram', 'Time from request to response.')
+            for labels, values in series:
+                histogram('http_request_duration_seconds', LATENCY_BUCKETS, values.latency, values.seconds, labels)
+            family('http_request_db_queries', 'histogram', 'Database queries made per request.')
+            for labels, values in series:
+                histogram('http_request_db_queries', QUERY_BUCKETS, values.queries, values.query_count, labels)
+            family('http_request_db_seconds_total', 'counter', 'Time spent in database queries.')
+            for labels, values in series:
+                lines.append(f'http_request_db_seconds_total{_labels(**labels)} {values.query_seconds}')
+            family('http_response_size_bytes', 'histogram', 'Response body sizes; streamed bodies are not measured.')
+            for labels, values in series:
+                if sum(values.size):
+                    histogram('http_response_size_bytes', SIZE_BUCKETS, values.size, values.bytes, labels)
+
+        for prefix, stats in (('catalog_cache', catalog_cache.stats()), ('token_cache', token_cache.stats())):
+            for name, value in sorted(stats.items()):
+                kind = 'gauge' if name in ('size', 'max_entries') else 'counter'
+                metric = f'{prefix}_{name}' if kind == 'gauge' else f'{prefix}_{name}_total'
+                lines.append(f'# TYPE {metric} {kind}')
+                lines.append(f'{metric} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+
+metrics = Metrics()
+
+
+def route_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'  # 404s are not split by path, which would be unbounded
+    return match.view_name or match.route
+
+
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not enabled():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        # only with metrics on: connections opened from now on, and those already open
+        connection_created.connect(install_query_timer)
+        for connection in connections.all(initialized_only=True):
+            install_query_timer(connection)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        counters = [0, 0.0]
+        token = _request_queries.set(counters)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_queries.reset(token)
+        self.record(request, response, time.perf_counter() - started, counters)
+        return response
+
+    async def __acall__(self, request):
+        counters = [0, 0.0]
+        token = _request_queries.set(counters)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_queries.reset(token)
+        self.record(request, response, time.perf_counter() - started, counters)
+        return response
+
+    def record(self, request, response, seconds, counters):
+        route = route_name(request)
+        if route == 'metrics':
+            return
+        size = None if response.streaming else len(response.content)
+        metrics.observe(route, request.method, response.status_code, seconds, counters[0], counters[1], size)
+
+
+def can_scrape(request):
+    """A scraper presenting METRICS_TOKEN as a bearer token, or a signed-in staff user."""
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    scheme, _, credentials = request.headers.get('Authorization', '').partition(' ')
+    if token and scheme.lower() == 'bearer' and constant_time_compare(credentials, token):
+        return True
+    user = getattr(request, 'user', None)
+    return bool(user and user.is_staff)
+
+
+def metrics_view(request):
+    if not enabled():
+        raise Http404
+    if not can_scrape(request):
+        raise PermissionDenied
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,50 @@
+"""Parsers matching backend.renderers: orjson for JSON, msgpack for MessagePack."""
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser, JSONParser
+
+import msgpack
+import orjson
+
+from .renderers import MessagePackRenderer, ORJSONRenderer
+
+
+class ORJSONParser(JSONParser):
+    """JSONParser on orjson, which also rejects NaN and Infinity.
+
+    Bodies orjson refuses (integers wider than 64 bits, other encodings than
+    UTF-8, invalid JSON) are re-read by the stock parser, so what is accepted
+    and the error messages stay the same.
+    """
+    renderer_class = ORJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        body = stream.read()
+        encoding = (parser_context or {}).get('encoding', 'utf-8')
+        if encoding.lower().replace('_', '-') in ('utf-8', 'utf8'):
+            try:
+                return orjson.loads(body)
+            except orjson.JSONDecodeError:
+                pass
+        return super().parse(_Buffer(body), media_type, parser_context)
+
+
+class _Buffer:
+    """The already-read body, as the stream JSONParser expects."""
+
+    def __init__(self, body):
+        self.body = body
+
+    def read(self, size=-1):
+        body, self.body = self.body, b''
+        return body
+
+
+class MessagePackParser(BaseParser):
+    media_type = 'application/msgpack'
+    renderer_class = MessagePackRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return msgpack.unpackb(stream.read(), raw=False)
+        except (ValueError, msgpack.ExtraData, msgpack.FormatError, msgpack.StackError) as exc:
+            raise ParseError(f'MessagePack parse error - {exc}')
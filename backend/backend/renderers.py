@@ -0,0 +1,64 @@
+"""Faster drop-in renderers for REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'].
+
+ORJSONRenderer produces the same bytes as DRF's JSONRenderer, several times
+faster on large listings. Values orjson has no type for (Decimal, lazy
+strings, ...) go through DRF's own encoder, and so do datetimes, whose
+format differs. Anything orjson cannot reproduce exactly is rendered by the
+stock renderer instead:
+- indented output;
+- non-default UNICODE_JSON / COMPACT_JSON settings;
+- integers wider than 64 bits;
+- floats that Python would write in exponent form.
+Non-finite floats, which the stock renderer refuses, come out as null.
+
+MessagePackRenderer is the binary alternative for internal services, which
+ask for it with Accept: application/msgpack.
+"""
+import re
+
+import msgpack
+import orjson
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+# orjson writes floats from 1e16 up as 1e16, not 1e+16, and those below 1e-4
+# as 0.00001 or 1e-6, not 1e-05 or 1e-06. _EXPONENT and b'0.0000' find every
+# such float quickly (and some text); _INEXACT_NUMBER then only matches at the
+# start of a number. Text it still matches only costs a fallback.
+_EXPONENT = re.compile(rb'e(?<=[0-9]e)(?:[0-9]|-[0-9](?![0-9]))')
+_INEXACT_NUMBER = re.compile(rb'(?:^|[:,\[])-?(?:[0-9]+(?:\.[0-9]+)?[eE]|0\.0000|[0-9]{16})')
+
+_encoder = JSONEncoder()
+
+
+class ORJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if (
+            self.ensure_ascii or not self.compact
+            or self.get_indent(accepted_media_type, renderer_context or {}) is not None
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=_encoder.default, option=ORJSON_OPTIONS)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        if (b'0.0000' in ret or _EXPONENT.search(ret)) and _INEXACT_NUMBER.search(ret):
+            return super().render(data, accepted_media_type, renderer_context)
+        # the stock renderer escapes these so the output stays valid JavaScript
+        return ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+
+
+class MessagePackRenderer(BaseRenderer):
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=_encoder.default, use_bin_type=True)
@@ -38,6 +38,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'backend.metrics.MetricsMiddleware',  # first, so it times everything below it
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -83,6 +84,53 @@ DATABASES = {
 }
 
 
+# Caches
+# The catalog cache holds serialized category/product pages (see shop.cache);
+# point CATALOG_CACHE_ALIAS at a shared backend such as Redis in production.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'catalog': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'catalog',
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    },
+}
+
+CATALOG_CACHE_ALIAS = 'catalog'
+CATALOG_CACHE_TIMEOUT = 60 * 60
+
+# Product search: 'auto' uses the MySQL FULLTEXT index when running on MySQL
+# and the shop.ProductSearchTerm inverted index elsewhere ('fulltext'/'inverted' force one).
+PRODUCT_SEARCH_BACKEND = 'auto'
+
+# Seconds stock stays held for a shopper after checkout starts (shop.inventory).
+INVENTORY_RESERVATION_TTL = 15 * 60
+
+# Orders read per query by the streaming admin export (shop.exports).
+ORDER_EXPORT_BATCH_SIZE = 1000
+
+# Token lookups cached per process by accounts.authentication.CachedTokenAuthentication.
+# The TTL bounds how long another process may keep honouring a revoked token.
+TOKEN_AUTH_CACHE_MAX_ENTRIES = 10000
+TOKEN_AUTH_CACHE_TTL = 60
+
+# Read routes served by the async views in shop.async_views instead of DRF
+# (any of 'category-list', 'products-by-category', 'user-cart', 'user-orders').
+# They only pay off under an ASGI server such as uvicorn or daphne.
+SHOP_ASYNC_VIEWS = []
+
+# Per-route latency, query and response size metrics (backend.metrics), served
+# in the Prometheus text format at /metrics; False drops the middleware and the
+# endpoint. Only staff users and scrapers sending "Authorization: Bearer
+# <METRICS_TOKEN>" may read it (set the token in the scrape job's
+# authorization.credentials); without a token only staff can.
+METRICS_ENABLED = True
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -127,15 +175,39 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTH_USER_MODEL = 'accounts.CustomUser'
 
+AUTHENTICATION_BACKENDS = [
+    'accounts.backends.UsernameOrEmailBackend',  # username or email, one query, one hash
+]
+
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Resized copies of category/product images (shop.images): longest edge in
+# pixels per size name, rendered in a pool of IMAGE_DERIVATIVE_WORKERS
+# processes (None = one per CPU) after each upload commits.
+IMAGE_DERIVATIVE_SIZES = {'thumb': 160, 'medium': 480, 'large': 1024}
+IMAGE_DERIVATIVE_FORMAT = 'WEBP'
+IMAGE_DERIVATIVE_QUALITY = 80
+IMAGE_DERIVATIVE_WORKERS = None
+IMAGE_DERIVATIVES_IN_BACKGROUND = True
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'accounts.authentication.CachedTokenAuthentication',  # TokenAuthentication with an in-process cache
         'rest_framework.authentication.SessionAuthentication',  # optional for browser-based sessions
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',  # default open permission; override in views as needed
     ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'backend.renderers.ORJSONRenderer',  # byte-identical to JSONRenderer, rendered with orjson
+        'rest_framework.renderers.BrowsableAPIRenderer',
+        'backend.renderers.MessagePackRenderer',  # application/msgpack, for internal services
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'backend.parsers.ORJSONParser',  # JSONParser on orjson
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+        'backend.parsers.MessagePackParser',
+    ],
 }
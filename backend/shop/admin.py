@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Category, Product, Variant, Review ,Order
+from .models import Category, Product, Variant, Review ,Order, StockMovement, StockReservation
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
@@ -27,3 +27,17 @@ class OrderAdmin(admin.ModelAdmin):
     list_filter = ['status', 'created_at']
     search_fields = ['user__username', 'id']
     ordering = ['-created_at']
+
+
+@admin.register(StockMovement)
+class StockMovementAdmin(admin.ModelAdmin):
+    list_display = ['variant', 'kind', 'quantity', 'reconciled', 'created_at']
+    list_filter = ['kind', 'reconciled']
+    ordering = ['-created_at']
+
+
+@admin.register(StockReservation)
+class StockReservationAdmin(admin.ModelAdmin):
+    list_display = ['variant', 'user', 'quantity', 'status', 'expires_at']
+    list_filter = ['status']
+    search_fields = ['user__username']
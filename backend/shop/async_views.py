@@ -0,0 +1,152 @@
+"""Async versions of the hot read endpoints, built on Django's async ORM.
+
+Each view returns the same JSON as its DRF counterpart in shop.views and
+shares its querysets, serializers, pagination cursors and catalog cache
+entries; shop.urls picks which implementation serves a route from the
+SHOP_ASYNC_VIEWS setting. Everything a serializer touches is loaded up
+front, so serialization never reaches the database from the event loop.
+"""
+import copy
+import functools
+
+from django.http import HttpResponse
+from rest_framework import exceptions, status
+from rest_framework.authentication import get_authorization_header
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from accounts.authentication import token_cache
+from .cache import catalog_cache
+from .conditional import acart_etag, acatalog_etag, aorders_etag, not_modified, with_etag
+from .fieldsets import Fieldset
+from .models import Category
+from .pagination import ProductCursorPagination, OrderCursorPagination
+from .serializers import CategorySerializer, ProductSerializer, CartSerializer, OrderSerializer, OrderFilterSerializer
+from .views import cart_queryset, order_queryset, product_queryset
+
+
+def json_renderer():
+    """The first configured JSON renderer, so async views encode like the DRF ones."""
+    for renderer_class in api_settings.DEFAULT_RENDERER_CLASSES:
+        if issubclass(renderer_class, JSONRenderer):
+            return renderer_class()
+    return JSONRenderer()
+
+
+def render(data, status_code=status.HTTP_200_OK):
+    return HttpResponse(json_renderer().render(data), status=status_code, content_type='application/json')
+
+
+async def authenticate(request):
+    """Token authentication (through the shared token cache), falling back to the session."""
+    auth = get_authorization_header(request).split()
+    if not auth or auth[0].lower() != b'token':
+        user = await request.auser()
+        if not user.is_authenticated:
+            raise exceptions.NotAuthenticated()
+        return user
+    if len(auth) != 2:
+        raise exceptions.AuthenticationFailed('Invalid token header.')
+    try:
+        key = auth[1].decode()
+    except UnicodeError:
+        raise exceptions.AuthenticationFailed('Invalid token.')
+    token = token_cache.get(key)
+    if token is None:
+        generation = token_cache.generation
+        try:
+            token = await Token.objects.select_related('user').aget(key=key)
+        except Token.DoesNotExist:
+            raise exceptions.AuthenticationFailed('Invalid token.')
+        if token.user.is_active:
+            token_cache.set(key, token, generation)
+    if not token.user.is_active:
+        raise exceptions.AuthenticationFailed('User inactive or deleted.')
+    return copy.copy(token.user)
+
+
+def authenticated_get(view):
+    """Allow only authenticated GETs and render API errors the way DRF does."""
+
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        try:
+            if request.method not in ('GET', 'HEAD'):
+                raise exceptions.MethodNotAllowed(request.method)
+            api_request = Request(request)
+            api_request.user = await authenticate(request)
+            return await view(api_request, *args, **kwargs)
+        except exceptions.APIException as exc:
+            detail = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+            response = render(detail, exc.status_code)
+            if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+                response['WWW-Authenticate'] = 'Token'
+            return response
+
+    return wrapper
+
+
+async def cached(scope, request, load):
+    key = await catalog_cache.amake_key(scope, request.build_absolute_uri())
+    data = await catalog_cache.aget(key)
+    if data is None:
+        data = await load()
+        await catalog_cache.aset(key, data)
+    return data
+
+
+@authenticated_get
+async def category_list(request):
+    etag = await acatalog_etag('categories')
+    if response := not_modified(request, etag):
+        return response
+
+    async def load():
+        categories = [category async for category in Category.objects.all()]
+        return CategorySerializer(categories, many=True, context={'request': request}).data
+
+    return with_etag(render(await cached('categories', request, load)), etag)
+
+
+@authenticated_get
+async def products_by_category(request, category_id):
+    etag = await acatalog_etag('products')
+    if response := not_modified(request, etag):
+        return response
+
+    fieldset = Fieldset.from_request(request, ProductSerializer)
+
+    async def load():
+        paginator = ProductCursorPagination()
+        page = await paginator.apaginate_queryset(product_queryset(category_id, fieldset), request)
+        data = ProductSerializer(page, many=True, context={'request': request, 'fieldset': fieldset}).data
+        return paginator.get_paginated_data(data)
+
+    return with_etag(render(await cached('products', request, load)), etag)
+
+
+@authenticated_get
+async def user_cart(request):
+    etag = await acart_etag(request.user)
+    if response := not_modified(request, etag):
+        return response
+    cart, created = await cart_queryset().aget_or_create(user=request.user)
+    if created:
+        cart = await cart_queryset().aget(pk=cart.pk)
+    return with_etag(render(CartSerializer(cart, context={'request': request}).data), etag)
+
+
+@authenticated_get
+async def user_orders(request):
+    etag = await aorders_etag(request.user)
+    if response := not_modified(request, etag):
+        return response
+    filters = OrderFilterSerializer(data=request.query_params)
+    filters.is_valid(raise_exception=True)
+    fieldset = Fieldset.from_request(request, OrderSerializer)
+    paginator = OrderCursorPagination()
+    page = await paginator.apaginate_queryset(filters.filter(order_queryset(fieldset).filter(user=request.user)), request)
+    data = OrderSerializer(page, many=True, context={'request': request, 'fieldset': fieldset}).data
+    return with_etag(render(paginator.get_paginated_data(data)), etag)
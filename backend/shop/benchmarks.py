@@ -0,0 +1,225 @@
+"""Timed requests against every shop and accounts endpoint, with query budgets.
+
+ENDPOINTS describes one representative request per route (and per method
+where a route does more than read). The run_benchmarks command seeds the
+deterministic dataset from shop.seed at each size in PRESETS and times every
+request; EndpointBudgetTests runs the same requests once on a tiny dataset.
+A budget is the most queries a request may make. Budgets do not depend on
+the data size: a count that grows with the data is a regression.
+
+Every request runs inside a transaction that is rolled back afterwards, so
+writes see the same data on every repeat, and users are authenticated with
+force_authenticate, so token lookups are not part of the counts.
+"""
+import time
+
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.db.models import F
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLResolver, reverse
+from rest_framework.authtoken.models import Token
+
+from accounts.models import Address
+from .cache import catalog_cache
+from .models import Category, Product, Variant, CartItem, Order
+from .seed import DEFAULT_SIZES, SEED_PASSWORD
+
+PRESETS = {
+    'tiny': {
+        'users': 3, 'addresses_per_user': 2, 'categories': 2, 'products_per_category': 6,
+        'variants_per_product': 2, 'reviews_per_product': 2, 'cart_items_per_user': 3,
+        'orders_per_user': 4, 'items_per_order': 2,
+    },
+    'small': {
+        'users': 20, 'addresses_per_user': 2, 'categories': 5, 'products_per_category': 40,
+        'variants_per_product': 3, 'reviews_per_product': 5, 'cart_items_per_user': 4,
+        'orders_per_user': 10, 'items_per_order': 3,
+    },
+    'medium': DEFAULT_SIZES,
+    'large': {
+        'users': 200, 'addresses_per_user': 2, 'categories': 20, 'products_per_category': 250,
+        'variants_per_product': 4, 'reviews_per_product': 10, 'cart_items_per_user': 8,
+        'orders_per_user': 50, 'items_per_order': 4,
+    },
+}
+
+
+class Endpoint:
+    """One request: `kwargs`, `params` and `data` are callables of the fixtures."""
+
+    def __init__(self, name, budget, method='get', user='shopper', kwargs=None, params=None, data=None, status=200):
+        self.name = name
+        self.budget = budget
+        self.method = method
+        self.user = user
+        self.kwargs = kwargs
+        self.params = params
+        self.data = data
+        self.status = status
+
+    @property
+    def label(self):
+        return f'{self.method.upper()} {self.name}'
+
+
+ENDPOINTS = [
+    # shop catalog
+    Endpoint('category-list', 1),
+    Endpoint('products-by-category', 2, kwargs=lambda f: {'category_id': f['category'].pk}),
+    Endpoint('product-search', 3, params=lambda f: {'q': 'product option'}),
+    Endpoint('product-reviews', 1, kwargs=lambda f: {'product_id': f['product'].pk}),
+    Endpoint('catalog-cache-stats', 0, user='admin'),
+    # cart
+    Endpoint('user-cart', 3),
+    Endpoint('add-to-cart', 4, method='post', data=lambda f: {
+        'product': f['variant'].product_id, 'variant': f['variant'].pk, 'quantity': 1,
+    }),
+    Endpoint('cart-batch', 10, method='post', data=lambda f: {'operations': [
+        {'op': 'add', 'product': f['variant'].product_id, 'variant': f['variant'].pk, 'quantity': 2},
+        {'op': 'remove', 'product': f['cart_item'].product_id, 'variant': f['cart_item'].variant_id},
+    ]}),
+    Endpoint('cart-item-detail', 3, kwargs=lambda f: {'pk': f['cart_item'].pk}),
+    Endpoint('cart-item-detail', 5, method='patch', kwargs=lambda f: {'pk': f['cart_item'].pk},
+             data=lambda f: {'quantity': 5}),
+    Endpoint('cart-item-detail', 3, method='delete', kwargs=lambda f: {'pk': f['cart_item'].pk}, status=204),
+    Endpoint('cart-reserve', 12, method='post', status=201),
+    # orders
+    Endpoint('user-orders', 3),
+    Endpoint('place-order', 12, method='post', status=201),
+    Endpoint('direct-place-order', 9, method='post', status=201, data=lambda f: {'items': [
+        {'product': f['variant'].product_id, 'variant': f['variant'].pk, 'quantity': 1},
+        {'product': f['product'].pk, 'quantity': 2},
+    ]}),
+    Endpoint('order-delete', 3, method='delete', kwargs=lambda f: {'order_id': f['order'].pk}, status=204),
+    # admin orders
+    Endpoint('api-root', 0, user='admin'),
+    Endpoint('admin-orders-list', 2, user='admin', params=lambda f: {'status': 'Pending'}),
+    Endpoint('admin-orders-detail', 2, user='admin', kwargs=lambda f: {'pk': f['order'].pk}),
+    Endpoint('admin-orders-update-status', 3, method='patch', user='admin',
+             kwargs=lambda f: {'pk': f['order'].pk}, data=lambda f: {'status': 'Canceled'}),
+    Endpoint('admin-orders-bulk-status', 4, method='post', user='admin', data=lambda f: {
+        'ids': f['order_ids'], 'status': 'Canceled',
+    }),
+    Endpoint('admin-orders-export', 3, user='admin', params=lambda f: {'user': f['shopper'].pk}),
+    # accounts
+    Endpoint('register', 3, method='post', user=None, status=201, data=lambda f: {
+        'username': 'newcomer', 'email': 'newcomer@example.com', 'password': 'newcomer-pass',
+    }),
+    Endpoint('login', 2, method='post', user=None, data=lambda f: {
+        'username_or_email': f['shopper'].email, 'password': SEED_PASSWORD,
+    }),
+    Endpoint('logout', 0, method='post'),
+    Endpoint('token-cache-stats', 0, user='admin'),
+    Endpoint('user-addresses', 1),
+    Endpoint('user-addresses', 1, method='post', status=201, data=lambda f: {
+        'full_name': 'Bench Shopper', 'phone': '5550000000', 'street_address': '1 Elm St',
+        'city': 'Austin', 'state': 'TX', 'postal_code': '73301', 'country': 'US',
+    }),
+    Endpoint('user-address-detail', 1, kwargs=lambda f: {'pk': f['address'].pk}),
+    Endpoint('user-address-detail', 2, method='patch', kwargs=lambda f: {'pk': f['address'].pk},
+             data=lambda f: {'city': 'Boston'}),
+]
+
+
+def route_names():
+    """Every named route in shop.urls and accounts.urls."""
+    from accounts import urls as accounts_urls
+    from . import urls as shop_urls
+
+    names = set()
+
+    def walk(patterns):
+        for pattern in patterns:
+            if isinstance(pattern, URLResolver):
+                walk(pattern.url_patterns)
+            elif pattern.name:
+                names.add(pattern.name)
+
+    walk(shop_urls.urlpatterns + accounts_urls.urlpatterns)
+    return names
+
+
+def unbenchmarked_routes():
+    return sorted(route_names() - {endpoint.name for endpoint in ENDPOINTS})
+
+
+def benchmark_fixtures():
+    """Rows the requests act on, picked from a freshly seeded dataset.
+
+    bench0 becomes an admin and bench1 the shopper, whose cart lines are
+    restocked so checking out always succeeds.
+    """
+    User = get_user_model()
+    admin = User.objects.get(username='bench0')
+    admin.is_staff = True
+    admin.save(update_fields=['is_staff'])
+    shopper = User.objects.get(username='bench1')
+    Token.objects.get_or_create(user=shopper)  # logging in again reuses it
+    cart_items = CartItem.objects.filter(cart__user=shopper).order_by('pk')
+    Variant.objects.filter(pk__in=cart_items.values('variant_id')).update(stock=F('stock') + 1000)
+    cart_item = cart_items.first()
+    orders = Order.objects.filter(user=shopper).order_by('pk')
+    orders.filter(pk=orders.first().pk).update(status='Pending')  # so update-status has a legal move
+    return {
+        'admin': admin,
+        'shopper': shopper,
+        'category': Category.objects.order_by('pk').first(),
+        'product': Product.objects.filter(rating_count__gt=0).order_by('pk').first(),
+        'cart_item': cart_item,
+        'variant': Variant.objects.get(pk=cart_item.variant_id),
+        'order': orders.first(),
+        'order_ids': list(Order.objects.order_by('pk').values_list('pk', flat=True)[:50]),
+        'address': Address.objects.filter(user=shopper).order_by('pk').first(),
+    }
+
+
+def percentile(timings, fraction):
+    timings = sorted(timings)
+    return timings[min(len(timings) - 1, int(len(timings) * fraction))]
+
+
+def measure(client, endpoint, fixtures, repeat=1):
+    """Send `endpoint`'s request `repeat` times; returns its status, queries, size and timings."""
+    url = reverse(endpoint.name, kwargs=endpoint.kwargs(fixtures) if endpoint.kwargs else None)
+    params = endpoint.params(fixtures) if endpoint.params else None
+    data = endpoint.data(fixtures) if endpoint.data else None
+    client.force_authenticate(fixtures[endpoint.user] if endpoint.user else None)
+    timings, queries = [], 0
+    for _ in range(repeat):
+        catalog_cache.clear()  # time the views, not the cache
+        with transaction.atomic():
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                if endpoint.method == 'get':
+                    response = client.get(url, params)
+                else:
+                    response = getattr(client, endpoint.method)(url, data, format='json')
+                body = b''.join(response.streaming_content) if response.streaming else response.content
+                timings.append(time.perf_counter() - started)
+            transaction.set_rollback(True)
+        queries = max(queries, len(captured))
+    return {
+        'status': response.status_code,
+        'expected_status': endpoint.status,
+        'queries': queries,
+        'budget': endpoint.budget,
+        'bytes': len(body),
+        'median_ms': round(percentile(timings, 0.5) * 1000, 2),
+        'p95_ms': round(percentile(timings, 0.95) * 1000, 2),
+    }
+
+
+def run_suite(client, fixtures, repeat=1):
+    return {endpoint.label: measure(client, endpoint, fixtures, repeat) for endpoint in ENDPOINTS}
+
+
+def budget_violations(results):
+    """A line for every request that failed or went over its query budget."""
+    problems = []
+    for label, result in sorted(results.items()):
+        if result['status'] != result['expected_status']:
+            problems.append(f"{label} returned {result['status']}, expected {result['expected_status']}")
+        if result['queries'] > result['budget']:
+            problems.append(f"{label} made {result['queries']} queries, budget {result['budget']}")
+    return problems
@@ -0,0 +1,151 @@
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from rest_framework.response import Response
+
+VERSION_KEY = 'catalog:version'
+# Keys this process has written under the current version; a miss on one of
+# them means the backend dropped it (culling or expiry) and counts as an eviction.
+MAX_TRACKED_KEYS = 10000
+
+
+class CatalogCache:
+    """Read-through cache for serialized catalog responses.
+
+    Entries live under keys that embed a catalog-wide version number. Any
+    change to the catalog bumps the version, which orphans every older entry
+    at once; the backend ages those out on its own. The backend is whichever
+    CACHES alias CATALOG_CACHE_ALIAS names, so local memory, Redis or
+    memcached all work without code changes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._written = set()
+        self._written_version = None
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+
+    @property
+    def backend(self):
+        return caches[getattr(settings, 'CATALOG_CACHE_ALIAS', 'default')]
+
+    @property
+    def timeout(self):
+        return getattr(settings, 'CATALOG_CACHE_TIMEOUT', 60 * 60)
+
+    def version(self):
+        version = self.backend.get(VERSION_KEY)
+        if version is None:
+            # Start from the clock rather than 1 so that a culled version key
+            # can never resurrect entries written under an earlier version.
+            self.backend.add(VERSION_KEY, time.time_ns(), timeout=None)
+            version = self.backend.get(VERSION_KEY, time.time_ns())
+        return version
+
+    async def aversion(self):
+        version = await self.backend.aget(VERSION_KEY)
+        if version is None:
+            await self.backend.aadd(VERSION_KEY, time.time_ns(), timeout=None)
+            version = await self.backend.aget(VERSION_KEY, time.time_ns())
+        return version
+
+    def make_key(self, scope, identity):
+        return self._key(self.version(), scope, identity)
+
+    async def amake_key(self, scope, identity):
+        return self._key(await self.aversion(), scope, identity)
+
+    def _key(self, version, scope, identity):
+        digest = hashlib.sha1(identity.encode('utf-8')).hexdigest()
+        return f'catalog:{version}:{scope}:{digest}'
+
+    def get(self, key):
+        return self._counted(key, self.backend.get(key))
+
+    async def aget(self, key):
+        return self._counted(key, await self.backend.aget(key))
+
+    def _counted(self, key, data):
+        with self._lock:
+            if data is None:
+                self._stats['misses'] += 1
+                if key in self._written:
+                    self._written.discard(key)
+                    self._stats['evictions'] += 1
+            else:
+                self._stats['hits'] += 1
+        return data
+
+    def set(self, key, data):
+        self.backend.set(key, data, timeout=self.timeout)
+        self._remember(key)
+
+    async def aset(self, key, data):
+        await self.backend.aset(key, data, timeout=self.timeout)
+        self._remember(key)
+
+    def _remember(self, key):
+        version = key.split(':', 2)[1]
+        with self._lock:
+            if version != self._written_version or len(self._written) >= MAX_TRACKED_KEYS:
+                self._written = set()
+                self._written_version = version
+            self._written.add(key)
+
+    def invalidate(self):
+        try:
+            self.backend.incr(VERSION_KEY)
+        except ValueError:
+            self.backend.set(VERSION_KEY, time.time_ns(), timeout=None)
+        with self._lock:
+            self._stats['invalidations'] += 1
+            self._written = set()
+
+    def invalidate_on_commit(self):
+        """Invalidate for a write made in the current transaction.
+
+        Bump now so this transaction stops reading stale pages, and again on
+        commit so a concurrent reader cannot re-cache pre-commit data under
+        the new version. Bulk writes (update(), bulk_update()) send no
+        signals and must call this themselves.
+        """
+        self.invalidate()
+        transaction.on_commit(self.invalidate)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+    def clear(self):
+        self.backend.clear()
+        with self._lock:
+            self._written = set()
+            for name in self._stats:
+                self._stats[name] = 0
+
+
+catalog_cache = CatalogCache()
+
+
+class CatalogCacheMixin:
+    """Serve a list view's response data from the catalog cache.
+
+    The key covers the absolute request URI, so query parameters (cursor,
+    page size) and the host used in pagination links are all part of it.
+    """
+
+    catalog_cache_scope = None
+
+    def list(self, request, *args, **kwargs):
+        key = catalog_cache.make_key(self.catalog_cache_scope, request.build_absolute_uri())
+        data = catalog_cache.get(key)
+        if data is not None:
+            return Response(data)
+        response = super().list(request, *args, **kwargs)
+        if response.status_code == 200:
+            catalog_cache.set(key, response.data)
+        return response
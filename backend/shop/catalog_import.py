@@ -0,0 +1,241 @@
+"""Streaming upsert of supplier catalogs into Category, Product and Variant.
+
+Input is CSV or JSON Lines with one record per variant (or per product, if
+`variant` is empty) and these keys:
+
+    category, product, description, price, variant, variant_price, stock
+
+Rows are matched on natural keys: a category by name, a product by
+category and name, a variant by product and variant name. Empty values
+leave the stored value alone. Records are read and written one batch at a
+time, each batch in its own transaction, so memory stays bounded and an
+interrupted import can resume after its last committed batch.
+"""
+import csv
+import json
+from collections import Counter
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+
+from .cache import catalog_cache
+from .models import Category, Product, Variant, StockMovement
+from .search import index_products
+
+FIELDS = ['category', 'product', 'description', 'price', 'variant', 'variant_price', 'stock']
+
+
+class CatalogImportError(ValueError):
+    pass
+
+
+def read_records(fh, fmt):
+    """Yield (line number, record) pairs from an open CSV or JSON Lines file."""
+    if fmt == 'csv':
+        reader = csv.DictReader(fh)
+        for record in reader:
+            yield reader.line_num, record
+        return
+    for number, line in enumerate(fh, start=1):
+        if line.strip():
+            try:
+                yield number, json.loads(line)
+            except ValueError as exc:
+                raise CatalogImportError(f"line {number}: {exc}")
+
+
+def _text(number, record, name, required=False):
+    value = record.get(name)
+    value = '' if value is None else str(value).strip()
+    if required and not value:
+        raise CatalogImportError(f"line {number}: {name} is required")
+    return value or None
+
+
+def _number(number, record, name, parse):
+    value = _text(number, record, name)
+    if value is None:
+        return None
+    try:
+        parsed = parse(value)
+    except (InvalidOperation, ValueError):
+        raise CatalogImportError(f"line {number}: {name} {value!r} is not a valid number")
+    if parsed < 0:
+        raise CatalogImportError(f"line {number}: {name} cannot be negative")
+    return parsed
+
+
+def parse_record(number, record):
+    return {
+        'category': _text(number, record, 'category', required=True),
+        'product': _text(number, record, 'product', required=True),
+        'description': _text(number, record, 'description'),
+        'price': _number(number, record, 'price', lambda value: Decimal(value).quantize(Decimal('0.01'))),
+        'variant': _text(number, record, 'variant'),
+        'variant_price': _number(number, record, 'variant_price', lambda value: Decimal(value).quantize(Decimal('0.01'))),
+        'stock': _number(number, record, 'stock', int),
+    }
+
+
+def _describe(changes):
+    return ', '.join(f"{field} {old} -> {new}" for field, (old, new) in changes.items())
+
+
+def _changes(obj, values):
+    """{field: (old, new)} for every given value that differs from `obj`."""
+    return {
+        field: (getattr(obj, field), value)
+        for field, value in values.items()
+        if value is not None and getattr(obj, field) != value
+    }
+
+
+class CatalogImport:
+    """Applies batches of parsed records; with dry_run it only reports the changes."""
+
+    def __init__(self, dry_run=False, report=None):
+        self.dry_run = dry_run
+        self.report = report or (lambda line: None)
+        self.counts = Counter()
+
+    def apply(self, rows):
+        if self.dry_run:
+            self._apply(rows)
+            return
+        with transaction.atomic():
+            self._apply(rows)
+
+    def _apply(self, rows):
+        products_by_key = {}
+        variants_by_key = {}
+        for row in rows:
+            # later rows for the same key win
+            product = products_by_key.setdefault((row['category'], row['product']), {})
+            product.update({k: row[k] for k in ('description', 'price') if row[k] is not None})
+            if row['variant']:
+                variant = variants_by_key.setdefault((row['category'], row['product'], row['variant']), {})
+                variant.update({k: row[k] for k in ('variant_price', 'stock') if row[k] is not None})
+
+        # bulk writes skip the signals that keep the search index and the
+        # catalog cache current, so both are refreshed here
+        self.reindex = set()
+        categories = self._categories({category for category, _ in products_by_key})
+        products = self._products(categories, products_by_key)
+        changed = self._variants(products, variants_by_key)
+        if not self.dry_run and (self.reindex or changed):
+            index_products(sorted(self.reindex))
+            catalog_cache.invalidate_on_commit()
+
+    def _categories(self, names):
+        existing = Category.objects.in_bulk(names, field_name='name')
+        missing = sorted(names - set(existing))
+        for name in missing:
+            self.report(f"+ category {name!r}")
+        self.counts['categories created'] += len(missing)
+        if missing and not self.dry_run:
+            Category.objects.bulk_create([Category(name=name) for name in missing], ignore_conflicts=True)
+            existing = Category.objects.in_bulk(names, field_name='name')
+        return existing
+
+    def _existing_products(self, categories, keys):
+        names = {category.pk: name for name, category in categories.items()}
+        queryset = Product.objects.filter(
+            category_id__in=list(names), name__in={name for _, name in keys},
+        ).defer('search_document').order_by('pk')
+        if not self.dry_run:
+            queryset = queryset.select_for_update()
+        found = {}
+        for product in queryset:
+            found.setdefault((names[product.category_id], product.name), product)
+        return found
+
+    def _products(self, categories, products_by_key):
+        existing = self._existing_products(categories, products_by_key)
+        to_create, to_update, fields = [], [], set()
+        for key, values in products_by_key.items():
+            product = existing.get(key)
+            if product is None:
+                self.report(f"+ product {key[1]!r} in {key[0]!r}")
+                if key[0] in categories:
+                    to_create.append(Product(
+                        category=categories[key[0]], name=key[1],
+                        description=values.get('description', ''), price=values.get('price', 0),
+                    ))
+                continue
+            changes = _changes(product, values)
+            if changes:
+                self.report(f"~ product {key[1]!r} in {key[0]!r}: " + _describe(changes))
+                for field, (_, new) in changes.items():
+                    setattr(product, field, new)
+                to_update.append(product)
+                fields.update(changes)
+        self.counts['products created'] += len(products_by_key) - len(existing)
+        self.counts['products updated'] += len(to_update)
+        if self.dry_run:
+            return existing
+
+        Product.objects.bulk_create(to_create)
+        if to_update:
+            Product.objects.bulk_update(to_update, sorted(fields))
+            self.reindex.update(product.pk for product in to_update)
+        if to_create:
+            # MySQL hands back no ids from bulk inserts; read the new rows by key
+            existing = self._existing_products(categories, products_by_key)
+            self.reindex.update(existing[(product.category.name, product.name)].pk for product in to_create)
+        return existing
+
+    def _variants(self, products, variants_by_key):
+        if not variants_by_key:
+            return False
+        keys_by_pk = {product.pk: key for key, product in products.items()}
+        queryset = Variant.objects.filter(
+            product_id__in=list(keys_by_pk), variant_name__in={name for _, _, name in variants_by_key},
+        ).order_by('pk')
+        if not self.dry_run:
+            queryset = queryset.select_for_update()
+        existing = {}
+        for variant in queryset:
+            existing.setdefault(keys_by_pk[variant.product_id] + (variant.variant_name,), variant)
+
+        to_create, to_update, fields, movements = [], [], set(), []
+        for key, values in variants_by_key.items():
+            variant = existing.get(key)
+            values = {'price': values.get('variant_price'), 'stock': values.get('stock')}
+            if variant is None:
+                self.report(f"+ variant {key[2]!r} of {key[1]!r}")
+                product = products.get(key[:2])
+                if product is not None:
+                    to_create.append(Variant(
+                        product=product, variant_name=key[2],
+                        price=values['price'] if values['price'] is not None else product.price,
+                        stock=values['stock'] or 0,
+                    ))
+                continue
+            if variant.stock_stripes and values['stock'] is not None:
+                # striped stock lives in StockStripe rows; leave it to the stock tools
+                values['stock'] = None
+                self.counts['striped stock skipped'] += 1
+            changes = _changes(variant, values)
+            if changes:
+                self.report(f"~ variant {key[2]!r} of {key[1]!r}: " + _describe(changes))
+                if 'stock' in changes:
+                    old, new = changes['stock']
+                    movements.append(StockMovement(
+                        variant=variant, kind=StockMovement.ADJUST, quantity=new - old, reconciled=True,
+                    ))
+                for field, (_, new) in changes.items():
+                    setattr(variant, field, new)
+                to_update.append(variant)
+                fields.update(changes)
+        self.counts['variants created'] += len(variants_by_key) - len(existing)
+        self.counts['variants updated'] += len(to_update)
+        if self.dry_run:
+            return False
+
+        Variant.objects.bulk_create(to_create)
+        if to_update:
+            Variant.objects.bulk_update(to_update, sorted(fields))
+        StockMovement.objects.bulk_create(movements)
+        # variant names are part of their product's search document
+        self.reindex.update(variant.product_id for variant in to_create)
+        return bool(to_create or to_update)
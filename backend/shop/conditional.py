@@ -0,0 +1,87 @@
+"""ETags for conditional GETs of catalog, cart and order history responses.
+
+Each ETag is computed from validators that are cheap to read, never from
+the response body, so a request whose If-None-Match still matches is
+answered with 304 before anything is serialized:
+
+* catalog pages: the catalog cache version, bumped on every catalog change
+  (no database work at all);
+* the cart: Cart.updated_at, moved by Cart.touch() whenever the lines change,
+  plus the catalog version for names and prices;
+* order history: the number of the user's orders and their latest
+  updated_at, plus the catalog version for product and variant names.
+
+No Last-Modified is sent: cart and order responses also change when the
+catalog does, which a timestamp of their own cannot express.
+"""
+import hashlib
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+
+from .cache import catalog_cache
+from .models import Cart, Order
+
+
+def make_etag(*parts):
+    digest = hashlib.sha1(':'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+    return f'W/"{digest}"'
+
+
+def catalog_etag(scope):
+    return make_etag(scope, catalog_cache.version())
+
+
+async def acatalog_etag(scope):
+    return make_etag(scope, await catalog_cache.aversion())
+
+
+def cart_etag(user):
+    row = Cart.objects.filter(user=user).values_list('pk', 'updated_at').first()
+    # no cart yet: the view creates one, so there is nothing to validate against
+    return make_etag('cart', *row, catalog_cache.version()) if row else None
+
+
+async def acart_etag(user):
+    row = await Cart.objects.filter(user=user).values_list('pk', 'updated_at').afirst()
+    return make_etag('cart', *row, await catalog_cache.aversion()) if row else None
+
+
+def orders_etag(user):
+    summary = Order.objects.filter(user=user).aggregate(count=Count('pk'), updated=Max('updated_at'))
+    return make_etag('orders', user.pk, summary['count'], summary['updated'], catalog_cache.version())
+
+
+async def aorders_etag(user):
+    summary = await Order.objects.filter(user=user).aaggregate(count=Count('pk'), updated=Max('updated_at'))
+    return make_etag('orders', user.pk, summary['count'], summary['updated'], await catalog_cache.aversion())
+
+
+def not_modified(request, etag):
+    """The 304 (or 412) response for `request` if its preconditions say so, else None."""
+    if etag is None:
+        return None
+    response = get_conditional_response(request, etag=etag)
+    if response is not None:
+        response['ETag'] = etag
+    return response
+
+
+def with_etag(response, etag):
+    if etag is not None and response.status_code == 200:
+        response['ETag'] = etag
+    return response
+
+
+class ConditionalGetMixin:
+    """Answer GETs with 304 when If-None-Match matches get_etag(), before the view runs."""
+
+    def get_etag(self, request):
+        return None
+
+    def get(self, request, *args, **kwargs):
+        etag = self.get_etag(request)
+        response = not_modified(request, etag)
+        if response is not None:
+            return response
+        return with_etag(super().get(request, *args, **kwargs), etag)
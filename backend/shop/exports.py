@@ -0,0 +1,80 @@
+"""Streaming order exports (CSV with one row per item, or one JSON object per order).
+
+Orders are read in keyset batches on (created_at, id), which every order
+index ends in, so each batch is one index range scan and only one batch is
+held in memory no matter how many orders match.
+"""
+import csv
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+from .models import OrderItem
+
+ORDER_FIELDS = ['id', 'created_at', 'user_id', 'user__username', 'status', 'subtotal', 'item_count', 'total']
+ITEM_FIELDS = ['id', 'product_id', 'product__name', 'variant_id', 'variant__variant_name', 'quantity', 'price']
+CSV_HEADER = [
+    'order_id', 'created_at', 'user_id', 'username', 'status', 'subtotal', 'item_count', 'total',
+    'item_id', 'product_id', 'product_name', 'variant_id', 'variant_name', 'quantity', 'price',
+]
+
+
+def iter_orders(queryset):
+    """Yield (order, items) dicts for every order in `queryset`, oldest first."""
+    batch_size = getattr(settings, 'ORDER_EXPORT_BATCH_SIZE', 1000)
+    queryset = queryset.order_by('created_at', 'id').values(*ORDER_FIELDS)
+    position = None
+    while True:
+        page = queryset
+        if position is not None:
+            # (created_at, id) > position, phrased as a plain range on created_at
+            page = page.filter(Q(created_at__gte=position[0]) & ~Q(created_at=position[0], id__lte=position[1]))
+        orders = list(page[:batch_size])
+        if not orders:
+            return
+        position = (orders[-1]['created_at'], orders[-1]['id'])
+
+        items = {order['id']: [] for order in orders}
+        for item in (
+            OrderItem.objects.filter(order_id__in=list(items)).order_by('order_id', 'id')
+            .values('order_id', *ITEM_FIELDS)
+        ):
+            items[item.pop('order_id')].append(item)
+        for order in orders:
+            yield order, items[order['id']]
+
+
+class _Echo:
+    """File-like object whose write() hands the line back, for csv.writer."""
+
+    def write(self, value):
+        return value
+
+
+def _csv_value(value):
+    return value.isoformat() if hasattr(value, 'isoformat') else value
+
+
+def csv_lines(queryset):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(CSV_HEADER)
+    for order, items in iter_orders(queryset):
+        head = [_csv_value(order[field]) for field in ORDER_FIELDS]
+        for item in items or [dict.fromkeys(ITEM_FIELDS)]:
+            yield writer.writerow(head + [item[field] for field in ITEM_FIELDS])
+
+
+def ndjson_lines(queryset):
+    for order, items in iter_orders(queryset):
+        order['username'] = order.pop('user__username')
+        order['items'] = [
+            {
+                'id': item['id'], 'product_id': item['product_id'], 'product_name': item['product__name'],
+                'variant_id': item['variant_id'], 'variant_name': item['variant__variant_name'],
+                'quantity': item['quantity'], 'price': item['price'],
+            }
+            for item in items
+        ]
+        yield json.dumps(order, cls=DjangoJSONEncoder) + '\n'
@@ -0,0 +1,82 @@
+"""Sparse fieldsets (?fields=) and opt-in nesting (?expand=) for shop responses.
+
+`fields` is a comma-separated list of the top-level fields to return;
+without it every field is returned. `expand` lists the relations to nest
+(a serializer's Meta.expandable); relations left out of it are returned as
+lists of primary keys, and an empty `expand=` nests nothing. Without it
+every relation is nested, as before. Expanding a relation also includes it.
+
+Views pass the parsed Fieldset to their serializer through the context and
+use it to build their queryset, so relations that are not returned are not
+prefetched, relations returned as keys only fetch keys, and large columns
+nobody asked for are deferred.
+"""
+from rest_framework import serializers
+
+
+def _names(request, param):
+    value = request.query_params.get(param)
+    if value is None:
+        return None
+    return {name.strip() for name in value.split(',') if name.strip()}
+
+
+class Fieldset:
+    def __init__(self, fields=None, expand=None):
+        self.fields = fields
+        self.expand = expand
+
+    @classmethod
+    def from_request(cls, request, serializer_class):
+        fields, expand = _names(request, 'fields'), _names(request, 'expand')
+        errors = {}
+        unknown = sorted((fields or set()) - set(serializer_class.Meta.fields))
+        if unknown:
+            errors['fields'] = [f"Unknown fields: {', '.join(unknown)}."]
+        unknown = sorted((expand or set()) - set(serializer_class.Meta.expandable))
+        if unknown:
+            errors['expand'] = [f"Cannot expand: {', '.join(unknown)}."]
+        if errors:
+            raise serializers.ValidationError(errors)
+        return cls(fields or None, expand)
+
+    def includes(self, name):
+        return self.fields is None or name in self.fields or self.expand is not None and name in self.expand
+
+    def expands(self, name):
+        return self.expand is None or name in self.expand
+
+
+ALL = Fieldset()  # every field, every relation nested
+
+
+class SparseFieldsetMixin:
+    """Serializer side: drop unrequested fields and flatten unexpanded relations.
+
+    Meta.expandable maps each nestable field to a callable returning the
+    field that replaces it when it is not expanded.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        fieldset = self.context.get('fieldset')
+        if fieldset is None:
+            return
+        for name in list(self.fields):
+            if not fieldset.includes(name):
+                self.fields.pop(name)
+        for name, flat_field in self.Meta.expandable.items():
+            if name in self.fields and not fieldset.expands(name):
+                self.fields[name] = flat_field()
+
+
+class FieldsetViewMixin:
+    """View side: parse the fieldset once per request and hand it to the serializer."""
+
+    def get_fieldset(self):
+        if not hasattr(self, '_fieldset'):
+            self._fieldset = Fieldset.from_request(self.request, self.get_serializer_class())
+        return self._fieldset
+
+    def get_serializer_context(self):
+        return {**super().get_serializer_context(), 'fieldset': self.get_fieldset()}
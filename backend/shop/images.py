@@ -0,0 +1,162 @@
+"""Resized derivatives of Category and Product images.
+
+Every original gets one derivative per IMAGE_DERIVATIVE_SIZES entry, each
+fitted into a square of that many pixels and written next to the other
+derivatives under derivatives/<original name>/. Rendering is CPU-bound, so
+it runs in a process pool: uploads are queued to it once their transaction
+commits, and the generate_image_derivatives command covers existing media.
+Each row records what was rendered in `image_derivatives`, including the
+original it was rendered from, so a stale entry is never served.
+"""
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from PIL import Image, ImageOps
+
+from .cache import catalog_cache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SIZES = {'thumb': 160, 'medium': 480, 'large': 1024}
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def derivative_sizes():
+    return getattr(settings, 'IMAGE_DERIVATIVE_SIZES', DEFAULT_SIZES)
+
+
+def derivative_name(name, label):
+    root, _ = os.path.splitext(name)
+    extension = getattr(settings, 'IMAGE_DERIVATIVE_FORMAT', 'WEBP').lower()
+    return f'derivatives/{root}/{label}.{extension}'
+
+
+def render_derivatives(name):
+    """Write every derivative of the stored image `name` and return {label: stored name}.
+
+    Runs in worker processes, so it only touches storage, never the database.
+    """
+    image_format = getattr(settings, 'IMAGE_DERIVATIVE_FORMAT', 'WEBP')
+    quality = getattr(settings, 'IMAGE_DERIVATIVE_QUALITY', 80)
+    with default_storage.open(name, 'rb') as fh:
+        original = ImageOps.exif_transpose(Image.open(fh))
+        original.load()
+    if original.mode not in ('RGB', 'RGBA'):
+        original = original.convert('RGBA' if 'transparency' in original.info or 'A' in original.mode else 'RGB')
+    if image_format == 'JPEG':
+        original = original.convert('RGB')
+
+    derivatives = {'source': name}
+    for label, edge in derivative_sizes().items():
+        image = original.copy()
+        image.thumbnail((edge, edge), Image.LANCZOS)  # never upscales
+        buffer = io.BytesIO()
+        image.save(buffer, image_format, quality=quality)
+        target = derivative_name(name, label)
+        default_storage.delete(target)  # re-rendering keeps the same name
+        derivatives[label] = default_storage.save(target, ContentFile(buffer.getvalue()))
+    return derivatives
+
+
+def _init_worker():
+    # forked workers inherit the configured project; spawned ones start bare
+    if not apps.ready:
+        django.setup()
+
+
+def process_pool(workers=None):
+    return ProcessPoolExecutor(
+        max_workers=workers or getattr(settings, 'IMAGE_DERIVATIVE_WORKERS', None),
+        initializer=_init_worker,
+    )
+
+
+def shared_pool():
+    """The long-lived pool that renders uploads for this process."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = process_pool()
+        return _pool
+
+
+def store_derivatives(model, pk, derivatives):
+    # only if the row still holds the image these were rendered from
+    updated = model.objects.filter(pk=pk, image=derivatives['source']).update(image_derivatives=derivatives)
+    if updated:
+        catalog_cache.invalidate()  # update() sends no signals
+    return updated
+
+
+def _store_rendered(model, pk, future):
+    try:
+        store_derivatives(model, pk, future.result())
+    except Exception:
+        logger.exception("Could not render derivatives for %s %s", model.__name__, pk)
+    finally:
+        connections.close_all()  # this callback thread's connections only
+
+
+def _render_upload(model, pk, name):
+    if not getattr(settings, 'IMAGE_DERIVATIVES_IN_BACKGROUND', True):
+        store_derivatives(model, pk, render_derivatives(name))
+        return
+    future = shared_pool().submit(render_derivatives, name)
+    future.add_done_callback(lambda done: _store_rendered(model, pk, done))
+
+
+def schedule_derivatives(instance):
+    """Queue rendering for a freshly saved row whose image changed since its derivatives were made."""
+    name = instance.image.name if instance.image else ''
+    if (instance.image_derivatives or {}).get('source', '') == name:
+        return
+    model, pk = type(instance), instance.pk
+    if not name:
+        model.objects.filter(pk=pk).update(image_derivatives={})
+        instance.image_derivatives = {}
+        return
+    transaction.on_commit(lambda: _render_upload(model, pk, name))
+
+
+def generate_derivatives(queryset, workers=None, batch_size=100, force=False, progress=None):
+    """Render derivatives for every row of `queryset` with an image, in primary-key batches.
+
+    Rows already rendered from their current image are skipped unless
+    `force` is set. Returns (rendered, failed) counts.
+    """
+    model = queryset.model
+    rows = queryset.exclude(image='').exclude(image__isnull=True).order_by('pk')
+    rendered = failed = 0
+    last_pk = 0
+    with process_pool(workers) as pool:
+        while True:
+            batch = list(rows.filter(pk__gt=last_pk).values_list('pk', 'image', 'image_derivatives')[:batch_size])
+            if not batch:
+                break
+            last_pk = batch[-1][0]
+            pending = {
+                pk: pool.submit(render_derivatives, name)
+                for pk, name, derivatives in batch
+                if force or (derivatives or {}).get('source') != name
+            }
+            for pk, future in pending.items():
+                try:
+                    store_derivatives(model, pk, future.result())
+                    rendered += 1
+                except Exception:
+                    logger.exception("Could not render derivatives for %s %s", model.__name__, pk)
+                    failed += 1
+            if progress:
+                progress(last_pk, rendered, failed)
+    return rendered, failed
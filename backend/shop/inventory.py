@@ -0,0 +1,249 @@
+import random
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import Case, F, Q, Sum, When
+from django.utils import timezone
+from rest_framework import serializers
+
+from .cache import catalog_cache
+from .models import Variant, StockStripe, StockMovement, StockReservation
+
+BATCH_SIZE = 500
+
+
+def _record(deltas, kind, variants):
+    """Append one ledger row per variant; rows for unstriped variants are already applied."""
+    StockMovement.objects.bulk_create([
+        StockMovement(
+            variant_id=pk, kind=kind, quantity=delta,
+            reconciled=not variants[pk].stock_stripes,
+        )
+        for pk, delta in sorted(deltas.items())
+    ])
+
+
+def _take_from_stripes(variant, quantity):
+    # Start at a random stripe so concurrent buyers of a hot variant land on
+    # different rows; each attempt is one guarded UPDATE that takes no lock
+    # beyond the stripe it changes.
+    start = random.randrange(variant.stock_stripes)
+    for offset in range(variant.stock_stripes):
+        stripe = (start + offset) % variant.stock_stripes
+        if StockStripe.objects.filter(
+            variant=variant, stripe=stripe, available__gte=quantity
+        ).update(available=F('available') - quantity):
+            return
+
+    # No single stripe covers the request: drain several, locking them in order.
+    stripes = list(StockStripe.objects.select_for_update().filter(variant=variant).order_by('stripe'))
+    if sum(row.available for row in stripes) < quantity:
+        raise serializers.ValidationError(f"Insufficient stock for: {variant.variant_name}")
+    remaining = quantity
+    for row in stripes:
+        taken = min(row.available, remaining)
+        row.available -= taken
+        remaining -= taken
+    StockStripe.objects.bulk_update(stripes, ['available'])
+
+
+def take_stock(quantities, kind=StockMovement.SALE):
+    """Take {variant_id: quantity} out of sellable stock and return the variants by id.
+
+    Must run inside a transaction. Unstriped rows are locked in primary-key
+    order so two checkouts sharing variants always queue instead of
+    deadlocking, and are decremented by a single UPDATE guarded by
+    stock >= quantity so stock can never go negative even on backends
+    without row locks. Striped (hot) variants are decremented on one of their
+    stripes instead, so their buyers never wait on the variant row.
+    """
+    if not quantities:
+        return {}
+    variant_ids = sorted(quantities)
+    variants = {
+        variant.pk: variant
+        for variant in Variant.objects.select_for_update()
+        .filter(pk__in=variant_ids, stock_stripes=0).order_by('pk')
+    }
+    hot_ids = [pk for pk in variant_ids if pk not in variants]
+    if hot_ids:
+        variants.update(Variant.objects.in_bulk(hot_ids))
+    missing = [pk for pk in variant_ids if pk not in variants]
+    if missing:
+        raise serializers.ValidationError(f"Variants no longer available: {missing}")
+
+    plain_ids = [pk for pk in variant_ids if not variants[pk].stock_stripes]
+    short = [variants[pk].variant_name for pk in plain_ids if variants[pk].stock < quantities[pk]]
+    if short:
+        raise serializers.ValidationError(f"Insufficient stock for: {', '.join(short)}")
+    if plain_ids:
+        updated = Variant.objects.filter(
+            Q(*[Q(pk=pk, stock__gte=quantities[pk]) for pk in plain_ids], _connector=Q.OR)
+        ).update(stock=Case(
+            *[When(pk=pk, then=F('stock') - quantities[pk]) for pk in plain_ids],
+            output_field=models.PositiveIntegerField(),
+        ))
+        if updated != len(plain_ids):
+            raise serializers.ValidationError("Insufficient stock, please try again.")
+        for pk in plain_ids:
+            variants[pk].stock -= quantities[pk]
+
+    for pk in variant_ids:
+        if variants[pk].stock_stripes:
+            _take_from_stripes(variants[pk], quantities[pk])
+
+    _record({pk: -quantity for pk, quantity in quantities.items()}, kind, variants)
+    catalog_cache.invalidate_on_commit()  # update() sends no signals
+    return variants
+
+
+def put_stock(quantities, kind=StockMovement.RESTOCK):
+    """Return {variant_id: quantity} to sellable stock. Increments need no locks."""
+    if not quantities:
+        return
+    variants = Variant.objects.in_bulk(quantities)
+    plain_ids = [pk for pk in quantities if pk in variants and not variants[pk].stock_stripes]
+    if plain_ids:
+        Variant.objects.filter(pk__in=plain_ids).update(stock=Case(
+            *[When(pk=pk, then=F('stock') + quantities[pk]) for pk in plain_ids],
+            output_field=models.PositiveIntegerField(),
+        ))
+    for pk, variant in variants.items():
+        if variant.stock_stripes:
+            # spread evenly: every stripe gets the quotient, the first few one more
+            share, extra = divmod(quantities[pk], variant.stock_stripes)
+            StockStripe.objects.filter(variant=variant).update(available=F('available') + Case(
+                When(stripe__lt=extra, then=share + 1), default=share,
+                output_field=models.PositiveIntegerField(),
+            ))
+    _record({pk: quantities[pk] for pk in variants}, kind, variants)
+    catalog_cache.invalidate_on_commit()
+
+
+@transaction.atomic
+def reserve_stock(user, quantities, ttl=None):
+    """Hold {variant_id: quantity} for `user` until the reservation TTL runs out."""
+    if ttl is None:
+        ttl = getattr(settings, 'INVENTORY_RESERVATION_TTL', 15 * 60)
+    take_stock(quantities, kind=StockMovement.RESERVE)
+    expires_at = timezone.now() + timedelta(seconds=ttl)
+    return StockReservation.objects.bulk_create([
+        StockReservation(variant_id=pk, user=user, quantity=quantity, expires_at=expires_at)
+        for pk, quantity in sorted(quantities.items())
+    ])
+
+
+def _release(reservations):
+    quantities = defaultdict(int)
+    for reservation in reservations:
+        quantities[reservation.variant_id] += reservation.quantity
+    StockReservation.objects.filter(pk__in=[r.pk for r in reservations]).update(status=StockReservation.RELEASED)
+    put_stock(quantities, kind=StockMovement.RELEASE)
+
+
+@transaction.atomic
+def release_reservations(queryset):
+    """Give back the stock of every still-held reservation in `queryset`."""
+    reservations = list(queryset.select_for_update().filter(status=StockReservation.HELD).order_by('pk'))
+    if reservations:
+        _release(reservations)
+    return len(reservations)
+
+
+def release_expired_reservations(now=None, batch_size=BATCH_SIZE):
+    now = now or timezone.now()
+    released = 0
+    while True:
+        with transaction.atomic():
+            batch = list(
+                StockReservation.objects.select_for_update()
+                .filter(status=StockReservation.HELD, expires_at__lte=now).order_by('pk')[:batch_size]
+            )
+            if not batch:
+                return released
+            _release(batch)
+            released += len(batch)
+
+
+def consume_reservations(user, quantities):
+    """Use the user's live holds towards {variant_id: quantity} and return what they covered.
+
+    Must run inside a transaction. Held stock beyond what is needed, and holds
+    that have expired, go back on sale.
+    """
+    held = list(
+        StockReservation.objects.select_for_update()
+        .filter(user=user, status=StockReservation.HELD, variant_id__in=list(quantities)).order_by('pk')
+    )
+    if not held:
+        return {}
+    now = timezone.now()
+    covered = defaultdict(int)
+    surplus = defaultdict(int)
+    consumed = []
+    for reservation in held:
+        needed = quantities[reservation.variant_id] - covered[reservation.variant_id]
+        if reservation.expires_at <= now or needed <= 0:
+            surplus[reservation.variant_id] += reservation.quantity
+            continue
+        used = min(needed, reservation.quantity)
+        covered[reservation.variant_id] += used
+        surplus[reservation.variant_id] += reservation.quantity - used
+        consumed.append(reservation.pk)
+
+    StockReservation.objects.filter(pk__in=consumed).update(status=StockReservation.CONSUMED)
+    StockReservation.objects.filter(
+        pk__in=[r.pk for r in held if r.pk not in consumed]
+    ).update(status=StockReservation.RELEASED)
+    put_stock({pk: quantity for pk, quantity in surplus.items() if quantity}, kind=StockMovement.RELEASE)
+    return dict(covered)
+
+
+def reconcile_inventory(batch_size=BATCH_SIZE):
+    """Fold unreconciled ledger rows into Variant.stock, one batch per transaction."""
+    folded = 0
+    while True:
+        with transaction.atomic():
+            rows = list(
+                StockMovement.objects.select_for_update().filter(reconciled=False)
+                .order_by('pk').values_list('pk', 'variant_id', 'quantity')[:batch_size]
+            )
+            if not rows:
+                return folded
+            deltas = defaultdict(int)
+            for _, variant_id, quantity in rows:
+                deltas[variant_id] += quantity
+            variant_ids = sorted(deltas)
+            list(Variant.objects.select_for_update().filter(pk__in=variant_ids).order_by('pk').values_list('pk'))
+            Variant.objects.filter(pk__in=variant_ids).update(stock=Case(
+                *[When(pk=pk, then=F('stock') + deltas[pk]) for pk in variant_ids],
+                output_field=models.PositiveIntegerField(),
+            ))
+            StockMovement.objects.filter(pk__in=[pk for pk, _, _ in rows]).update(reconciled=True)
+            catalog_cache.invalidate_on_commit()
+            folded += len(rows)
+
+
+@transaction.atomic
+def stripe_variant(variant_id, stripes):
+    """Split a variant's sellable stock across `stripes` rows (0 folds it back onto the variant)."""
+    variant = Variant.objects.select_for_update().get(pk=variant_id)
+    if variant.stock_stripes:
+        # the stripes are the live count; whatever the ledger still owes is in them
+        rows = StockStripe.objects.select_for_update().filter(variant=variant)
+        variant.stock = rows.aggregate(total=Sum('available'))['total'] or 0
+        rows.delete()
+    StockMovement.objects.filter(variant=variant, reconciled=False).update(reconciled=True)
+
+    variant.stock_stripes = stripes
+    variant.save(update_fields=['stock', 'stock_stripes'])
+    if stripes:
+        share, extra = divmod(variant.stock, stripes)
+        StockStripe.objects.bulk_create([
+            StockStripe(variant=variant, stripe=n, available=share + (1 if n < extra else 0))
+            for n in range(stripes)
+        ])
+    catalog_cache.invalidate_on_commit()
+    return variant
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from shop.models import Order
+from shop.order_totals import TOTAL_FIELDS, iter_order_totals, stored_totals
+
+
+class Command(BaseCommand):
+    help = "Store subtotal, item count and total on orders placed before they were recorded."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--start-after', type=int, default=0, help="Resume after this order id.")
+
+    def handle(self, *args, **options):
+        updated = 0
+        for orders, computed in iter_order_totals(batch_size=options['batch_size'], start_after=options['start_after']):
+            changed = []
+            for order in orders:
+                if stored_totals(order) != computed[order.pk]:
+                    order.subtotal, order.item_count, order.total = computed[order.pk]
+                    order.updated_at = timezone.now()  # bulk_update skips auto_now
+                    changed.append(order)
+            Order.objects.bulk_update(changed, TOTAL_FIELDS + ['updated_at'])
+            updated += len(changed)
+            self.stdout.write(f"Processed orders up to id {orders[-1].pk} ({updated} updated)")
+        self.stdout.write(self.style.SUCCESS(f"Backfilled totals on {updated} orders."))
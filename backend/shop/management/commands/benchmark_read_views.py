@@ -0,0 +1,127 @@
+import asyncio
+import importlib
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient, Client, override_settings
+from django.urls import clear_url_caches, reverse
+from rest_framework.authtoken.models import Token
+
+from shop.models import Category
+
+ROUTES = ['category-list', 'products-by-category', 'user-cart', 'user-orders']
+
+
+def reload_urlconf():
+    importlib.reload(importlib.import_module('shop.urls'))
+    importlib.reload(importlib.import_module(settings.ROOT_URLCONF))
+    clear_url_caches()
+
+
+@contextmanager
+def serving(async_routes):
+    """Rebuild the URLconf with `async_routes` served by shop.async_views."""
+    try:
+        with override_settings(SHOP_ASYNC_VIEWS=list(async_routes)):
+            reload_urlconf()
+            yield
+    finally:
+        reload_urlconf()
+
+
+def summarize(latencies, elapsed):
+    latencies = sorted(latencies)
+    return {
+        'requests': len(latencies),
+        'throughput': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(latencies[len(latencies) // 2] * 1000, 2),
+        'p99_ms': round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000, 2),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the sync read views behind the WSGI handler with the async views "
+        "behind the ASGI handler, under the same number of concurrent clients."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500, help="Requests per route and handler.")
+        parser.add_argument('--concurrency', type=int, default=32)
+        parser.add_argument('--routes', nargs='+', choices=ROUTES, default=ROUTES)
+        parser.add_argument('--username', default='bench0', help="User whose cart and orders are read.")
+        parser.add_argument('--json', dest='json_path', help="Also write the results to this file.")
+
+    def handle(self, *args, **options):
+        try:
+            user = get_user_model().objects.get(username=options['username'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f"No user {options['username']!r}; run seed_benchmark_data first.")
+        category = Category.objects.order_by('pk').first()
+        if category is None:
+            raise CommandError("The catalog is empty; run seed_benchmark_data first.")
+        token, _ = Token.objects.get_or_create(user=user)
+        self.headers = {'Authorization': f'Token {token.key}'}
+        self.requests = options['requests']
+        self.concurrency = options['concurrency']
+
+        results = {}
+        # the test clients send Host: testserver, as setup_test_environment() would allow
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            for name in options['routes']:
+                url = reverse(name, kwargs={'category_id': category.pk} if name == 'products-by-category' else None)
+                with serving([]):
+                    wsgi = self.run_wsgi(url)
+                with serving([name]):
+                    asgi = asyncio.run(self.run_asgi(url))
+                results[name] = {'wsgi': wsgi, 'asgi': asgi}
+                self.stdout.write(
+                    f"{name:<22} wsgi {wsgi['throughput']:>8} req/s p99 {wsgi['p99_ms']:>8} ms   "
+                    f"asgi {asgi['throughput']:>8} req/s p99 {asgi['p99_ms']:>8} ms"
+                )
+
+        if options['json_path']:
+            with open(options['json_path'], 'w') as fh:
+                json.dump({'concurrency': self.concurrency, 'routes': results}, fh, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Benchmarked {len(results)} routes at concurrency {self.concurrency}."))
+
+    def run_wsgi(self, url):
+        local = threading.local()
+
+        def fetch(_):
+            if not hasattr(local, 'client'):
+                local.client = Client()
+            started = time.perf_counter()
+            response = local.client.get(url, headers=self.headers)
+            elapsed = time.perf_counter() - started
+            if response.status_code != 200:
+                raise CommandError(f"GET {url} returned {response.status_code} under WSGI.")
+            return elapsed
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(self.concurrency) as pool:
+            latencies = list(pool.map(fetch, range(self.requests)))
+        return summarize(latencies, time.perf_counter() - started)
+
+    async def run_asgi(self, url):
+        client = AsyncClient()
+        slots = asyncio.Semaphore(self.concurrency)
+
+        async def fetch():
+            async with slots:
+                started = time.perf_counter()
+                response = await client.get(url, headers=self.headers)
+                elapsed = time.perf_counter() - started
+            if response.status_code != 200:
+                raise CommandError(f"GET {url} returned {response.status_code} under ASGI.")
+            return elapsed
+
+        started = time.perf_counter()
+        latencies = await asyncio.gather(*[fetch() for _ in range(self.requests)])
+        return summarize(latencies, time.perf_counter() - started)
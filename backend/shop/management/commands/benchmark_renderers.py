@@ -0,0 +1,79 @@
+import io
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from backend.parsers import MessagePackParser, ORJSONParser
+from backend.renderers import MessagePackRenderer, ORJSONRenderer
+from shop.serializers import OrderSerializer, ProductSerializer
+from shop.views import order_queryset, product_queryset
+
+
+def best_of(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return round(min(timings) * 1000, 3)
+
+
+class Command(BaseCommand):
+    help = (
+        "Render and parse serialized products and orders with DRF's JSON renderer and parser, "
+        "the orjson ones and MessagePack, and check the JSON is byte-identical."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=1000, help="Products in the product payload.")
+        parser.add_argument('--orders', type=int, default=1000, help="Orders in the order payload.")
+        parser.add_argument('--repeat', type=int, default=20, help="Runs per encoder; the fastest is reported.")
+        parser.add_argument('--json', dest='json_path', help="Also write the results to this file.")
+
+    def handle(self, *args, **options):
+        payloads = {
+            'products': ProductSerializer(product_queryset()[:options['products']], many=True).data,
+            'orders': OrderSerializer(order_queryset()[:options['orders']], many=True).data,
+        }
+        if not any(payloads.values()):
+            raise CommandError("Nothing to render; run seed_benchmark_data first.")
+
+        codecs = {
+            'json': (JSONRenderer(), JSONParser()),
+            'orjson': (ORJSONRenderer(), ORJSONParser()),
+            'msgpack': (MessagePackRenderer(), MessagePackParser()),
+        }
+
+        results = {}
+        for name, data in payloads.items():
+            expected = JSONRenderer().render(data)
+            if ORJSONRenderer().render(data) != expected:
+                raise CommandError(f"ORJSONRenderer output differs from JSONRenderer for {name}.")
+            results[name] = {'rows': len(data)}
+            for codec, (renderer, parser) in codecs.items():
+                body = renderer.render(data)
+                results[name][codec] = {
+                    'bytes': len(body),
+                    'render_ms': best_of(lambda: renderer.render(data), options['repeat']),
+                    'parse_ms': best_of(lambda: parser.parse(io.BytesIO(body)), options['repeat']),
+                }
+            baseline = results[name]['json']
+            self.stdout.write(f"{name}: {len(data)} rows")
+            for codec, result in results[name].items():
+                if codec == 'rows':
+                    continue
+                self.stdout.write(
+                    f"  {codec:<8} render {result['render_ms']:>9} ms "
+                    f"({baseline['render_ms'] / result['render_ms']:>5.1f}x)   "
+                    f"parse {result['parse_ms']:>9} ms ({baseline['parse_ms'] / result['parse_ms']:>5.1f}x)   "
+                    f"{result['bytes']:>9} bytes"
+                )
+
+        if options['json_path']:
+            with open(options['json_path'], 'w') as fh:
+                json.dump(results, fh, indent=2, sort_keys=True)
+                fh.write('\n')
+        self.stdout.write(self.style.SUCCESS("JSON output is byte-identical to JSONRenderer."))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from shop.order_totals import iter_order_totals, stored_totals
+
+
+class Command(BaseCommand):
+    help = "Verify stored order totals against their items, one batch of orders at a time."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--start-after', type=int, default=0, help="Resume after this order id.")
+
+    def handle(self, *args, **options):
+        checked = mismatched = 0
+        for orders, computed in iter_order_totals(batch_size=options['batch_size'], start_after=options['start_after']):
+            for order in orders:
+                expected = computed[order.pk]
+                if stored_totals(order) != expected:
+                    mismatched += 1
+                    self.stdout.write(
+                        f"Order {order.pk}: stored (subtotal, items, total) = {stored_totals(order)}, "
+                        f"items add up to {expected}"
+                    )
+            checked += len(orders)
+
+        if mismatched:
+            raise CommandError(
+                f"{mismatched} of {checked} orders have stale totals; run backfill_order_totals to fix them."
+            )
+        self.stdout.write(self.style.SUCCESS(f"All {checked} order totals match their items."))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from shop.images import generate_derivatives
+from shop.models import Category, Product
+
+MODELS = {'category': Category, 'product': Product}
+
+
+class Command(BaseCommand):
+    help = "Render resized derivatives of existing category and product images in a process pool."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', choices=sorted(MODELS), action='append', help="Default: both.")
+        parser.add_argument('--workers', type=int, default=None, help="Default: one per CPU.")
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--force', action='store_true', help="Re-render images that already have derivatives.")
+
+    def handle(self, *args, **options):
+        total_failed = 0
+        for name in options['model'] or sorted(MODELS):
+            def progress(last_pk, rendered, failed, name=name):
+                self.stdout.write(f"{name}: up to id {last_pk}, {rendered} rendered, {failed} failed")
+
+            rendered, failed = generate_derivatives(
+                MODELS[name].objects.all(), workers=options['workers'],
+                batch_size=options['batch_size'], force=options['force'], progress=progress,
+            )
+            total_failed += failed
+            self.stdout.write(self.style.SUCCESS(f"Rendered derivatives for {rendered} {name} images."))
+        if total_failed:
+            raise CommandError(f"{total_failed} images could not be rendered; see the log for details.")
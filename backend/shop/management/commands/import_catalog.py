@@ -0,0 +1,70 @@
+import json
+import os
+import time
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+
+from shop.catalog_import import CatalogImport, CatalogImportError, parse_record, read_records
+
+
+class Command(BaseCommand):
+    help = (
+        "Upsert categories, products and variants from a CSV or JSON Lines file, "
+        "one batch per transaction."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help="Default: from the file extension.")
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true', help="Print what would change and write nothing.")
+        parser.add_argument(
+            '--resume', action='store_true',
+            help="Skip the records a previous, interrupted run already committed.",
+        )
+        parser.add_argument('--state-file', help="Where progress is checkpointed. Default: <path>.progress")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('csv' if path.lower().endswith('.csv') else 'jsonl')
+        state_file = options['state_file'] or f'{path}.progress'
+        dry_run = options['dry_run']
+
+        done = 0
+        if options['resume'] and os.path.exists(state_file):
+            with open(state_file) as fh:
+                done = json.load(fh)['records']
+            self.stdout.write(f"Resuming after {done} records.")
+
+        importer = CatalogImport(dry_run=dry_run, report=self.stdout.write if dry_run else None)
+        started = time.monotonic()
+        try:
+            with open(path, newline='', encoding='utf-8') as fh:
+                records = islice(read_records(fh, fmt), done, None)
+                while True:
+                    batch = [parse_record(number, record) for number, record in islice(records, options['batch_size'])]
+                    if not batch:
+                        break
+                    importer.apply(batch)
+                    done += len(batch)
+                    if not dry_run:
+                        self._checkpoint(state_file, done)
+                        rate = done / max(time.monotonic() - started, 1e-6)
+                        self.stdout.write(f"{done} records imported ({rate:.0f}/s): {self._summary(importer)}")
+        except CatalogImportError as exc:
+            raise CommandError(f"{exc}. Fix the file and re-run with --resume to continue after record {done}.")
+
+        if not dry_run and os.path.exists(state_file):
+            os.remove(state_file)
+        verb = "Would apply" if dry_run else "Imported"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {done} records: {self._summary(importer)}."))
+
+    def _checkpoint(self, state_file, records):
+        # write then rename, so a crash never leaves a half-written checkpoint
+        with open(f'{state_file}.tmp', 'w') as fh:
+            json.dump({'records': records}, fh)
+        os.replace(f'{state_file}.tmp', state_file)
+
+    def _summary(self, importer):
+        return ', '.join(f"{count} {name}" for name, count in sorted(importer.counts.items()) if count) or 'no changes'
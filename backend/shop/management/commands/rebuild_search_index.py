@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from shop.search import rebuild_search_index, search_backend
+
+
+class Command(BaseCommand):
+    help = "Rebuild every product's search document and inverted-index terms."
+
+    def handle(self, *args, **options):
+        indexed = rebuild_search_index()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {indexed} products ({search_backend()} backend)."))
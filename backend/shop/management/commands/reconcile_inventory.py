@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from shop.inventory import reconcile_inventory
+
+
+class Command(BaseCommand):
+    help = "Fold unreconciled stock movements into Variant.stock."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        folded = reconcile_inventory(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Reconciled {folded} stock movements."))
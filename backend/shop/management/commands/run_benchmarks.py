@@ -0,0 +1,68 @@
+import json
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+from rest_framework.test import APIClient
+
+from shop.benchmarks import ENDPOINTS, PRESETS, benchmark_fixtures, budget_violations, run_suite, unbenchmarked_routes
+from shop.seed import seed_dataset
+
+
+class Command(BaseCommand):
+    help = (
+        "Time every shop and accounts endpoint against seeded datasets of several sizes "
+        "and fail if any request goes over its query budget. Runs in a throwaway test database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', choices=list(PRESETS), default=['small', 'medium'])
+        parser.add_argument('--repeat', type=int, default=20, help="Requests per endpoint and size.")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--json', dest='json_path', help="Write the results to this file, for diffing.")
+
+    def handle(self, *args, **options):
+        missing = unbenchmarked_routes()
+        if missing:
+            raise CommandError(f"No benchmark for: {', '.join(missing)}. Add them to shop.benchmarks.ENDPOINTS.")
+
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            results = {
+                'database': connection.vendor,
+                'seed': options['seed'],
+                'repeat': options['repeat'],
+                'sizes': {name: self.run_size(name, options) for name in options['sizes']},
+            }
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+
+        if options['json_path']:
+            with open(options['json_path'], 'w') as fh:
+                json.dump(results, fh, indent=2, sort_keys=True)
+                fh.write('\n')
+
+        problems = [
+            f"{size}: {problem}"
+            for size, run in results['sizes'].items() for problem in budget_violations(run['endpoints'])
+        ]
+        if problems:
+            raise CommandError("Over budget:\n  " + '\n  '.join(problems))
+        self.stdout.write(self.style.SUCCESS(
+            f"Benchmarked {len(ENDPOINTS)} requests at {len(results['sizes'])} sizes, all within budget."
+        ))
+
+    def run_size(self, name, options):
+        call_command('flush', interactive=False, verbosity=0)
+        rows = seed_dataset(seed=options['seed'], **PRESETS[name])
+        endpoints = run_suite(APIClient(), benchmark_fixtures(), options['repeat'])
+        self.stdout.write(f"{name}: {', '.join(f'{count} {table}' for table, count in rows.items())}")
+        for label, result in endpoints.items():
+            self.stdout.write(
+                f"  {label:<36} {result['status']:>4} {result['queries']:>3}/{result['budget']:<3} queries "
+                f"{result['median_ms']:>9} ms p50 {result['p95_ms']:>9} ms p95 {result['bytes']:>8} bytes"
+            )
+        return {'rows': rows, 'endpoints': endpoints}
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from shop.seed import DEFAULT_SIZES, seed_dataset
+
+
+class Command(BaseCommand):
+    help = "Seed an empty database with the deterministic benchmark dataset."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0)
+        for name, default in DEFAULT_SIZES.items():
+            parser.add_argument(f"--{name.replace('_', '-')}", type=int, default=default, dest=name)
+
+    def handle(self, *args, **options):
+        sizes = {name: options[name] for name in DEFAULT_SIZES}
+        counts = seed_dataset(seed=options['seed'], **sizes)
+        summary = ', '.join(f'{count} {name}' for name, count in counts.items())
+        self.stdout.write(self.style.SUCCESS(f"Seeded {summary}."))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from shop.inventory import stripe_variant
+from shop.models import Variant
+
+
+class Command(BaseCommand):
+    help = "Spread a hot variant's stock across N counter rows (0 puts it back on the variant)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('variant_id', type=int)
+        parser.add_argument('stripes', type=int)
+
+    def handle(self, *args, **options):
+        if not 0 <= options['stripes'] <= 64:
+            raise CommandError("stripes must be between 0 and 64")
+        try:
+            variant = stripe_variant(options['variant_id'], options['stripes'])
+        except Variant.DoesNotExist:
+            raise CommandError(f"Variant {options['variant_id']} does not exist")
+        self.stdout.write(self.style.SUCCESS(
+            f"{variant} now uses {variant.stock_stripes} stripes for {variant.stock} units."
+        ))
@@ -0,0 +1,71 @@
+# Generated by Django 5.2.5 on 2026-10-18 17:53
+
+import django.core.validators
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_rating_summaries(apps, schema_editor):
+    Product = apps.get_model('shop', 'Product')
+    Review = apps.get_model('shop', 'Review')
+    summaries = {}
+    rows = Review.objects.values_list('product_id', 'rating').annotate(n=Count('id')).order_by()
+    for product_id, rating, n in rows:
+        summary = summaries.setdefault(product_id, {'rating_count': 0, 'rating_sum': 0})
+        summary['rating_count'] += n
+        summary['rating_sum'] += rating * n
+        if 1 <= rating <= 5:
+            summary[f'rating_{rating}_count'] = n
+    for product_id, summary in summaries.items():
+        Product.objects.filter(pk=product_id).update(**summary)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0007_orderitem_variant'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='rating_1_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_2_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_3_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_4_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_5_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='review',
+            name='rating',
+            field=models.PositiveSmallIntegerField(validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(5)]),
+        ),
+        migrations.RunPython(backfill_rating_summaries, migrations.RunPython.noop),
+    ]
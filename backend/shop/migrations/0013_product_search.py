@@ -0,0 +1,101 @@
+# Generated by Django 5.2.5 on 2026-10-18 18:04
+
+import re
+from collections import Counter
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+# A frozen copy of shop.search as it was when this migration was written, so
+# later changes to the live indexer cannot change what this backfill does.
+FIELD_WEIGHTS = {'name': 8, 'category': 4, 'variant': 2, 'description': 1}
+STOP_WORDS = {'a', 'an', 'and', 'for', 'in', 'of', 'on', 'or', 'the', 'to', 'with'}
+TERM_MAX_LENGTH = 64
+BATCH_SIZE = 500
+
+
+def tokenize(text):
+    return [
+        word[:TERM_MAX_LENGTH]
+        for word in re.findall(r'\w+', (text or '').lower())
+        if len(word) > 1 and word not in STOP_WORDS
+    ]
+
+
+def backfill_search_index(apps, schema_editor):
+    Product = apps.get_model('shop', 'Product')
+    ProductSearchTerm = apps.get_model('shop', 'ProductSearchTerm')
+    backend = getattr(settings, 'PRODUCT_SEARCH_BACKEND', 'auto')
+    if backend == 'auto':
+        backend = 'fulltext' if schema_editor.connection.vendor == 'mysql' else 'inverted'
+
+    product_ids = list(Product.objects.order_by('pk').values_list('pk', flat=True))
+    for start in range(0, len(product_ids), BATCH_SIZE):
+        products = list(
+            Product.objects.filter(pk__in=product_ids[start:start + BATCH_SIZE])
+            .select_related('category').prefetch_related('variants')
+        )
+        terms = []
+        for product in products:
+            fields = {
+                'name': product.name,
+                'category': product.category.name,
+                'variant': ' '.join(variant.variant_name for variant in product.variants.all()),
+                'description': product.description,
+            }
+            product.search_document = ' '.join(text for text in fields.values() if text)
+            if backend == 'inverted':
+                weights = Counter()
+                for field, text in fields.items():
+                    for word in tokenize(text):
+                        weights[word] += FIELD_WEIGHTS[field]
+                terms.extend(
+                    ProductSearchTerm(term=word, product=product, weight=weight)
+                    for word, weight in weights.items()
+                )
+        Product.objects.bulk_update(products, ['search_document'])
+        ProductSearchTerm.objects.bulk_create(terms, batch_size=BATCH_SIZE)
+
+
+def add_fulltext_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'mysql':
+        schema_editor.execute(
+            'ALTER TABLE shop_product ADD FULLTEXT INDEX product_search_document_ft (search_document)'
+        )
+
+
+def drop_fulltext_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'mysql':
+        schema_editor.execute('ALTER TABLE shop_product DROP INDEX product_search_document_ft')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0012_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='search_document',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.CreateModel(
+            name='ProductSearchTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=64)),
+                ('weight', models.PositiveIntegerField()),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_terms', to='shop.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['term', 'product', 'weight'], name='search_term_covering_idx')],
+            },
+        ),
+        # fill the documents before MySQL builds the FULLTEXT index over them
+        migrations.RunPython(backfill_search_index, migrations.RunPython.noop),
+        migrations.RunPython(add_fulltext_index, drop_fulltext_index),
+    ]
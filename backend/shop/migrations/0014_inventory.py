@@ -0,0 +1,62 @@
+# Generated by Django 5.2.5 on 2026-10-18 18:07
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0013_product_search'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='variant',
+            name='stock_stripes',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='StockMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('sale', 'Sale'), ('reserve', 'Reserve'), ('release', 'Release'), ('restock', 'Restock'), ('adjust', 'Adjust')], max_length=10)),
+                ('quantity', models.IntegerField()),
+                ('reconciled', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('variant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_movements', to='shop.variant')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['reconciled', 'variant'], name='movement_unreconciled_idx'), models.Index(fields=['variant', 'created_at'], name='movement_variant_created_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='StockReservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField()),
+                ('status', models.CharField(choices=[('held', 'Held'), ('consumed', 'Consumed'), ('released', 'Released')], default='held', max_length=10)),
+                ('expires_at', models.DateTimeField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_reservations', to=settings.AUTH_USER_MODEL)),
+                ('variant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='shop.variant')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'status'], name='reservation_user_status_idx'), models.Index(fields=['status', 'expires_at'], name='reservation_expiry_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='StockStripe',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stripe', models.PositiveSmallIntegerField()),
+                ('available', models.PositiveIntegerField(default=0)),
+                ('variant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_stripe_rows', to='shop.variant')),
+            ],
+            options={
+                'unique_together': {('variant', 'stripe')},
+            },
+        ),
+    ]
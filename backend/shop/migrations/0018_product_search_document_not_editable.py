@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 19:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0017_product_rating_not_editable'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='product',
+            name='search_document',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+    ]
@@ -1,11 +1,18 @@
+from decimal import Decimal
+
 from django.db import models
 from django.contrib.auth.models import User
 from django.conf import settings
-from django.db.models import F, Sum, DecimalField, ExpressionWrapper
+from django.core.validators import MinValueValidator, MaxValueValidator
+from django.db.models import F, Sum, DecimalField, ExpressionWrapper, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 
 class Category(models.Model):
     name = models.CharField(max_length=255, unique=True)
     image = models.ImageField(upload_to='category_images/', blank=True, null=True)
+    # resized copies of `image`, written by shop.images: {'source': ..., '<size>': ...}
+    image_derivatives = models.JSONField(default=dict, blank=True, editable=False)
 
     def __str__(self):
         return self.name
@@ -16,46 +23,212 @@ class Product(models.Model):
     name = models.CharField(max_length=255)
     description = models.TextField(blank=True)
     image = models.ImageField(upload_to='product_images/', blank=True, null=True)  # single image field for now
+    image_derivatives = models.JSONField(default=dict, blank=True, editable=False)  # see shop.images
     price = models.DecimalField(max_digits=10, decimal_places=2, default=0.0)
 
+    # Rating summary, kept in step with Review rows by shop.signals so that
+    # catalog listings never have to read the review table.
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    rating_1_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_2_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_3_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_4_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_5_count = models.PositiveIntegerField(default=0, editable=False)
+
+    # Name, category, variant names and description in one column, rebuilt by
+    # shop.search on every change; MySQL serves search from a FULLTEXT index on it.
+    search_document = models.TextField(blank=True, default='', editable=False)
+
+    RATING_FIELDS = ['rating_count', 'rating_sum'] + [f'rating_{stars}_count' for stars in range(1, 6)]
+    # Only ever written by F() updates and rebuilds, so a full save() of a
+    # loaded row leaves them alone instead of writing back stale values.
+    MAINTAINED_FIELDS = RATING_FIELDS + ['search_document']
+
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            skipped = set(self.MAINTAINED_FIELDS) | self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in skipped and field.attname not in skipped
+            ]
+        super().save(*args, **kwargs)
+
+    @property
+    def rating_average(self):
+        if not self.rating_count:
+            return None
+        return round(self.rating_sum / self.rating_count, 2)
+
+    @property
+    def rating_histogram(self):
+        return {str(stars): getattr(self, f'rating_{stars}_count') for stars in range(1, 6)}
+
 class Variant(models.Model):
     product = models.ForeignKey(Product, related_name='variants', on_delete=models.CASCADE)
     variant_name = models.CharField(max_length=255)  # e.g., "Size M", "Color Red"
     price = models.DecimalField(max_digits=10, decimal_places=2)
     stock = models.PositiveIntegerField(default=0)
+    # 0 = stock is decremented on this row; N > 0 = sellable stock is split
+    # across N StockStripe rows and this row is refreshed by reconciliation.
+    stock_stripes = models.PositiveSmallIntegerField(default=0)
 
     def __str__(self):
         return f"{self.product.name} - {self.variant_name}"
+
+
+class StockStripe(models.Model):
+    """One slice of a hot variant's sellable stock; checkouts spread across slices."""
+    variant = models.ForeignKey(Variant, related_name='stock_stripe_rows', on_delete=models.CASCADE)
+    stripe = models.PositiveSmallIntegerField()
+    available = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('variant', 'stripe')
+
+    def __str__(self):
+        return f"{self.variant} stripe {self.stripe}: {self.available}"
+
+
+class StockMovement(models.Model):
+    """Append-only ledger of every change to a variant's sellable stock."""
+    SALE = 'sale'
+    RESERVE = 'reserve'
+    RELEASE = 'release'
+    RESTOCK = 'restock'
+    ADJUST = 'adjust'
+    KIND_CHOICES = [
+        (SALE, 'Sale'),
+        (RESERVE, 'Reserve'),
+        (RELEASE, 'Release'),
+        (RESTOCK, 'Restock'),
+        (ADJUST, 'Adjust'),
+    ]
+
+    variant = models.ForeignKey(Variant, related_name='stock_movements', on_delete=models.CASCADE)
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    quantity = models.IntegerField()  # signed: negative takes stock out
+    # False until reconcile_inventory has folded the movement into Variant.stock;
+    # movements on unstriped variants are applied to the row as they happen.
+    reconciled = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['reconciled', 'variant'], name='movement_unreconciled_idx'),
+            models.Index(fields=['variant', 'created_at'], name='movement_variant_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.quantity:+d} of {self.variant_id}"
+
+
+class StockReservation(models.Model):
+    """Stock held for a shopper between checkout start and order placement."""
+    HELD = 'held'
+    CONSUMED = 'consumed'
+    RELEASED = 'released'
+    STATUS_CHOICES = [
+        (HELD, 'Held'),
+        (CONSUMED, 'Consumed'),
+        (RELEASED, 'Released'),
+    ]
+
+    variant = models.ForeignKey(Variant, related_name='reservations', on_delete=models.CASCADE)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='stock_reservations', on_delete=models.CASCADE)
+    quantity = models.PositiveIntegerField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=HELD)
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'status'], name='reservation_user_status_idx'),
+            models.Index(fields=['status', 'expires_at'], name='reservation_expiry_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity} x {self.variant_id} for {self.user} ({self.status})"
 class Review(models.Model):
     product = models.ForeignKey(Product, related_name='reviews', on_delete=models.CASCADE)
     user = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='reviews', on_delete=models.CASCADE)
-    rating = models.PositiveSmallIntegerField()  # e.g., 1 to 5 stars
+    rating = models.PositiveSmallIntegerField(
+        validators=[MinValueValidator(1), MaxValueValidator(5)]
+    )  # 1 to 5 stars
     comment = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # per-product reviews: WHERE product_id = ? ORDER BY created_at DESC
+            models.Index(fields=['product', 'created_at'], name='review_product_created_idx'),
+        ]
+
     def __str__(self):
         return f"Review for {self.product.name} by {self.user}"
 
 
+class ProductSearchTerm(models.Model):
+    """Inverted index entry used for product search where FULLTEXT is unavailable."""
+    term = models.CharField(max_length=64)
+    product = models.ForeignKey(Product, related_name='search_terms', on_delete=models.CASCADE)
+    weight = models.PositiveIntegerField()
+
+    class Meta:
+        indexes = [
+            # WHERE term IN (...) GROUP BY product_id, SUM(weight), straight from the index
+            models.Index(fields=['term', 'product', 'weight'], name='search_term_covering_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.term} -> {self.product_id} ({self.weight})"
+
+
+def cart_line_total():
+    # A variant's price overrides its product's price, as at checkout.
+    return ExpressionWrapper(
+        F('quantity') * Coalesce(F('variant__price'), F('product__price')),
+        output_field=DecimalField(max_digits=12, decimal_places=2),
+    )
+
+
 class Cart(models.Model):
     user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
+    # moved by touch() whenever the lines change; the cart's ETag is built from it
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"Cart of {self.user}"
+
+    @classmethod
+    def touch(cls, user):
+        """Record a change to `user`'s cart lines. CartItem writes do not move updated_at themselves."""
+        cls.objects.filter(user=user).update(updated_at=timezone.now())
     
     def total_price(self):
-        total = self.items.annotate(
-            item_total=ExpressionWrapper(
-                F('quantity') * F('product__price'),
-                output_field=DecimalField(max_digits=12, decimal_places=2)
-            )
-        ).aggregate(cart_total=Sum('item_total'))['cart_total'] or 0
+        if hasattr(self, 'items_total'):
+            return self.items_total or 0
+        total = self.items.annotate(item_total=cart_line_total()).aggregate(
+            cart_total=Sum('item_total')
+        )['cart_total'] or 0
         return total
 
+    @staticmethod
+    def with_total(queryset):
+        """Annotate carts with `items_total` so total_price() needs no query of its own."""
+        totals = (
+            CartItem.objects.filter(cart=OuterRef('pk')).values('cart')
+            .annotate(total=Sum(cart_line_total())).values('total')
+        )
+        return queryset.annotate(items_total=Coalesce(
+            Subquery(totals, output_field=DecimalField(max_digits=12, decimal_places=2)), Value(Decimal('0'))
+        ))
+
+
 class CartItem(models.Model):
     cart = models.ForeignKey(Cart, related_name='items', on_delete=models.CASCADE)
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
@@ -85,14 +258,46 @@ class Order(models.Model):
         ('Delivered', 'Delivered'),
         ('Canceled', 'Canceled'),
     ]
+    # Statuses an order may move to from each status.
+    STATUS_TRANSITIONS = {
+        'Pending': ['Confirmed', 'Canceled'],
+        'Confirmed': ['Shipped', 'Canceled'],
+        'Shipped': ['Delivered'],
+        'Delivered': [],
+        'Canceled': [],
+    }
 
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)  # set it too in QuerySet.update()s
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='Pending')
 
+    # Stored when the order is placed so reads never re-sum the items;
+    # see the backfill_order_totals and check_order_totals commands.
+    subtotal = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    item_count = models.PositiveIntegerField(default=0)  # units, not lines
+    total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        indexes = [
+            # order history: WHERE user_id = ? ORDER BY created_at DESC
+            models.Index(fields=['user', 'created_at'], name='order_user_created_idx'),
+            # order history ETag: MAX(updated_at), COUNT(*) WHERE user_id = ?
+            models.Index(fields=['user', 'updated_at'], name='order_user_updated_idx'),
+            # admin/fulfilment: WHERE status = ? ORDER BY created_at DESC
+            models.Index(fields=['status', 'created_at'], name='order_status_created_idx'),
+            # unfiltered admin list and date-range exports: ORDER BY created_at DESC
+            models.Index(fields=['created_at'], name='order_created_idx'),
+        ]
+
     def __str__(self):
         return f"Order {self.id} by {self.user}"
 
+    def set_totals(self, items):
+        self.subtotal = sum((item.price * item.quantity for item in items), Decimal('0'))
+        self.item_count = sum(item.quantity for item in items)
+        self.total = self.subtotal
+
 
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, related_name='items', on_delete=models.CASCADE)
@@ -0,0 +1,44 @@
+from decimal import Decimal
+
+from django.db.models import DecimalField, ExpressionWrapper, F, Sum
+
+from .models import Order, OrderItem
+
+TOTAL_FIELDS = ['subtotal', 'item_count', 'total']
+
+
+def iter_order_totals(queryset=None, batch_size=1000, start_after=0):
+    """Yield (orders, computed) for successive primary-key ranges of orders.
+
+    `computed` maps each order id to the (subtotal, item_count, total) its
+    items add up to. Only one batch of orders is held in memory at a time.
+    """
+    queryset = (queryset if queryset is not None else Order.objects.all()).order_by('pk').only('pk', *TOTAL_FIELDS)
+    last_pk = start_after
+    while True:
+        orders = list(queryset.filter(pk__gt=last_pk)[:batch_size])
+        if not orders:
+            return
+        last_pk = orders[-1].pk
+
+        sums = (
+            OrderItem.objects.filter(order_id__in=[order.pk for order in orders])
+            .values('order_id')
+            .annotate(
+                subtotal=Sum(ExpressionWrapper(
+                    F('price') * F('quantity'),
+                    output_field=DecimalField(max_digits=12, decimal_places=2),
+                )),
+                item_count=Sum('quantity'),
+            )
+            .order_by()
+        )
+        computed = {order.pk: (Decimal('0.00'), 0, Decimal('0.00')) for order in orders}
+        for row in sums:
+            subtotal = row['subtotal'].quantize(Decimal('0.01'))
+            computed[row['order_id']] = (subtotal, row['item_count'], subtotal)
+        yield orders, computed
+
+
+def stored_totals(order):
+    return (order.subtotal, order.item_count, order.total)
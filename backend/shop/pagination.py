@@ -0,0 +1,114 @@
+from rest_framework.pagination import CursorPagination, LimitOffsetPagination, _reverse_ordering
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class AsyncCursorPagination(CursorPagination):
+    """CursorPagination that can also page a queryset from an async view.
+
+    apaginate_queryset() follows CursorPagination.paginate_queryset step for
+    step, so cursors and links are interchangeable between the sync and async
+    routes; only the page query goes through the async ORM.
+    """
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+
+        self.cursor = self.decode_cursor(request)
+        if self.cursor is None:
+            (offset, reverse, current_position) = (0, False, None)
+        else:
+            (offset, reverse, current_position) = self.cursor
+
+        if reverse:
+            queryset = queryset.order_by(*_reverse_ordering(self.ordering))
+        else:
+            queryset = queryset.order_by(*self.ordering)
+
+        if current_position is not None:
+            order = self.ordering[0]
+            order_attr = order.lstrip('-')
+            if self.cursor.reverse != order.startswith('-'):
+                queryset = queryset.filter(**{order_attr + '__lt': current_position})
+            else:
+                queryset = queryset.filter(**{order_attr + '__gt': current_position})
+
+        results = [obj async for obj in queryset[offset:offset + self.page_size + 1]]
+        self.page = results[:self.page_size]
+
+        if len(results) > len(self.page):
+            has_following_position = True
+            following_position = self._get_position_from_instance(results[-1], self.ordering)
+        else:
+            has_following_position = False
+            following_position = None
+
+        if reverse:
+            self.page = list(reversed(self.page))
+            self.has_next = (current_position is not None) or (offset > 0)
+            self.has_previous = has_following_position
+            if self.has_next:
+                self.next_position = current_position
+            if self.has_previous:
+                self.previous_position = following_position
+        else:
+            self.has_next = has_following_position
+            self.has_previous = (current_position is not None) or (offset > 0)
+            if self.has_next:
+                self.next_position = following_position
+            if self.has_previous:
+                self.previous_position = current_position
+        return self.page
+
+    def get_paginated_data(self, data):
+        return {'next': self.get_next_link(), 'previous': self.get_previous_link(), 'results': data}
+
+
+class ProductCursorPagination(AsyncCursorPagination):
+    # Keyset pagination on the primary key: every page is a single indexed
+    # range scan no matter how deep the client has scrolled.
+    ordering = 'id'
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+
+class ReviewCursorPagination(CursorPagination):
+    ordering = '-created_at'
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class OrderCursorPagination(AsyncCursorPagination):
+    ordering = ('-created_at', '-id')
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class SearchPagination(LimitOffsetPagination):
+    """Offset paging over ranked results that never runs COUNT(*) over every match."""
+
+    default_limit = 20
+    max_limit = 100
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.limit = self.get_limit(request)
+        self.offset = self.get_offset(request)
+        rows = list(queryset[self.offset:self.offset + self.limit + 1])
+        self.has_next = len(rows) > self.limit
+        return rows[:self.limit]
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = replace_query_param(self.request.build_absolute_uri(), self.limit_query_param, self.limit)
+        return replace_query_param(url, self.offset_query_param, self.offset + self.limit)
+
+    def get_paginated_response(self, data):
+        return Response({'next': self.get_next_link(), 'previous': self.get_previous_link(), 'results': data})
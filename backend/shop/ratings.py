@@ -0,0 +1,54 @@
+from django.db.models import Count, F
+
+from .cache import catalog_cache
+from .models import Product, Review
+
+RATING_FIELDS = Product.RATING_FIELDS
+
+
+def apply_rating(product_id, rating, sign):
+    """Add (sign=1) or retract (sign=-1) one review's rating from its product's summary."""
+    changes = {
+        'rating_count': F('rating_count') + sign,
+        'rating_sum': F('rating_sum') + sign * rating,
+    }
+    if 1 <= rating <= 5:
+        field = f'rating_{rating}_count'
+        changes[field] = F(field) + sign
+    Product.objects.filter(pk=product_id).update(**changes)
+
+
+def rebuild_rating_summaries(queryset=None, batch_size=1000):
+    """Recompute rating summaries from the review table, one batch of products at a time.
+
+    Used after writes that bypass model signals (bulk_create, raw SQL, fixtures).
+    """
+    queryset = (queryset if queryset is not None else Product.objects.all()).order_by('pk').only(*RATING_FIELDS)
+    updated = 0
+    last_pk = 0
+    while True:
+        products = list(queryset.filter(pk__gt=last_pk)[:batch_size])
+        if not products:
+            catalog_cache.invalidate()
+            return updated
+        last_pk = products[-1].pk
+
+        counts = (
+            Review.objects.filter(product_id__in=[product.pk for product in products])
+            .values_list('product_id', 'rating')
+            .annotate(n=Count('id'))
+        )
+        for product in products:
+            for field in RATING_FIELDS:
+                setattr(product, field, 0)
+        by_pk = {product.pk: product for product in products}
+        for product_id, rating, n in counts:
+            product = by_pk[product_id]
+            product.rating_count += n
+            product.rating_sum += rating * n
+            if 1 <= rating <= 5:
+                field = f'rating_{rating}_count'
+                setattr(product, field, getattr(product, field) + n)
+
+        Product.objects.bulk_update(products, RATING_FIELDS)
+        updated += len(products)
@@ -0,0 +1,99 @@
+import re
+from collections import Counter
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import FloatField, Sum
+from django.db.models.expressions import RawSQL
+
+from .models import Product, ProductSearchTerm
+
+# How much one occurrence of a word counts, by where it appears.
+FIELD_WEIGHTS = {'name': 8, 'category': 4, 'variant': 2, 'description': 1}
+STOP_WORDS = {'a', 'an', 'and', 'for', 'in', 'of', 'on', 'or', 'the', 'to', 'with'}
+TERM_MAX_LENGTH = 64
+MAX_QUERY_TERMS = 10
+BATCH_SIZE = 500
+
+
+def tokenize(text):
+    return [
+        word[:TERM_MAX_LENGTH]
+        for word in re.findall(r'\w+', (text or '').lower())
+        if len(word) > 1 and word not in STOP_WORDS
+    ]
+
+
+def search_backend():
+    """'fulltext' on MySQL unless PRODUCT_SEARCH_BACKEND forces 'inverted'."""
+    configured = getattr(settings, 'PRODUCT_SEARCH_BACKEND', 'auto')
+    if configured == 'auto':
+        return 'fulltext' if connection.vendor == 'mysql' else 'inverted'
+    return configured
+
+
+def _fields(product):
+    return {
+        'name': product.name,
+        'category': product.category.name,
+        'variant': ' '.join(variant.variant_name for variant in product.variants.all()),
+        'description': product.description,
+    }
+
+
+def index_products(product_ids):
+    """Rebuild the search document and index terms of the given products."""
+    product_ids = list(product_ids)
+    use_terms = search_backend() == 'inverted'
+    for start in range(0, len(product_ids), BATCH_SIZE):
+        batch = product_ids[start:start + BATCH_SIZE]
+        products = list(
+            Product.objects.filter(pk__in=batch).select_related('category').prefetch_related('variants')
+        )
+        terms = []
+        for product in products:
+            fields = _fields(product)
+            product.search_document = ' '.join(text for text in fields.values() if text)
+            if use_terms:
+                weights = Counter()
+                for field, text in fields.items():
+                    for word in tokenize(text):
+                        weights[word] += FIELD_WEIGHTS[field]
+                terms.extend(
+                    ProductSearchTerm(term=word, product=product, weight=weight)
+                    for word, weight in weights.items()
+                )
+        with transaction.atomic():
+            Product.objects.bulk_update(products, ['search_document'])
+            if use_terms:
+                ProductSearchTerm.objects.filter(product_id__in=batch).delete()
+                ProductSearchTerm.objects.bulk_create(terms, batch_size=BATCH_SIZE)
+
+
+def rebuild_search_index(queryset=None):
+    queryset = queryset if queryset is not None else Product.objects.all()
+    product_ids = list(queryset.order_by('pk').values_list('pk', flat=True))
+    index_products(product_ids)
+    return len(product_ids)
+
+
+def ranked_product_ids(query):
+    """Queryset of (product_id, score) pairs, best match first."""
+    terms = list(dict.fromkeys(tokenize(query)))[:MAX_QUERY_TERMS]
+    if not terms:
+        return None
+    if search_backend() == 'fulltext':
+        score = RawSQL(
+            'MATCH (search_document) AGAINST (%s IN NATURAL LANGUAGE MODE)',
+            (' '.join(terms),),
+            output_field=FloatField(),
+        )
+        return (
+            Product.objects.annotate(score=score).filter(score__gt=0)
+            .order_by('-score', 'pk').values_list('pk', 'score')
+        )
+    return (
+        ProductSearchTerm.objects.filter(term__in=terms)
+        .values('product_id').annotate(score=Sum('weight'))
+        .order_by('-score', 'product_id').values_list('product_id', 'score')
+    )
@@ -0,0 +1,144 @@
+import random
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+from django.db.models import Max
+
+from accounts.models import Address
+from .cache import catalog_cache
+from .models import Category, Product, Variant, Review, Cart, CartItem, Order, OrderItem
+from .ratings import rebuild_rating_summaries
+from .search import rebuild_search_index
+
+DEFAULT_SIZES = {
+    'users': 50,
+    'addresses_per_user': 2,
+    'categories': 10,
+    'products_per_category': 100,
+    'variants_per_product': 3,
+    'reviews_per_product': 5,
+    'cart_items_per_user': 4,
+    'orders_per_user': 20,
+    'items_per_order': 3,
+}
+
+SEED_PASSWORD = 'benchmark'
+EPOCH = datetime(2025, 1, 1, tzinfo=timezone.utc)
+BATCH_SIZE = 1000
+
+
+def _insert(model, objects):
+    """bulk_create that hands back saved rows with primary keys on every backend."""
+    if connection.features.can_return_rows_from_bulk_insert:
+        return model.objects.bulk_create(objects, batch_size=BATCH_SIZE)
+    # MySQL does not return ids from multi-row inserts; on a database nobody
+    # else is writing to, the new rows are the ones past the previous maximum.
+    last_pk = model.objects.aggregate(last=Max('pk'))['last'] or 0
+    model.objects.bulk_create(objects, batch_size=BATCH_SIZE)
+    return list(model.objects.filter(pk__gt=last_pk).order_by('pk'))
+
+
+@transaction.atomic
+def seed_dataset(seed=0, **sizes):
+    """Fill an empty database with a deterministic catalog, carts and order history.
+
+    The same seed and sizes always produce the same rows, so benchmark and
+    query-plan results can be compared between commits. Rows are written with
+    bulk_create; summaries that signals would normally maintain (ratings,
+    order totals) are computed here instead. Returns the row counts.
+    """
+    sizes = {**DEFAULT_SIZES, **sizes}
+    rng = random.Random(seed)
+    User = get_user_model()
+
+    password = make_password(SEED_PASSWORD)  # hash once, not once per user
+    users = _insert(User, [
+        User(username=f'bench{i}', email=f'bench{i}@example.com', password=password)
+        for i in range(sizes['users'])
+    ])
+    Address.objects.bulk_create(
+        [
+            Address(
+                user=user, full_name=user.username, phone=f'555{i:07d}', street_address=f'{i} Main St',
+                city=rng.choice(['Austin', 'Boston', 'Chennai', 'Denver']), state='ST',
+                postal_code=f'{rng.randrange(10000, 99999)}', country='US', default=(n == 0),
+            )
+            for i, user in enumerate(users) for n in range(sizes['addresses_per_user'])
+        ],
+        batch_size=BATCH_SIZE,
+    )
+
+    categories = _insert(Category, [Category(name=f'Category {i}') for i in range(sizes['categories'])])
+    products = _insert(Product, [
+        Product(
+            category=category, name=f'{category.name} product {i}',
+            description=f'Description of product {i} in {category.name}',
+            price=Decimal(rng.randrange(100, 50000)) / 100,
+        )
+        for category in categories for i in range(sizes['products_per_category'])
+    ])
+    variants = _insert(Variant, [
+        Variant(
+            product=product, variant_name=f'Option {i}',
+            price=product.price + i, stock=rng.randrange(0, 500),
+        )
+        for product in products for i in range(sizes['variants_per_product'])
+    ])
+    rebuild_search_index()
+    Review.objects.bulk_create(
+        [
+            Review(product=product, user=rng.choice(users), rating=rng.randint(1, 5), comment='Seeded review')
+            for product in products for _ in range(sizes['reviews_per_product'])
+        ],
+        batch_size=BATCH_SIZE,
+    )
+    rebuild_rating_summaries()
+
+    carts = _insert(Cart, [Cart(user=user) for user in users])
+    cart_items = []
+    for cart in carts:
+        for variant in rng.sample(variants, min(sizes['cart_items_per_user'], len(variants))):
+            cart_items.append(CartItem(cart=cart, product_id=variant.product_id, variant=variant, quantity=rng.randint(1, 3)))
+    CartItem.objects.bulk_create(cart_items, batch_size=BATCH_SIZE)
+
+    statuses = [value for value, _ in Order.STATUS_CHOICES]
+    orders, lines_per_order = [], []
+    for user in users:
+        for _ in range(sizes['orders_per_user']):
+            order = Order(user=user, status=rng.choice(statuses))
+            lines = []
+            for _ in range(sizes['items_per_order']):
+                variant = rng.choice(variants)
+                lines.append(OrderItem(
+                    product_id=variant.product_id, variant=variant,
+                    quantity=rng.randint(1, 4), price=variant.price,
+                ))
+            order.set_totals(lines)
+            orders.append(order)
+            lines_per_order.append(lines)
+    orders = _insert(Order, orders)
+    # auto_now_add stamps every row with "now"; spread history over a year instead
+    for order in orders:
+        order.created_at = EPOCH + timedelta(minutes=rng.randrange(365 * 24 * 60))
+    Order.objects.bulk_update(orders, ['created_at'], batch_size=BATCH_SIZE)
+    order_items = []
+    for order, lines in zip(orders, lines_per_order):
+        for line in lines:
+            line.order = order
+            order_items.append(line)
+    OrderItem.objects.bulk_create(order_items, batch_size=BATCH_SIZE)
+
+    catalog_cache.invalidate()
+    return {
+        'users': len(users),
+        'categories': len(categories),
+        'products': len(products),
+        'variants': len(variants),
+        'reviews': len(products) * sizes['reviews_per_product'],
+        'cart_items': len(cart_items),
+        'orders': len(orders),
+        'order_items': len(order_items),
+    }
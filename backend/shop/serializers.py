@@ -1,10 +1,42 @@
+from collections import defaultdict
+
+from django.db import transaction
 from rest_framework import serializers
+from .fieldsets import SparseFieldsetMixin
+from .images import derivative_sizes
+from .inventory import consume_reservations, take_stock
 from .models import Category, Product, Variant, Review, Cart, CartItem, Order, OrderItem
 
+class ImageDerivativesField(serializers.Field):
+    """URLs of the original image and of each derivative size.
+
+    Sizes not rendered yet (or rendered from an older upload) fall back to
+    the original, so clients can always ask for the size they need.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(source='*', read_only=True, **kwargs)
+
+    def to_representation(self, obj):
+        if not obj.image:
+            return None
+        derivatives = obj.image_derivatives or {}
+        current = derivatives.get('source') == obj.image.name
+        urls = {'original': obj.image.url}
+        for label in derivative_sizes():
+            urls[label] = obj.image.storage.url(derivatives[label]) if current and label in derivatives else urls['original']
+        request = self.context.get('request')
+        if request is not None:
+            urls = {label: request.build_absolute_uri(url) for label, url in urls.items()}
+        return urls
+
+
 class CategorySerializer(serializers.ModelSerializer):
+    images = ImageDerivativesField()
+
     class Meta:
         model = Category
-        fields = ['id', 'name', 'image']
+        fields = ['id', 'name', 'image', 'images']
 
 class VariantSerializer(serializers.ModelSerializer):
     class Meta:
@@ -18,14 +50,22 @@ class ReviewSerializer(serializers.ModelSerializer):
         model = Review
         fields = ['id', 'user', 'rating', 'comment', 'created_at']
 
-class ProductSerializer(serializers.ModelSerializer):
+class RatingSummarySerializer(serializers.Serializer):
+    count = serializers.IntegerField(source='rating_count')
+    average = serializers.FloatField(source='rating_average', allow_null=True)
+    histogram = serializers.DictField(source='rating_histogram', child=serializers.IntegerField())
+
+
+class ProductSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     variants = VariantSerializer(many=True, read_only=True)
-    reviews = ReviewSerializer(many=True, read_only=True)
+    rating = RatingSummarySerializer(source='*', read_only=True)
     category_name = serializers.CharField(source='category.name', read_only=True)
+    images = ImageDerivativesField()
 
     class Meta:
         model = Product
-        fields = ['id', 'category', 'category_name', 'name', 'description', 'image', 'price', 'variants', 'reviews']
+        fields = ['id', 'category', 'category_name', 'name', 'description', 'image', 'images', 'price', 'variants', 'rating']
+        expandable = {'variants': lambda: serializers.PrimaryKeyRelatedField(many=True, read_only=True)}
 
 class CartItemSerializer(serializers.ModelSerializer):
     product_name = serializers.CharField(source='product.name', read_only=True)
@@ -44,11 +84,7 @@ class CartSerializer(serializers.ModelSerializer):
         fields = ['id', 'user', 'items', 'total_price']
 
     def get_total_price(self, obj):
-        total = 0
-        for item in obj.items.all():
-            price = item.variant.price if item.variant else item.product.price
-            total += price * item.quantity
-        return total
+        return obj.total_price()
 
 class AddCartItemSerializer(serializers.Serializer):
     product = serializers.PrimaryKeyRelatedField(queryset=Product.objects.all())
@@ -58,7 +94,7 @@ class AddCartItemSerializer(serializers.Serializer):
     def validate(self, data):
         product = data['product']
         variant = data.get('variant')
-        if variant and variant.product != product:
+        if variant and variant.product_id != product.id:
             raise serializers.ValidationError("Variant does not belong to the specified product.")
         return data
 
@@ -67,7 +103,75 @@ class AddCartItemSerializer(serializers.Serializer):
             raise serializers.ValidationError("Quantity must be at least 1.")
         return value
 
-from rest_framework import serializers
+
+class CartOperationSerializer(serializers.Serializer):
+    OPERATIONS = ['add', 'set', 'remove']
+
+    op = serializers.ChoiceField(choices=OPERATIONS)
+    product = serializers.IntegerField(min_value=1)
+    variant = serializers.IntegerField(min_value=1, allow_null=True, required=False)
+    quantity = serializers.IntegerField(min_value=0, required=False)
+
+    def validate(self, data):
+        op = data['op']
+        quantity = data.get('quantity')
+        if op == 'add' and not quantity:
+            raise serializers.ValidationError("'add' needs a quantity of at least 1.")
+        if op == 'set' and quantity is None:
+            raise serializers.ValidationError("'set' needs a quantity (0 removes the line).")
+        return data
+
+
+class CartBatchSerializer(serializers.Serializer):
+    operations = CartOperationSerializer(many=True, allow_empty=False)
+
+    def validate(self, data):
+        resolve_product_lines(data['operations'])
+        return data
+
+    def apply(self, cart):
+        """Apply the operations in order and write the net result in bulk.
+
+        Must run inside a transaction.
+        """
+        # Locking the lines makes concurrent single-line increments wait for us.
+        existing = {
+            (item.product_id, item.variant_id): item
+            for item in CartItem.objects.select_for_update().filter(cart=cart)
+        }
+        quantities = {key: item.quantity for key, item in existing.items()}
+        for operation in self.validated_data['operations']:
+            variant = operation['variant']
+            key = (operation['product'].id, variant.id if variant else None)
+            if operation['op'] == 'add':
+                quantities[key] = quantities.get(key, 0) + operation['quantity']
+            elif operation['op'] == 'set':
+                quantities[key] = operation['quantity']
+            else:
+                quantities[key] = 0
+
+        to_create, to_update, to_delete = [], [], []
+        for key, quantity in quantities.items():
+            item = existing.get(key)
+            if item is None:
+                if quantity:
+                    to_create.append(CartItem(cart=cart, product_id=key[0], variant_id=key[1], quantity=quantity))
+            elif not quantity:
+                to_delete.append(item.pk)
+            elif quantity != item.quantity:
+                item.quantity = quantity
+                to_update.append(item)
+
+        if to_create:
+            CartItem.objects.bulk_create(to_create)
+        if to_update:
+            CartItem.objects.bulk_update(to_update, ['quantity'])
+        if to_delete:
+            CartItem.objects.filter(pk__in=to_delete).delete()
+        if to_create or to_update or to_delete:
+            Cart.touch(cart.user_id)
+        return cart
+
 
 class OrderItemSerializer(serializers.ModelSerializer):
     product_name = serializers.CharField(source='product.name', read_only=True)
@@ -84,43 +188,124 @@ class OrderItemSerializer(serializers.ModelSerializer):
             return variant.variant_name
         return None
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     items = OrderItemSerializer(many=True, read_only=True)
     total_cost = serializers.SerializerMethodField()
     class Meta:
         model = Order
-        fields = ['id', 'user', 'created_at', 'status', 'items','total_cost']
+        fields = ['id', 'user', 'created_at', 'status', 'items', 'subtotal', 'item_count', 'total_cost']
+        # status only moves through the admin update_status/bulk_status transitions
+        read_only_fields = ['status', 'subtotal', 'item_count']
+        expandable = {'items': lambda: serializers.PrimaryKeyRelatedField(many=True, read_only=True)}
     def get_total_cost(self, obj):
-        total = 0
-        for item in obj.items.all():
-            total += item.price * item.quantity
-        return total
+        return obj.total
+
+class OrderFilterSerializer(serializers.Serializer):
+    """Optional query-string filters for order listings."""
+
+    status = serializers.ChoiceField(choices=Order.STATUS_CHOICES, required=False)
+    created_after = serializers.DateTimeField(required=False)
+    created_before = serializers.DateTimeField(required=False)
+
+    def filter(self, queryset):
+        params = self.validated_data
+        if 'status' in params:
+            queryset = queryset.filter(status=params['status'])
+        if 'created_after' in params:
+            queryset = queryset.filter(created_at__gte=params['created_after'])
+        if 'created_before' in params:
+            queryset = queryset.filter(created_at__lt=params['created_before'])
+        return queryset
+
+
+class AdminOrderFilterSerializer(OrderFilterSerializer):
+    user = serializers.IntegerField(min_value=1, required=False)
+
+    def filter(self, queryset):
+        queryset = super().filter(queryset)
+        if 'user' in self.validated_data:
+            queryset = queryset.filter(user_id=self.validated_data['user'])
+        return queryset
+
+
+class OrderExportSerializer(AdminOrderFilterSerializer):
+    output = serializers.ChoiceField(choices=['csv', 'ndjson'], default='csv')
+
+
+class OrderBulkStatusSerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.IntegerField(min_value=1), allow_empty=False, max_length=10000)
+    status = serializers.ChoiceField(choices=Order.STATUS_CHOICES)
+
 
 class PlaceOrderSerializer(serializers.Serializer):
     # No input fields; order created from user's cart
 
+    @transaction.atomic
     def create(self, validated_data):
         user = self.context['request'].user
-        cart = Cart.objects.filter(user=user).first()
-        if not cart or not cart.items.exists():
+        # Locking the cart stops two simultaneous checkouts ordering it twice.
+        cart = Cart.objects.select_for_update().filter(user=user).first()
+        items = list(cart.items.select_related('product', 'variant')) if cart else []
+        if not items:
             raise serializers.ValidationError("Cart is empty")
 
-        order = Order.objects.create(user=user)
-        for item in cart.items.all():
-            price = item.variant.price if item.variant else item.product.price
-            OrderItem.objects.create(
+        quantities = defaultdict(int)
+        for item in items:
+            if item.variant_id:
+                quantities[item.variant_id] += item.quantity
+        # Stock held at checkout start (cart/reserve/) is used first.
+        covered = consume_reservations(user, quantities)
+        take_stock({pk: quantity - covered.get(pk, 0) for pk, quantity in quantities.items() if quantity > covered.get(pk, 0)})
+
+        order = Order(user=user)
+        lines = [
+            OrderItem(
                 order=order,
                 product=item.product,
-                variant=item.variant,
+                variant_id=item.variant_id,
                 quantity=item.quantity,
-                price=price
+                price=item.variant.price if item.variant_id else item.product.price,
             )
-        cart.items.all().delete()  # Clear cart after order placed
+            for item in items
+        ]
+        order.set_totals(lines)
+        order.save()
+        OrderItem.objects.bulk_create(lines)
+        CartItem.objects.filter(pk__in=[item.pk for item in items]).delete()  # Clear cart after order placed
+        Cart.touch(user)
         return order
 
+def resolve_product_lines(lines):
+    """Swap the product/variant ids in each line for model instances, in place.
+
+    Every referenced row is loaded with one query per model, and variant
+    ownership is checked in memory.
+    """
+    product_ids = {line['product'] for line in lines}
+    variant_ids = {line['variant'] for line in lines if line.get('variant')}
+    products = Product.objects.in_bulk(product_ids)
+    variants = Variant.objects.in_bulk(variant_ids)
+
+    missing_products = sorted(product_ids - set(products))
+    if missing_products:
+        raise serializers.ValidationError(f"Invalid product ids: {missing_products}")
+    missing_variants = sorted(variant_ids - set(variants))
+    if missing_variants:
+        raise serializers.ValidationError(f"Invalid variant ids: {missing_variants}")
+
+    for line in lines:
+        line['product'] = products[line['product']]
+        variant = line['variant'] = variants.get(line.get('variant'))
+        if variant and variant.product_id != line['product'].id:
+            raise serializers.ValidationError("Variant does not belong to the specified product.")
+    return lines
+
+
 class OrderItemInputSerializer(serializers.Serializer):
-    product = serializers.PrimaryKeyRelatedField(queryset=Product.objects.all())
-    variant = serializers.PrimaryKeyRelatedField(queryset=Variant.objects.all(), allow_null=True, required=False)
+    # Plain ids; DirectPlaceOrderSerializer resolves every line in one batch
+    # instead of a PrimaryKeyRelatedField query per product and variant.
+    product = serializers.IntegerField(min_value=1)
+    variant = serializers.IntegerField(min_value=1, allow_null=True, required=False)
     quantity = serializers.IntegerField(min_value=1)
 
     class Meta:
@@ -131,27 +316,42 @@ class DirectPlaceOrderSerializer(serializers.Serializer):
     items = OrderItemInputSerializer(many=True)
 
     def validate(self, data):
-        # Optional: Validate that variant belongs to product
-        for item in data['items']:
-            variant = item.get('variant')
-            product = item['product']
-            if variant and variant.product.id != product.id:
-                raise serializers.ValidationError("Variant does not belong to the specified product.")
+        resolve_product_lines(data['items'])
         return data
 
+    @transaction.atomic
     def create(self, validated_data):
         user = self.context['request'].user
-        order = Order.objects.create(user=user)
-        for item in validated_data['items']:
-            product = item['product']
-            variant = item.get('variant')
-            quantity = item['quantity']
-            price = variant.price if variant else product.price
-            OrderItem.objects.create(
+        items = validated_data['items']
+
+        quantities = defaultdict(int)
+        for item in items:
+            if item['variant']:
+                quantities[item['variant'].id] += item['quantity']
+        take_stock(quantities)
+
+        order = Order(user=user)
+        lines = [
+            OrderItem(
                 order=order,
-                product=product,
-                variant=variant,
-                quantity=quantity,
-                price=price
+                product=item['product'],
+                variant=item['variant'],
+                quantity=item['quantity'],
+                price=item['variant'].price if item['variant'] else item['product'].price,
             )
+            for item in items
+        ]
+        order.set_totals(lines)
+        order.save()
+        self._lines = OrderItem.objects.bulk_create(lines)
         return order
+
+    def to_representation(self, instance):
+        # Echo the lines just inserted rather than reading them back per row.
+        lines = getattr(self, '_lines', None)
+        if lines is None:
+            lines = instance.items.all()
+        return {'items': [
+            {'product': line.product_id, 'variant': line.variant_id, 'quantity': line.quantity}
+            for line in lines
+        ]}
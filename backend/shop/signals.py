@@ -0,0 +1,98 @@
+from django.conf import settings
+from django.db.models.signals import pre_delete, pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from .cache import catalog_cache
+from .images import schedule_derivatives
+from .models import Category, Product, Variant, Review
+from .ratings import apply_rating, rebuild_rating_summaries
+from .search import index_products
+
+
+@receiver(pre_save, sender=Review)
+def remember_previous_rating(sender, instance, raw=False, **kwargs):
+    instance._previous_rating = None
+    if raw or instance.pk is None:
+        return
+    instance._previous_rating = (
+        Review.objects.filter(pk=instance.pk).values_list('product_id', 'rating').first()
+    )
+
+
+@receiver(post_save, sender=Review)
+def update_rating_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_previous_rating', None)
+    current = (instance.product_id, instance.rating)
+    if previous == current:
+        return
+    if previous is not None:
+        apply_rating(*previous, sign=-1)
+    apply_rating(*current, sign=1)
+
+
+@receiver(post_delete, sender=Review)
+def update_rating_on_delete(sender, instance, origin=None, **kwargs):
+    # Only reviews deleted in their own right: when a product goes its
+    # summary goes with it, and a deleted user's products are rebuilt once
+    # below rather than updated once per review.
+    deleting_reviews = isinstance(origin, Review) or getattr(origin, 'model', None) is Review
+    if origin is None or deleting_reviews:
+        apply_rating(instance.product_id, instance.rating, sign=-1)
+
+
+@receiver(pre_delete, sender=settings.AUTH_USER_MODEL)
+def remember_reviewed_products(sender, instance, **kwargs):
+    instance._reviewed_product_ids = list(
+        Review.objects.filter(user=instance).values_list('product_id', flat=True).distinct()
+    )
+
+
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def rebuild_reviewed_products(sender, instance, **kwargs):
+    product_ids = getattr(instance, '_reviewed_product_ids', None)
+    if product_ids:
+        rebuild_rating_summaries(Product.objects.filter(pk__in=product_ids))
+
+
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=Product)
+@receiver([post_save, post_delete], sender=Variant)
+@receiver([post_save, post_delete], sender=Review)
+def invalidate_catalog_cache(sender, **kwargs):
+    catalog_cache.invalidate_on_commit()
+
+
+@receiver(post_save, sender=Product)
+def index_saved_product(sender, instance, raw=False, **kwargs):
+    if not raw:
+        index_products([instance.pk])
+
+
+@receiver(post_save, sender=Variant)
+def index_saved_variant_product(sender, instance, raw=False, **kwargs):
+    if not raw:
+        index_products([instance.product_id])
+
+
+@receiver(post_delete, sender=Variant)
+def index_deleted_variant_product(sender, instance, origin=None, **kwargs):
+    # When the product itself is being deleted the cascade reaches its
+    # variants first; re-indexing then would re-create rows for a doomed product.
+    deleting_variants = isinstance(origin, Variant) or getattr(origin, 'model', None) is Variant
+    if deleting_variants:
+        index_products([instance.product_id])
+
+
+@receiver(post_save, sender=Category)
+def index_category_products(sender, instance, created=False, raw=False, **kwargs):
+    if not created and not raw:
+        index_products(instance.products.values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Product)
+def render_uploaded_image(sender, instance, raw=False, **kwargs):
+    if not raw:
+        schedule_derivatives(instance)
@@ -1,3 +1,1743 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import uuid
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from io import StringIO
 
-# Create your tests here.
+import msgpack
+from django.contrib.auth import get_user_model
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.forms import modelform_factory
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.db import transaction
+from django.test import TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from rest_framework.authtoken.models import Token
+from PIL import Image
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient, APITestCase
+
+from backend.metrics import MetricsMiddleware, install_query_timer, metrics
+from backend.parsers import MessagePackParser, ORJSONParser
+from backend.renderers import MessagePackRenderer, ORJSONRenderer
+
+from . import async_views
+from .benchmarks import PRESETS, benchmark_fixtures, budget_violations, run_suite, unbenchmarked_routes
+from .cache import catalog_cache
+from .inventory import (
+    put_stock, reconcile_inventory, release_expired_reservations, release_reservations, reserve_stock,
+    stripe_variant, take_stock,
+)
+from .models import (
+    Category, Product, Variant, Review, Cart, CartItem, Order, OrderItem,
+    StockMovement, StockReservation, StockStripe,
+)
+from .ratings import rebuild_rating_summaries
+from .management.commands.benchmark_read_views import ROUTES, serving
+from .seed import seed_dataset
+from .serializers import ProductSerializer
+
+
+class ProductsByCategoryViewTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.user = User.objects.create_user(username='shopper', email='shopper@example.com', password='pass1234')
+        reviewer = User.objects.create_user(username='reviewer', email='reviewer@example.com', password='pass1234')
+        cls.category = Category.objects.create(name='Shoes')
+        other = Category.objects.create(name='Hats')
+        Product.objects.create(category=other, name='Cap', price=5)
+
+        products = Product.objects.bulk_create(
+            Product(category=cls.category, name=f'Shoe {i}', price=10 + i) for i in range(30)
+        )
+        Variant.objects.bulk_create(
+            Variant(product=product, variant_name=f'Size {size}', price=product.price, stock=5)
+            for product in products for size in (40, 41, 42)
+        )
+        Review.objects.bulk_create(
+            Review(product=product, user=reviewer, rating=4, comment='ok')
+            for product in products for _ in range(2)
+        )
+        rebuild_rating_summaries()
+
+    def setUp(self):
+        catalog_cache.clear()
+        self.client.force_authenticate(self.user)
+        self.url = reverse('products-by-category', kwargs={'category_id': self.category.id})
+
+    def test_query_count_does_not_grow_with_page_size(self):
+        # one query for the page (category joined in), one for variants
+        for page_size in (1, 10, 30):
+            with self.assertNumQueries(2):
+                response = self.client.get(self.url, {'page_size': page_size})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.data['results']), page_size)
+
+    def test_cursor_walks_every_product_once(self):
+        seen = []
+        url = self.url + '?page_size=7'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            seen.extend(row['id'] for row in response.data['results'])
+            url = response.data['next']
+        expected = list(Product.objects.filter(category=self.category).order_by('id').values_list('id', flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_rows_carry_nested_relations(self):
+        response = self.client.get(self.url, {'page_size': 1})
+        row = response.data['results'][0]
+        self.assertEqual(row['category_name'], 'Shoes')
+        self.assertEqual(len(row['variants']), 3)
+        self.assertNotIn('reviews', row)
+        self.assertEqual(row['rating'], {
+            'count': 2,
+            'average': 4.0,
+            'histogram': {'1': 0, '2': 0, '3': 0, '4': 2, '5': 0},
+        })
+
+
+class RatingSummaryTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.users = [
+            User.objects.create_user(username=f'user{i}', email=f'user{i}@example.com', password='pass1234')
+            for i in range(3)
+        ]
+        category = Category.objects.create(name='Books')
+        cls.product = Product.objects.create(category=category, name='Novel', price=12)
+        cls.other = Product.objects.create(category=category, name='Atlas', price=30)
+
+    def summary(self, product):
+        product.refresh_from_db()
+        return product.rating_count, product.rating_sum, product.rating_histogram
+
+    def test_create_edit_and_delete_keep_summary_in_step(self):
+        first = Review.objects.create(product=self.product, user=self.users[0], rating=5)
+        Review.objects.create(product=self.product, user=self.users[1], rating=3)
+        self.assertEqual(self.summary(self.product), (2, 8, {'1': 0, '2': 0, '3': 1, '4': 0, '5': 1}))
+        self.assertEqual(self.product.rating_average, 4.0)
+
+        first.rating = 1
+        first.save()
+        self.assertEqual(self.summary(self.product), (2, 4, {'1': 1, '2': 0, '3': 1, '4': 0, '5': 0}))
+
+        first.comment = 'changed my mind'
+        first.save()
+        self.assertEqual(self.summary(self.product)[:2], (2, 4))
+
+        first.product = self.other
+        first.save()
+        self.assertEqual(self.summary(self.product), (1, 3, {'1': 0, '2': 0, '3': 1, '4': 0, '5': 0}))
+        self.assertEqual(self.summary(self.other), (1, 1, {'1': 1, '2': 0, '3': 0, '4': 0, '5': 0}))
+
+        first.delete()
+        self.assertEqual(self.summary(self.other), (0, 0, {'1': 0, '2': 0, '3': 0, '4': 0, '5': 0}))
+        self.assertIsNone(self.other.rating_average)
+
+    def test_cascades_do_not_update_once_per_review(self):
+        for user in self.users:
+            Review.objects.create(product=self.product, user=user, rating=5)
+            Review.objects.create(product=self.other, user=user, rating=2)
+
+        with CaptureQueriesContext(connection) as captured:
+            self.users[0].delete()
+        updates = [query['sql'] for query in captured if query['sql'].startswith('UPDATE "shop_product"')]
+        self.assertEqual(len(updates), 1)  # one rebuild of both products
+        self.assertEqual(self.summary(self.product)[:2], (2, 10))
+        self.assertEqual(self.summary(self.other)[:2], (2, 4))
+
+        with CaptureQueriesContext(connection) as captured:
+            self.product.delete()
+        self.assertFalse([query for query in captured if query['sql'].startswith('UPDATE "shop_product"')])
+
+    def test_saving_a_loaded_product_keeps_newer_counts(self):
+        product = Product.objects.get(pk=self.product.pk)
+        Review.objects.create(product=self.product, user=self.users[0], rating=4)
+        product.name = 'Novella'
+        product.save()
+        self.assertEqual(self.summary(self.product)[:2], (1, 4))
+        self.assertEqual(self.product.name, 'Novella')
+
+        form_fields = modelform_factory(Product, fields='__all__').base_fields
+        self.assertFalse(set(Product.MAINTAINED_FIELDS) & set(form_fields))
+
+    def test_rebuild_matches_incremental_summary(self):
+        for user, rating in zip(self.users, (2, 4, 4)):
+            Review.objects.create(product=self.product, user=user, rating=rating)
+        expected = self.summary(self.product)
+        Product.objects.filter(pk=self.product.pk).update(rating_count=0, rating_sum=0, rating_4_count=0)
+        rebuild_rating_summaries()
+        self.assertEqual(self.summary(self.product), expected)
+
+
+class ProductReviewsListViewTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.user = User.objects.create_user(username='reader', email='reader@example.com', password='pass1234')
+        category = Category.objects.create(name='Games')
+        cls.product = Product.objects.create(category=category, name='Chess', price=20)
+        for i in range(5):
+            author = User.objects.create_user(username=f'author{i}', email=f'author{i}@example.com', password='pass1234')
+            Review.objects.create(product=cls.product, user=author, rating=i + 1, comment=f'review {i}')
+
+    def test_reviews_are_paginated_newest_first(self):
+        self.client.force_authenticate(self.user)
+        url = reverse('product-reviews', kwargs={'product_id': self.product.id})
+        with self.assertNumQueries(1):
+            response = self.client.get(url, {'page_size': 3})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['comment'] for row in response.data['results']], ['review 4', 'review 3', 'review 2'])
+        self.assertEqual(response.data['results'][0]['user'], 'author4')
+        self.assertIsNotNone(response.data['next'])
+
+
+class CatalogCacheTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.user = User.objects.create_user(username='browser', email='browser@example.com', password='pass1234')
+        cls.category = Category.objects.create(name='Garden')
+        cls.product = Product.objects.create(category=cls.category, name='Rake', price=15)
+        cls.variant = Variant.objects.create(product=cls.product, variant_name='Small', price=15, stock=3)
+
+    def setUp(self):
+        catalog_cache.clear()
+        self.client.force_authenticate(self.user)
+        self.products_url = reverse('products-by-category', kwargs={'category_id': self.category.id})
+
+    def test_repeat_reads_are_served_from_memory(self):
+        self.client.get(reverse('category-list'))
+        self.client.get(self.products_url)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(reverse('category-list')).status_code, 200)
+            response = self.client.get(self.products_url)
+        self.assertEqual(response.data['results'][0]['name'], 'Rake')
+        self.assertEqual(catalog_cache.stats(), {'hits': 2, 'misses': 2, 'evictions': 0, 'invalidations': 0})
+
+    def test_query_string_is_part_of_the_key(self):
+        self.client.get(self.products_url)
+        with self.assertNumQueries(2):
+            self.client.get(self.products_url, {'page_size': 1})
+
+    def test_catalog_writes_invalidate_cached_pages(self):
+        writes = [
+            lambda: Category.objects.create(name='Tools'),
+            lambda: Product.objects.filter(pk=self.product.pk).first().save(),
+            lambda: Variant.objects.create(product=self.product, variant_name='Large', price=18, stock=1),
+            lambda: Review.objects.create(product=self.product, user=self.user, rating=5),
+            lambda: Variant.objects.get(variant_name='Large').delete(),
+        ]
+        for write in writes:
+            self.client.get(self.products_url)
+            write()
+            with self.assertNumQueries(2):
+                self.client.get(self.products_url)
+        response = self.client.get(self.products_url)
+        self.assertEqual(response.data['results'][0]['rating']['count'], 1)
+
+    def test_dropped_entries_count_as_evictions(self):
+        self.client.get(self.products_url)
+        catalog_cache.backend.delete(catalog_cache.make_key('products', 'http://testserver' + self.products_url))
+        self.client.get(self.products_url)
+        self.assertEqual(catalog_cache.stats()['evictions'], 1)
+
+    def test_stats_endpoint_is_admin_only(self):
+        url = reverse('catalog-cache-stats')
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.data), {'hits', 'misses', 'evictions', 'invalidations'})
+
+
+class PlaceOrderTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.user = User.objects.create_user(username='buyer', email='buyer@example.com', password='pass1234')
+        category = Category.objects.create(name='Kitchen')
+        cls.products = Product.objects.bulk_create(
+            Product(category=category, name=f'Pan {i}', price=20 + i) for i in range(12)
+        )
+        cls.variants = Variant.objects.bulk_create(
+            Variant(product=product, variant_name=f'{product.name} large', price=product.price + 5, stock=10)
+            for product in cls.products
+        )
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+        self.cart = Cart.objects.create(user=self.user)
+
+    def fill_cart(self, lines, quantity=2):
+        CartItem.objects.bulk_create(
+            CartItem(cart=self.cart, product=self.products[i], variant=self.variants[i], quantity=quantity)
+            for i in range(lines)
+        )
+
+    def place(self):
+        return self.client.post(reverse('place-order'))
+
+    def test_query_count_is_constant_in_cart_size(self):
+        # savepoint, cart lock, items, reservations, variant lock, stock update, ledger,
+        # order, items insert, cart clear, cart touch, release
+        for lines in (1, 10):
+            self.fill_cart(lines)
+            with self.assertNumQueries(12):
+                self.assertEqual(self.place().status_code, 201)
+
+    def test_places_order_decrements_stock_and_clears_cart(self):
+        self.fill_cart(2, quantity=3)
+        CartItem.objects.create(cart=self.cart, product=self.products[5], quantity=1)
+        self.assertEqual(self.place().status_code, 201)
+
+        order = Order.objects.get(user=self.user)
+        prices = sorted((item.product_id, item.variant_id, item.quantity, item.price) for item in order.items.all())
+        self.assertEqual(prices, sorted([
+            (self.products[0].id, self.variants[0].id, 3, self.variants[0].price),
+            (self.products[1].id, self.variants[1].id, 3, self.variants[1].price),
+            (self.products[5].id, None, 1, self.products[5].price),
+        ]))
+        self.assertEqual(list(Variant.objects.filter(pk__in=[self.variants[0].pk, self.variants[1].pk]).values_list('stock', flat=True)), [7, 7])
+        self.assertFalse(CartItem.objects.filter(cart=self.cart).exists())
+
+        expected = 3 * self.variants[0].price + 3 * self.variants[1].price + self.products[5].price
+        self.assertEqual((order.subtotal, order.item_count, order.total), (expected, 7, expected))
+
+    def test_placed_order_invalidates_cached_stock(self):
+        url = reverse('products-by-category', kwargs={'category_id': self.products[0].category_id})
+        self.assertEqual(self.client.get(url).data['results'][0]['variants'][0]['stock'], 10)
+        self.fill_cart(1, quantity=4)
+        self.assertEqual(self.place().status_code, 201)
+        self.assertEqual(self.client.get(url).data['results'][0]['variants'][0]['stock'], 6)
+
+    def test_insufficient_stock_rolls_back_everything(self):
+        self.fill_cart(2, quantity=4)
+        CartItem.objects.filter(variant=self.variants[1]).update(quantity=11)
+        response = self.place()
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(self.variants[1].variant_name, str(response.data))
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(Variant.objects.get(pk=self.variants[0].pk).stock, 10)
+        self.assertEqual(CartItem.objects.filter(cart=self.cart).count(), 2)
+
+    def test_empty_cart_is_rejected(self):
+        self.assertEqual(self.place().status_code, 400)
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class ConcurrentCheckoutTests(TransactionTestCase):
+    def test_concurrent_checkouts_never_oversell(self):
+        User = get_user_model()
+        category = Category.objects.create(name='Flash sale')
+        product = Product.objects.create(category=category, name='Console', price=300)
+        variant = Variant.objects.create(product=product, variant_name='Limited', price=250, stock=3)
+        buyers = []
+        for i in range(8):
+            buyer = User.objects.create_user(username=f'racer{i}', email=f'racer{i}@example.com', password='pass1234')
+            cart = Cart.objects.create(user=buyer)
+            CartItem.objects.create(cart=cart, product=product, variant=variant, quantity=1)
+            buyers.append(buyer)
+
+        barrier = threading.Barrier(len(buyers))
+        statuses = []
+
+        def checkout(buyer):
+            client = APIClient()
+            client.force_authenticate(buyer)
+            try:
+                barrier.wait()
+                statuses.append(client.post(reverse('place-order')).status_code)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=checkout, args=(buyer,)) for buyer in buyers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(statuses), [201] * 3 + [400] * 5)
+        self.assertEqual(Variant.objects.get(pk=variant.pk).stock, 0)
+        self.assertEqual(OrderItem.objects.filter(variant=variant).count(), 3)
+
+
+class DirectPlaceOrderTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.user = User.objects.create_user(username='direct', email='direct@example.com', password='pass1234')
+        category = Category.objects.create(name='Office')
+        cls.products = Product.objects.bulk_create(
+            Product(category=category, name=f'Desk {i}', price=100 + i) for i in range(40)
+        )
+        cls.variants = Variant.objects.bulk_create(
+            Variant(product=product, variant_name=f'{product.name} oak', price=product.price + 50, stock=100)
+            for product in cls.products
+        )
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+        self.url = reverse('direct-place-order')
+
+    def lines(self, count):
+        return [
+            {'product': self.products[i].id, 'variant': self.variants[i].id if i % 2 else None, 'quantity': 2}
+            for i in range(count)
+        ]
+
+    def test_query_count_is_constant_in_line_count(self):
+        # products, variants, savepoint, variant lock, stock update, ledger, order, items insert, release
+        for count in (2, 40):
+            with self.assertNumQueries(9):
+                response = self.client.post(self.url, {'items': self.lines(count)}, format='json')
+            self.assertEqual(response.status_code, 201)
+            self.assertEqual(len(response.data['items']), count)
+
+    def test_order_lines_use_variant_or_product_price(self):
+        self.client.post(self.url, {'items': self.lines(2)}, format='json')
+        order = Order.objects.get(user=self.user)
+        rows = sorted(order.items.values_list('product_id', 'variant_id', 'price'))
+        self.assertEqual(rows, [
+            (self.products[0].id, None, self.products[0].price),
+            (self.products[1].id, self.variants[1].id, self.variants[1].price),
+        ])
+        self.assertEqual(Variant.objects.get(pk=self.variants[1].pk).stock, 98)
+        self.assertEqual(order.item_count, 4)
+        self.assertEqual(order.total, 2 * self.products[0].price + 2 * self.variants[1].price)
+
+    def test_unknown_ids_are_rejected(self):
+        response = self.client.post(self.url, {'items': [{'product': 999999, 'quantity': 1}]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('999999', str(response.data))
+        response = self.client.post(
+            self.url, {'items': [{'product': self.products[0].id, 'variant': 999999, 'quantity': 1}]}, format='json'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+
+    def test_variant_must_belong_to_product(self):
+        line = {'product': self.products[0].id, 'variant': self.variants[1].id, 'quantity': 1}
+        response = self.client.post(self.url, {'items': [line]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('does not belong', str(response.data))
+
+
+class AddToCartTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.user = User.objects.create_user(username='tapper', email='tapper@example.com', password='pass1234')
+        category = Category.objects.create(name='Toys')
+        cls.product = Product.objects.create(category=category, name='Kite', price=9)
+        cls.variant = Variant.objects.create(product=cls.product, variant_name='Red', price=11, stock=5)
+        cls.other_variant = Variant.objects.create(
+            product=Product.objects.create(category=category, name='Yo-yo', price=3),
+            variant_name='Blue', price=3, stock=5,
+        )
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+        self.url = reverse('add-to-cart')
+
+    def add(self, quantity, variant=None):
+        payload = {'product': self.product.id, 'quantity': quantity}
+        if variant:
+            payload['variant'] = variant.id
+        return self.client.post(self.url, payload, format='json')
+
+    def test_repeated_adds_sum_into_one_line(self):
+        for quantity in (1, 2, 3):
+            self.assertEqual(self.add(quantity, self.variant).status_code, 200)
+            self.assertEqual(self.add(quantity).status_code, 200)
+        lines = dict(CartItem.objects.filter(cart__user=self.user).values_list('variant_id', 'quantity'))
+        self.assertEqual(lines, {self.variant.id: 6, None: 6})
+
+    def test_existing_line_is_bumped_in_place(self):
+        self.add(1, self.variant)
+        # product, variant, quantity UPDATE, cart touch
+        with self.assertNumQueries(4):
+            self.add(1, self.variant)
+
+    def test_foreign_variant_is_rejected(self):
+        response = self.add(1, self.other_variant)
+        self.assertEqual(response.status_code, 400)
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class ConcurrentAddToCartTests(TransactionTestCase):
+    def test_concurrent_adds_lose_no_increments(self):
+        User = get_user_model()
+        user = User.objects.create_user(username='multitap', email='multitap@example.com', password='pass1234')
+        category = Category.objects.create(name='Snacks')
+        product = Product.objects.create(category=category, name='Chips', price=2)
+        variant = Variant.objects.create(product=product, variant_name='Salted', price=2, stock=100)
+
+        clients, rounds = 6, 5
+        barrier = threading.Barrier(clients)
+        statuses = []
+
+        def tap(payload):
+            client = APIClient()
+            client.force_authenticate(user)
+            try:
+                barrier.wait()
+                for _ in range(rounds):
+                    statuses.append(client.post(reverse('add-to-cart'), payload, format='json').status_code)
+            finally:
+                connection.close()
+
+        for payload in ({'product': product.id, 'variant': variant.id, 'quantity': 1}, {'product': product.id, 'quantity': 1}):
+            threads = [threading.Thread(target=tap, args=(payload,)) for _ in range(clients)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(set(statuses), {200})
+        lines = list(CartItem.objects.filter(cart__user=user).values_list('variant_id', 'quantity'))
+        self.assertEqual(sorted(lines, key=str), sorted([(variant.id, clients * rounds), (None, clients * rounds)], key=str))
+
+
+class CartBatchTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.user = User.objects.create_user(username='restorer', email='restorer@example.com', password='pass1234')
+        category = Category.objects.create(name='Stationery')
+        cls.products = Product.objects.bulk_create(
+            Product(category=category, name=f'Pen {i}', price=2 + i) for i in range(30)
+        )
+        cls.variants = Variant.objects.bulk_create(
+            Variant(product=product, variant_name=f'{product.name} blue', price=product.price + 1, stock=50)
+            for product in cls.products
+        )
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+        self.url = reverse('cart-batch')
+
+    def run_batch(self, operations):
+        return self.client.post(self.url, {'operations': operations}, format='json')
+
+    def test_operations_apply_in_order(self):
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=cart, product=self.products[0], quantity=1)
+        CartItem.objects.create(cart=cart, product=self.products[1], variant=self.variants[1], quantity=4)
+        response = self.run_batch([
+            {'op': 'add', 'product': self.products[0].id, 'quantity': 2},
+            {'op': 'set', 'product': self.products[1].id, 'variant': self.variants[1].id, 'quantity': 0},
+            {'op': 'add', 'product': self.products[2].id, 'variant': self.variants[2].id, 'quantity': 5},
+            {'op': 'set', 'product': self.products[2].id, 'variant': self.variants[2].id, 'quantity': 3},
+            {'op': 'add', 'product': self.products[3].id, 'quantity': 1},
+            {'op': 'remove', 'product': self.products[3].id},
+        ])
+        self.assertEqual(response.status_code, 200)
+        lines = {(row['product'], row['quantity']) for row in response.data['items']}
+        self.assertEqual(lines, {(self.products[0].id, 3), (self.products[2].id, 3)})
+        self.assertEqual(response.data['total_price'], self.products[0].price * 3 + self.variants[2].price * 3)
+
+    def test_query_count_is_constant_in_operation_count(self):
+        Cart.objects.create(user=self.user)
+        for count in (2, 30):
+            CartItem.objects.all().delete()
+            operations = [
+                {'op': 'add', 'product': self.products[i].id, 'variant': self.variants[i].id, 'quantity': 1}
+                for i in range(count)
+            ]
+            # products, variants, savepoint, cart, line lock, insert, cart touch, release, cart with total, items
+            with self.assertNumQueries(10):
+                response = self.run_batch(operations + [{'op': 'set', 'product': self.products[0].id, 'variant': self.variants[0].id, 'quantity': 9}])
+            self.assertEqual(response.status_code, 200)
+
+    def test_invalid_batch_changes_nothing(self):
+        response = self.run_batch([
+            {'op': 'add', 'product': self.products[0].id, 'quantity': 1},
+            {'op': 'add', 'product': self.products[0].id, 'variant': self.variants[1].id, 'quantity': 1},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(CartItem.objects.exists())
+        self.assertEqual(self.run_batch([{'op': 'set', 'product': self.products[0].id}]).status_code, 400)
+
+
+class UserCartViewTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.user = User.objects.create_user(username='viewer', email='viewer@example.com', password='pass1234')
+        category = Category.objects.create(name='Music')
+        cls.products = Product.objects.bulk_create(
+            Product(category=category, name=f'Album {i}', price=10) for i in range(10)
+        )
+        cls.variants = Variant.objects.bulk_create(
+            Variant(product=product, variant_name='Vinyl', price=25, stock=5) for product in cls.products
+        )
+        cls.cart = Cart.objects.create(user=cls.user)
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def test_total_uses_variant_price_with_product_fallback(self):
+        CartItem.objects.create(cart=self.cart, product=self.products[0], variant=self.variants[0], quantity=2)
+        CartItem.objects.create(cart=self.cart, product=self.products[1], quantity=3)
+        self.assertEqual(self.cart.total_price(), 2 * 25 + 3 * 10)
+        response = self.client.get(reverse('user-cart'))
+        self.assertEqual(response.data['total_price'], 80)
+
+    def test_query_count_is_constant_in_cart_size(self):
+        for start, stop in ((0, 1), (1, 10)):
+            CartItem.objects.bulk_create(
+                CartItem(cart=self.cart, product=self.products[i], variant=self.variants[i], quantity=1)
+                for i in range(start, stop)
+            )
+            # ETag validator, cart with its total, items with product and variant
+            with self.assertNumQueries(3):
+                response = self.client.get(reverse('user-cart'))
+            self.assertEqual(len(response.data['items']), stop)
+            self.assertEqual(response.data['total_price'], 25 * stop)
+
+    def test_empty_cart_totals_zero(self):
+        self.assertEqual(self.client.get(reverse('user-cart')).data['total_price'], 0)
+
+
+class OrderTotalsCommandTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.user = User.objects.create_user(username='ledger', email='ledger@example.com', password='pass1234')
+        category = Category.objects.create(name='Lighting')
+        product = Product.objects.create(category=category, name='Lamp', price=40)
+        cls.orders = []
+        for lines in range(5):
+            order = Order.objects.create(user=cls.user)  # placed before totals were stored
+            OrderItem.objects.bulk_create(
+                OrderItem(order=order, product=product, quantity=2, price=Decimal('12.50')) for _ in range(lines)
+            )
+            cls.orders.append(order)
+
+    def check(self):
+        return call_command('check_order_totals', batch_size=2, stdout=StringIO())
+
+    def test_backfill_then_check(self):
+        with self.assertRaisesMessage(CommandError, '4 of 5 orders have stale totals'):
+            self.check()
+        call_command('backfill_order_totals', batch_size=2, stdout=StringIO())
+        self.check()
+        order = Order.objects.get(pk=self.orders[3].pk)
+        self.assertEqual((order.subtotal, order.item_count, order.total), (Decimal('75.00'), 6, Decimal('75.00')))
+
+    def test_order_list_reads_stored_total(self):
+        call_command('backfill_order_totals', stdout=StringIO())
+        self.client.force_authenticate(self.user)
+        response = self.client.get(reverse('user-orders'))
+        totals = sorted(row['total_cost'] for row in response.data['results'])
+        self.assertEqual(totals, [Decimal('0'), Decimal('25'), Decimal('50'), Decimal('75'), Decimal('100')])
+
+
+class UserOrdersListViewTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.user = User.objects.create_user(username='wholesale', email='wholesale@example.com', password='pass1234')
+        stranger = User.objects.create_user(username='stranger', email='stranger@example.com', password='pass1234')
+        category = Category.objects.create(name='Bulk')
+        product = Product.objects.create(category=category, name='Crate', price=30)
+        variant = Variant.objects.create(product=product, variant_name='Pine', price=35, stock=0)
+        cls.start = timezone.now() - timezone.timedelta(days=30)
+        orders = []
+        for day in range(30):
+            order = Order.objects.create(user=cls.user, status='Shipped' if day % 3 == 0 else 'Pending')
+            orders.append(order)
+        Order.objects.create(user=stranger)
+        for day, order in enumerate(orders):
+            Order.objects.filter(pk=order.pk).update(created_at=cls.start + timezone.timedelta(days=day))
+        OrderItem.objects.bulk_create(
+            OrderItem(order=order, product=product, variant=variant if i else None, quantity=1, price=35)
+            for order in orders for i in range(3)
+        )
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+        self.url = reverse('user-orders')
+
+    def test_history_is_paged_newest_first(self):
+        seen = []
+        url = self.url + '?page_size=7'
+        while url:
+            # ETag validator, orders page, items with product and variant
+            with self.assertNumQueries(3):
+                response = self.client.get(url)
+            seen.extend(row['created_at'] for row in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(len(seen), 30)
+        self.assertEqual(seen, sorted(seen, reverse=True))
+        item = response.data['results'][0]['items'][1]
+        self.assertEqual((item['product_name'], item['variant_name']), ('Crate', 'Pine'))
+
+    def test_status_and_date_filters(self):
+        response = self.client.get(self.url, {
+            'status': 'Shipped',
+            'created_after': (self.start + timezone.timedelta(days=5)).isoformat(),
+            'created_before': (self.start + timezone.timedelta(days=20)).isoformat(),
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 5)  # days 6, 9, 12, 15, 18
+        self.assertEqual({row['status'] for row in response.data['results']}, {'Shipped'})
+
+    def test_invalid_filter_is_rejected(self):
+        self.assertEqual(self.client.get(self.url, {'status': 'Lost'}).status_code, 400)
+
+
+class OrderAdminViewSetTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.admin = User.objects.create_user(username='ops', email='ops@example.com', password='pass1234', is_staff=True)
+        cls.customer = User.objects.create_user(username='customer', email='customer@example.com', password='pass1234')
+        other = User.objects.create_user(username='other', email='other@example.com', password='pass1234')
+        product = Product.objects.create(category=Category.objects.create(name='Tools'), name='Saw', price=12)
+        statuses = ['Confirmed'] * 6 + ['Pending'] * 3 + ['Delivered']
+        cls.orders = [Order.objects.create(user=cls.customer, status=value) for value in statuses]
+        Order.objects.create(user=other, status='Confirmed')
+        OrderItem.objects.bulk_create(
+            OrderItem(order=order, product=product, quantity=1, price=12) for order in cls.orders for _ in range(2)
+        )
+
+    def setUp(self):
+        self.client.force_authenticate(self.admin)
+        self.url = reverse('admin-orders-list')
+
+    def test_list_is_filtered_and_keyset_paged(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url, {'status': 'Confirmed', 'user': self.customer.id, 'page_size': 4})
+        self.assertEqual(len(response.data['results']), 4)
+        self.assertEqual(len(self.client.get(response.data['next']).data['results']), 2)
+        self.assertEqual(self.client.get(self.url, {'user': 'x'}).status_code, 400)
+
+    def test_bulk_transition_updates_only_valid_orders(self):
+        ids = [order.id for order in self.orders] + [999999]
+        with self.assertNumQueries(4):  # savepoint, locked read, one UPDATE, release
+            response = self.client.post(reverse('admin-orders-bulk-status'), {'ids': ids, 'status': 'Shipped'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['updated'], [order.id for order in self.orders[:6]])
+        self.assertEqual([row['status'] for row in response.data['rejected']], ['Pending'] * 3 + ['Delivered'])
+        self.assertEqual(response.data['not_found'], [999999])
+        self.assertEqual(Order.objects.filter(status='Shipped').count(), 6)
+        self.assertEqual(Order.objects.filter(status='Confirmed').count(), 1)
+
+    def test_single_transition_follows_the_same_rules(self):
+        url = reverse('admin-orders-update-status', kwargs={'pk': self.orders[-1].id})
+        response = self.client.patch(url, {'status': 'Pending'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, {'error': 'Cannot move an order from Delivered to Pending'})
+        self.assertEqual(Order.objects.get(pk=self.orders[-1].id).status, 'Delivered')
+
+        url = reverse('admin-orders-update-status', kwargs={'pk': self.orders[0].id})
+        response = self.client.patch(url, {'status': 'Shipped'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['status'], 'Shipped')
+        self.assertEqual(Order.objects.get(pk=self.orders[0].id).status, 'Shipped')
+        self.assertEqual(self.client.patch(url, {'status': 'Confirmed'}, format='json').status_code, 400)
+
+    def test_generic_update_cannot_change_status(self):
+        url = reverse('admin-orders-detail', kwargs={'pk': self.orders[-1].id})
+        response = self.client.patch(url, {'status': 'Pending'}, format='json')
+        self.assertEqual(response.data['status'], 'Delivered')
+        self.assertEqual(Order.objects.get(pk=self.orders[-1].id).status, 'Delivered')
+
+    def test_bulk_transition_requires_admin(self):
+        self.client.force_authenticate(self.customer)
+        response = self.client.post(reverse('admin-orders-bulk-status'), {'ids': [self.orders[0].id], 'status': 'Shipped'}, format='json')
+        self.assertEqual(response.status_code, 403)
+
+
+def full_table_scans(sql):
+    """Tables the database would read in full to answer `sql`, according to EXPLAIN."""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'mysql':
+            cursor.execute('EXPLAIN FORMAT=JSON ' + sql)
+            scans = []
+
+            def walk(node):
+                if isinstance(node, dict):
+                    if node.get('access_type') == 'ALL':
+                        scans.append(node.get('table_name'))
+                    for value in node.values():
+                        walk(value)
+                elif isinstance(node, list):
+                    for value in node:
+                        walk(value)
+
+            walk(json.loads(cursor.fetchone()[0]))
+            return scans
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+        # "SCAN <table>" with no index is a full scan; "SCAN <table> USING INDEX" walks an index
+        return [match.group(1) for *_, detail in cursor.fetchall() if (match := re.fullmatch(r'SCAN (\w+)', detail))]
+
+
+class ReadViewBenchmarkCommandTests(TransactionTestCase):
+    @override_settings(ALLOWED_HOSTS=[])  # as in backend/settings.py
+    def test_runs_against_default_settings(self):
+        seed_dataset(seed=7, **PRESETS['tiny'])
+        out = StringIO()
+        call_command('benchmark_read_views', requests=4, concurrency=2, stdout=out)
+        self.assertIn(f'Benchmarked {len(ROUTES)} routes', out.getvalue())
+
+
+class AsyncReadViewTests(APITestCase):
+    """The async read routes must be drop-in replacements for the DRF ones."""
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_dataset(
+            seed=2, users=3, categories=2, products_per_category=30, variants_per_product=2,
+            reviews_per_product=2, cart_items_per_user=3, orders_per_user=25, items_per_order=2,
+        )
+        cls.user = get_user_model().objects.get(username='bench1')
+        cls.token = Token.objects.create(user=cls.user)
+        cls.category = Category.objects.order_by('pk').first()
+
+    def setUp(self):
+        catalog_cache.clear()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def pages(self, url):
+        bodies = []
+        while url:
+            catalog_cache.clear()
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, url)
+            bodies.append(response.json())
+            url = bodies[-1].get('next') if isinstance(bodies[-1], dict) else None
+        return bodies
+
+    def test_async_routes_return_the_sync_payloads(self):
+        urls = [
+            reverse('category-list'),
+            reverse('products-by-category', kwargs={'category_id': self.category.id}) + '?page_size=7',
+            reverse('user-cart'),
+            reverse('user-orders') + '?page_size=6',
+            reverse('user-orders') + '?status=Shipped',
+        ]
+        expected = [self.pages(url) for url in urls]
+        with serving(ROUTES):
+            self.assertIs(resolve(reverse('user-cart')).func, async_views.user_cart)
+            self.assertEqual([self.pages(url) for url in urls], expected)
+        self.assertEqual(len(expected[1]), 5)  # 30 products, 7 per page
+
+    def test_async_routes_fail_like_drf(self):
+        def responses():
+            results = []
+            for params in ({'status': 'Lost'}, {'cursor': 'junk'}):
+                response = self.client.get(reverse('user-orders'), params)
+                results.append((response.status_code, response.json()))
+            response = self.client.post(reverse('user-cart'))
+            results.append((response.status_code, response.json()))
+            for credentials in ({'HTTP_AUTHORIZATION': 'Token nope'}, {}):
+                self.client.credentials(**credentials)
+                response = self.client.get(reverse('category-list'))
+                results.append((response.status_code, response.json(), response['WWW-Authenticate']))
+            self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+            return results
+
+        expected = responses()
+        self.assertEqual([row[0] for row in expected], [400, 404, 405, 401, 401])
+        with serving(ROUTES):
+            self.assertEqual(responses(), expected)
+
+    def test_session_login_and_new_cart(self):
+        get_user_model().objects.create_user(username='newcomer', password='pass1234')
+        self.client.credentials()
+        with serving(ROUTES):
+            self.client.login(username='newcomer', password='pass1234')
+            response = self.client.get(reverse('user-cart'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.json()['items'], response.json()['total_price']), ([], 0))
+
+
+class OrderExportTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.admin = User.objects.create_user(username='finance', email='finance@example.com', password='pass1234', is_staff=True)
+        cls.customer = User.objects.create_user(username='payer', email='payer@example.com', password='pass1234')
+        product = Product.objects.create(category=Category.objects.create(name='Paper'), name='Ream', price=7)
+        variant = Variant.objects.create(product=product, variant_name='A4', price=8, stock=0)
+        cls.start = timezone.now() - timezone.timedelta(days=10)
+        cls.orders = []
+        for i in range(7):
+            order = Order.objects.create(user=cls.customer, status='Shipped' if i % 2 else 'Pending')
+            # pairs of orders share a timestamp, so batches must break ties on id
+            Order.objects.filter(pk=order.pk).update(created_at=cls.start + timezone.timedelta(days=i // 2))
+            cls.orders.append(order)
+        OrderItem.objects.bulk_create(
+            OrderItem(order=order, product=product, variant=variant if n else None, quantity=n + 1, price=8)
+            for order in cls.orders[:-1] for n in range(2)
+        )
+
+    def setUp(self):
+        self.client.force_authenticate(self.admin)
+        self.url = reverse('admin-orders-export')
+
+    def export(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content).decode()
+
+    @override_settings(ORDER_EXPORT_BATCH_SIZE=2)
+    def test_csv_has_one_row_per_item_in_batches(self):
+        # per batch of two orders: orders, their items; then one empty read
+        with self.assertNumQueries(2 * 4 + 1):
+            response, body = self.export()
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertIn('attachment; filename="orders-', response['Content-Disposition'])
+        rows = list(csv.DictReader(io.StringIO(body)))
+        self.assertEqual(len(rows), 6 * 2 + 1)  # the last order has no items
+        self.assertEqual([int(row['order_id']) for row in rows[::2]], [order.id for order in self.orders])
+        self.assertEqual(
+            (rows[1]['username'], rows[1]['product_name'], rows[1]['variant_name'], rows[1]['quantity']),
+            ('payer', 'Ream', 'A4', '2'),
+        )
+        self.assertEqual((rows[-1]['item_id'], rows[-1]['variant_name']), ('', ''))
+
+    def test_ndjson_is_filtered_by_status_and_dates(self):
+        response, body = self.export(
+            output='ndjson', status='Shipped',
+            created_after=(self.start + timezone.timedelta(days=1)).isoformat(),
+        )
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        orders = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual([order['id'] for order in orders], [self.orders[i].id for i in (3, 5)])
+        self.assertEqual(orders[0]['items'][1]['variant_name'], 'A4')
+        self.assertEqual(orders[0]['items'][1]['price'], '8.00')
+
+    def test_export_requires_admin_and_valid_filters(self):
+        self.assertEqual(self.client.get(self.url, {'output': 'xlsx'}).status_code, 400)
+        self.client.force_authenticate(self.customer)
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+
+class QueryPlanTests(APITestCase):
+    """Every query behind the read endpoints must be served by an index."""
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_dataset(
+            seed=1, users=10, categories=4, products_per_category=60, variants_per_product=3,
+            reviews_per_product=4, cart_items_per_user=5, orders_per_user=40, items_per_order=3,
+        )
+        User = get_user_model()
+        cls.user = User.objects.get(username='bench3')
+        cls.admin = User.objects.get(username='bench0')
+        cls.admin.is_staff = True
+        cls.admin.save()
+        cls.category = Category.objects.order_by('pk')[1]
+        cls.product = Product.objects.filter(rating_count__gt=0).order_by('pk').first()
+
+    def setUp(self):
+        catalog_cache.clear()
+
+    def assert_index_only(self, user, url, params=None, allow=()):
+        self.client.force_authenticate(user)
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(url, params or {})
+            if response.streaming:
+                b''.join(response.streaming_content)
+        self.assertEqual(response.status_code, 200, url)
+        selects = [query['sql'] for query in captured.captured_queries if query['sql'].startswith('SELECT')]
+        self.assertTrue(selects, url)
+        for sql in selects:
+            scans = [table for table in full_table_scans(sql) if table not in allow]
+            self.assertEqual(scans, [], f'{url} does a full scan in: {sql}')
+
+    def test_catalog_endpoints(self):
+        # listing every category is a full read by design
+        self.assert_index_only(self.user, reverse('category-list'), allow={'shop_category'})
+        self.assert_index_only(self.user, reverse('products-by-category', kwargs={'category_id': self.category.id}))
+        self.assert_index_only(self.user, reverse('product-reviews', kwargs={'product_id': self.product.id}))
+
+    def test_cart_endpoint(self):
+        self.assert_index_only(self.user, reverse('user-cart'))
+
+    def test_order_history_endpoints(self):
+        self.assert_index_only(self.user, reverse('user-orders'))
+        self.assert_index_only(self.user, reverse('user-orders'), {'status': 'Shipped', 'created_after': '2025-03-01T00:00:00Z'})
+
+    def test_admin_order_endpoints(self):
+        self.assert_index_only(self.admin, reverse('admin-orders-list'))
+        self.assert_index_only(self.admin, reverse('admin-orders-list'), {'status': 'Confirmed'})
+
+    @override_settings(ORDER_EXPORT_BATCH_SIZE=100)
+    def test_order_export_endpoint(self):
+        self.assert_index_only(self.admin, reverse('admin-orders-export'))
+        self.assert_index_only(self.admin, reverse('admin-orders-export'), {
+            'status': 'Shipped', 'created_after': '2025-03-01T00:00:00Z', 'output': 'ndjson',
+        })
+
+    def test_address_endpoint(self):
+        self.assert_index_only(self.user, reverse('user-addresses'))
+
+    def test_search_endpoint(self):
+        self.assert_index_only(self.user, reverse('product-search'), {'q': 'product option'})
+
+
+class ProductSearchTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.user = User.objects.create_user(username='seeker', email='seeker@example.com', password='pass1234')
+        cls.outdoor = Category.objects.create(name='Outdoor')
+        kitchen = Category.objects.create(name='Kitchen')
+        cls.tent = Product.objects.create(category=cls.outdoor, name='Trail Tent', description='Sleeps two hikers', price=150)
+        cls.stove = Product.objects.create(category=cls.outdoor, name='Camp Stove', description='Pairs with any tent', price=60)
+        cls.kettle = Product.objects.create(category=kitchen, name='Kettle', description='Whistling', price=25)
+        Variant.objects.create(product=cls.kettle, variant_name='Copper finish', price=30, stock=4)
+        for i in range(25):
+            Product.objects.create(category=kitchen, name=f'Mug {i}', description='Ceramic', price=5)
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+        self.url = reverse('product-search')
+
+    def search(self, q, **params):
+        return self.client.get(self.url, {'q': q, **params})
+
+    def names(self, response):
+        return [row['name'] for row in response.data['results']]
+
+    def test_name_matches_outrank_description_matches(self):
+        response = self.search('tent')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.names(response), ['Trail Tent', 'Camp Stove'])
+        self.assertGreater(response.data['results'][0]['score'], response.data['results'][1]['score'])
+
+    def test_matches_category_and_variant_names(self):
+        self.assertEqual(set(self.names(self.search('outdoor'))), {'Trail Tent', 'Camp Stove'})
+        self.assertEqual(self.names(self.search('copper')), ['Kettle'])
+
+    def test_index_follows_catalog_changes(self):
+        Variant.objects.create(product=self.tent, variant_name='Ultralight', price=190, stock=1)
+        self.assertEqual(self.names(self.search('ultralight')), ['Trail Tent'])
+        self.outdoor.name = 'Camping'
+        self.outdoor.save()
+        self.assertEqual(self.names(self.search('outdoor')), [])
+        self.assertEqual(set(self.names(self.search('camping'))), {'Trail Tent', 'Camp Stove'})
+        self.kettle.delete()
+        self.assertEqual(self.names(self.search('copper')), [])
+
+    def test_results_are_paged_in_constant_queries(self):
+        seen = []
+        url = self.url + '?q=mug&limit=10'
+        while url:
+            # ranked ids, products with category, variants
+            with self.assertNumQueries(3):
+                response = self.client.get(url)
+            seen.extend(self.names(response))
+            url = response.data['next']
+        self.assertEqual(len(seen), 25)
+        self.assertEqual(len(set(seen)), 25)
+
+    def test_query_is_required(self):
+        self.assertEqual(self.search('  ').status_code, 400)
+        self.assertEqual(self.search('the of').status_code, 400)
+
+
+class InventoryTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.user = User.objects.create_user(username='stocker', email='stocker@example.com', password='pass1234')
+        product = Product.objects.create(category=Category.objects.create(name='Drops'), name='Sneaker', price=90)
+        cls.product = product
+        cls.variant = Variant.objects.create(product=product, variant_name='Size 9', price=120, stock=10)
+        cls.hot = Variant.objects.create(product=product, variant_name='Size 10', price=120, stock=100)
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def stock(self, variant):
+        return Variant.objects.get(pk=variant.pk).stock
+
+    def stripes(self, variant):
+        return list(StockStripe.objects.filter(variant=variant).order_by('stripe').values_list('available', flat=True))
+
+    def test_ledger_records_every_movement(self):
+        with transaction.atomic():
+            take_stock({self.variant.pk: 3})
+        put_stock({self.variant.pk: 5})
+        self.assertEqual(self.stock(self.variant), 12)
+        movements = list(StockMovement.objects.filter(variant=self.variant).order_by('pk').values_list('kind', 'quantity', 'reconciled'))
+        self.assertEqual(movements, [('sale', -3, True), ('restock', 5, True)])
+
+    def test_striped_variant_sells_from_stripes_and_reconciles(self):
+        stripe_variant(self.hot.pk, 4)
+        self.assertEqual(self.stripes(self.hot), [25, 25, 25, 25])
+        for _ in range(10):
+            with transaction.atomic():
+                take_stock({self.hot.pk: 3})
+        self.assertEqual(sum(self.stripes(self.hot)), 70)
+        self.assertEqual(self.stock(self.hot), 100)  # untouched until reconciliation
+
+        put_stock({self.hot.pk: 6})
+        self.assertEqual(sum(self.stripes(self.hot)), 76)
+        self.assertEqual(reconcile_inventory(batch_size=4), 11)
+        self.assertEqual(self.stock(self.hot), 76)
+        self.assertFalse(StockMovement.objects.filter(reconciled=False).exists())
+
+    def test_request_larger_than_any_stripe_drains_several(self):
+        stripe_variant(self.hot.pk, 4)
+        with transaction.atomic():
+            take_stock({self.hot.pk: 60})
+        self.assertEqual(sum(self.stripes(self.hot)), 40)
+        with self.assertRaisesMessage(Exception, 'Insufficient stock'), transaction.atomic():
+            take_stock({self.hot.pk: 41})
+        self.assertEqual(sum(self.stripes(self.hot)), 40)
+
+    def test_unstriping_restores_the_live_count(self):
+        stripe_variant(self.hot.pk, 3)
+        with transaction.atomic():
+            take_stock({self.hot.pk: 7})
+        stripe_variant(self.hot.pk, 0)
+        self.assertEqual(self.stock(self.hot), 93)
+        self.assertEqual(self.stripes(self.hot), [])
+
+    def test_checkout_uses_reserved_stock(self):
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=cart, product=self.product, variant=self.variant, quantity=4)
+        response = self.client.post(reverse('cart-reserve'))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['reservations'], [{'variant': self.variant.pk, 'quantity': 4}])
+        self.assertEqual(self.stock(self.variant), 6)
+
+        # reserving again replaces the hold instead of stacking it
+        self.client.post(reverse('cart-reserve'))
+        self.assertEqual(self.stock(self.variant), 6)
+
+        CartItem.objects.filter(cart=cart).update(quantity=5)
+        self.assertEqual(self.client.post(reverse('place-order')).status_code, 201)
+        self.assertEqual(self.stock(self.variant), 5)  # 4 from the hold, 1 more taken at checkout
+        self.assertEqual(
+            sorted(StockReservation.objects.values_list('status', flat=True)), ['consumed', 'released'],
+        )
+
+    def test_expired_holds_go_back_on_sale(self):
+        reserve_stock(self.user, {self.variant.pk: 6}, ttl=-1)
+        self.assertEqual(self.stock(self.variant), 4)
+        self.assertEqual(release_expired_reservations(), 1)
+        self.assertEqual(self.stock(self.variant), 10)
+        self.assertEqual(release_expired_reservations(), 0)
+
+    def test_stock_moves_refresh_cached_catalog_pages(self):
+        catalog_cache.clear()
+        url = reverse('products-by-category', kwargs={'category_id': self.product.category_id})
+
+        def listed():
+            return {row['id']: row['stock'] for row in self.client.get(url).data['results'][0]['variants']}
+
+        def take_hot(quantity):
+            with transaction.atomic():
+                take_stock({self.hot.pk: quantity})
+
+        moves = [
+            (lambda: reserve_stock(self.user, {self.variant.pk: 2}), 8, 100),
+            (lambda: release_reservations(StockReservation.objects.all()), 10, 100),
+            (lambda: put_stock({self.variant.pk: 5}), 15, 100),
+            (lambda: (stripe_variant(self.hot.pk, 2), take_hot(10)), 15, 100),  # stripes are not listed
+            (reconcile_inventory, 15, 90),
+            (lambda: (take_hot(5), stripe_variant(self.hot.pk, 0)), 15, 85),
+        ]
+        for move, variant_stock, hot_stock in moves:
+            listed()
+            move()
+            self.assertEqual(listed(), {self.variant.pk: variant_stock, self.hot.pk: hot_stock})
+
+    @override_settings(INVENTORY_RESERVATION_TTL=-1)
+    def test_checkout_ignores_expired_holds(self):
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=cart, product=self.product, variant=self.variant, quantity=8)
+        self.client.post(reverse('cart-reserve'))
+        self.assertEqual(self.client.post(reverse('place-order')).status_code, 201)
+        self.assertEqual(self.stock(self.variant), 2)
+        self.assertEqual(StockReservation.objects.get().status, 'released')
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class ConcurrentStripedCheckoutTests(TransactionTestCase):
+    def test_concurrent_buyers_of_a_striped_variant_never_oversell(self):
+        product = Product.objects.create(category=Category.objects.create(name='Hype'), name='Drop', price=10)
+        variant = Variant.objects.create(product=product, variant_name='Only size', price=10, stock=20)
+        stripe_variant(variant.pk, 4)
+
+        barrier = threading.Barrier(8)
+        sold = []
+
+        def buy():
+            try:
+                barrier.wait()
+                for _ in range(5):
+                    try:
+                        with transaction.atomic():
+                            take_stock({variant.pk: 1})
+                        sold.append(1)
+                    except Exception:
+                        pass
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=buy) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(sold), 20)
+        reconcile_inventory()
+        self.assertEqual(Variant.objects.get(pk=variant.pk).stock, 0)
+
+
+def png_upload(name, size=(2000, 1000)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, 'teal').save(buffer, 'PNG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+
+class ImageDerivativeTests(APITestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.media_root = tempfile.mkdtemp()
+        cls.settings_override = override_settings(MEDIA_ROOT=cls.media_root, IMAGE_DERIVATIVES_IN_BACKGROUND=False)
+        cls.settings_override.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.settings_override.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+        super().tearDownClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username='looker', email='looker@example.com', password='pass1234')
+
+    def setUp(self):
+        catalog_cache.clear()
+        self.client.force_authenticate(self.user)
+
+    def test_upload_renders_every_size_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            category = Category.objects.create(name='Prints', image=png_upload('print.png'))
+        category.refresh_from_db()
+        self.assertEqual(category.image_derivatives['source'], category.image.name)
+        for label, edge in {'thumb': 160, 'medium': 480, 'large': 1024}.items():
+            with default_storage.open(category.image_derivatives[label]) as fh:
+                image = Image.open(fh)
+                self.assertEqual((image.format, image.size), ('WEBP', (edge, edge // 2)))
+
+        images = self.client.get(reverse('category-list')).data[0]['images']
+        self.assertTrue(images['thumb'].startswith('http://testserver/media/derivatives/category_images/'))
+        self.assertTrue(images['thumb'].endswith('/thumb.webp'))
+        self.assertTrue(images['original'].endswith('.png'))
+
+    def test_sizes_fall_back_to_the_original_until_rendered(self):
+        category = Category.objects.create(name='Posters')
+        product = Product.objects.create(category=category, name='Poster', image=png_upload('poster.png'))  # commit callbacks never run
+        images = self.client.get(reverse('products-by-category', kwargs={'category_id': category.id})).data['results'][0]['images']
+        self.assertEqual(set(images.values()), {images['original']})
+
+        # a new upload invalidates what was rendered for the old one
+        Product.objects.filter(pk=product.pk).update(image_derivatives={'source': 'product_images/old.png', 'thumb': 'x.webp'})
+        catalog_cache.clear()
+        images = self.client.get(reverse('products-by-category', kwargs={'category_id': category.id})).data['results'][0]['images']
+        self.assertEqual(images['thumb'], images['original'])
+
+    def test_command_renders_existing_media_in_a_process_pool(self):
+        category = Category.objects.create(name='Frames')
+        products = [
+            Product.objects.create(category=category, name=f'Frame {i}', image=png_upload(f'frame{i}.png', (300, 600)))
+            for i in range(3)
+        ]
+        Product.objects.create(category=category, name='Bare frame')
+        out = StringIO()
+        call_command('generate_image_derivatives', model=['product'], workers=2, batch_size=2, stdout=out)
+        self.assertIn('Rendered derivatives for 3 product images.', out.getvalue())
+        for product in products:
+            product.refresh_from_db()
+            with default_storage.open(product.image_derivatives['thumb']) as fh:
+                self.assertEqual(Image.open(fh).size, (80, 160))
+            self.assertEqual(product.image_derivatives['large'].rsplit('/', 1)[1], 'large.webp')
+
+        # nothing left to do; --force renders again under the same names
+        call_command('generate_image_derivatives', model=['product'], workers=1, stdout=out)
+        self.assertIn('Rendered derivatives for 0 product images.', out.getvalue())
+        before = Product.objects.get(pk=products[0].pk).image_derivatives
+        call_command('generate_image_derivatives', model=['product'], workers=1, force=True, stdout=out)
+        self.assertEqual(Product.objects.get(pk=products[0].pk).image_derivatives, before)
+
+
+class CatalogImportTests(APITestCase):
+    CSV = (
+        'category,product,description,price,variant,variant_price,stock\n'
+        'Garden,Rake,Steel tines,20.00,Short handle,19.50,10\n'
+        'Garden,Rake,,,Long handle,24.00,5\n'
+        'Garden,Trowel,Hand trowel,8.00,,,\n'
+        'Tools,Hammer,Claw hammer,15,,,\n'
+    )
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username='buyer', email='buyer@example.com', password='pass1234')
+        Category.objects.create(name='Garden')
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+
+    def write(self, name, content):
+        path = f'{self.directory}/{name}'
+        with open(path, 'w') as fh:
+            fh.write(content)
+        return path
+
+    def run_import(self, path, **options):
+        out = StringIO()
+        call_command('import_catalog', path, stdout=out, **options)
+        return out.getvalue()
+
+    def test_csv_import_creates_rows_and_indexes_them(self):
+        version = catalog_cache.version()
+        out = self.run_import(self.write('catalog.csv', self.CSV), batch_size=2)
+        self.assertIn('Imported 4 records', out)
+        rake = Product.objects.get(name='Rake')
+        self.assertEqual((rake.category.name, rake.description, rake.price), ('Garden', 'Steel tines', Decimal('20.00')))
+        self.assertEqual(
+            sorted(rake.variants.values_list('variant_name', 'price', 'stock')),
+            [('Long handle', Decimal('24.00'), 5), ('Short handle', Decimal('19.50'), 10)],
+        )
+        self.assertEqual(Category.objects.count(), 2)
+        self.assertNotEqual(catalog_cache.version(), version)
+        response = self.client.get(reverse('product-search'), {'q': 'long handle'})
+        self.assertEqual([row['name'] for row in response.data['results']], ['Rake'])
+
+    def test_reimport_updates_in_place_and_dry_run_only_reports(self):
+        self.run_import(self.write('catalog.csv', self.CSV))
+        changed = self.write('changed.jsonl', '\n'.join(json.dumps(row) for row in [
+            {'category': 'Garden', 'product': 'Rake', 'price': '22.00', 'variant': 'Short handle', 'stock': 7},
+            {'category': 'Garden', 'product': 'Hoe', 'price': 12},
+        ]) + '\n')
+
+        out = self.run_import(changed, dry_run=True)
+        self.assertIn("~ product 'Rake' in 'Garden': price 20.00 -> 22.00", out)
+        self.assertIn("~ variant 'Short handle' of 'Rake': stock 10 -> 7", out)
+        self.assertIn("+ product 'Hoe' in 'Garden'", out)
+        self.assertFalse(Product.objects.filter(name='Hoe').exists())
+        self.assertEqual(Product.objects.get(name='Rake').price, Decimal('20.00'))
+
+        self.run_import(changed)
+        self.assertEqual(Product.objects.filter(name='Rake').count(), 1)
+        self.assertEqual(Product.objects.get(name='Rake').price, Decimal('22.00'))
+        short = Variant.objects.get(variant_name='Short handle')
+        self.assertEqual(short.stock, 7)
+        self.assertEqual(
+            list(StockMovement.objects.filter(variant=short).values_list('kind', 'quantity')),
+            [(StockMovement.ADJUST, -3)],
+        )
+        self.assertIn('no changes', self.run_import(changed))
+
+    def test_cache_is_invalidated_again_on_commit(self):
+        self.run_import(self.write('catalog.csv', self.CSV))
+        path = self.write('price.jsonl', json.dumps({'category': 'Tools', 'product': 'Hammer', 'price': 17}) + '\n')
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.run_import(path)
+        self.assertIn(catalog_cache.invalidate, callbacks)
+
+    def test_failed_import_resumes_after_last_committed_batch(self):
+        rows = [{'category': 'Books', 'product': f'Book {i}', 'price': 10 + i} for i in range(5)]
+        rows[3]['price'] = 'free'
+        path = self.write('books.jsonl', '\n'.join(json.dumps(row) for row in rows))
+        with self.assertRaisesMessage(CommandError, 'line 4: price'):
+            self.run_import(path, batch_size=2)
+        self.assertEqual(Product.objects.filter(category__name='Books').count(), 2)
+
+        rows[3]['price'] = 13
+        rows[0]['price'] = 99  # already imported; a resumed run must not revisit it
+        self.write('books.jsonl', '\n'.join(json.dumps(row) for row in rows))
+        out = self.run_import(path, batch_size=2, resume=True)
+        self.assertIn('Resuming after 2 records.', out)
+        self.assertEqual(
+            list(Product.objects.filter(category__name='Books').order_by('name').values_list('price', flat=True)),
+            [Decimal(price) for price in (10, 11, 12, 13, 14)],
+        )
+        self.assertEqual(os.listdir(self.directory), ['books.jsonl'])
+
+
+class EndpointBudgetTests(APITestCase):
+    """Every route is benchmarked, and stays within its query budget."""
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_dataset(seed=4, **PRESETS['tiny'])
+        cls.fixtures = benchmark_fixtures()
+
+    def test_every_route_is_benchmarked(self):
+        self.assertEqual(unbenchmarked_routes(), [])
+
+    def test_endpoints_stay_within_their_query_budgets(self):
+        results = run_suite(self.client, self.fixtures)
+        self.assertEqual(budget_violations(results), [])
+
+
+@override_settings(METRICS_TOKEN='scrape-secret')
+class MetricsTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username='watcher', email='watcher@example.com', password='pass1234')
+        Category.objects.create(name='Gauges')
+
+    def setUp(self):
+        metrics.clear()
+        catalog_cache.clear()
+        self.client.force_authenticate(self.user)
+
+    def scrape(self):
+        response = APIClient().get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer scrape-secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        return response.content.decode()
+
+    def test_requests_are_recorded_per_route(self):
+        self.client.get(reverse('category-list'))
+        self.client.get(reverse('category-list'))
+        self.client.get('/api/shop/nowhere/')
+        body = self.scrape()
+        self.assertIn('http_requests_total{route="category-list",method="GET",status="200"} 2', body)
+        self.assertIn('http_requests_total{route="unmatched",method="GET",status="404"} 1', body)
+        # one query on the first request, none on the cached repeat
+        self.assertIn('http_request_db_queries_bucket{route="category-list",method="GET",le="0"} 1', body)
+        self.assertIn('http_request_db_queries_sum{route="category-list",method="GET"} 1', body)
+        self.assertIn('http_request_duration_seconds_count{route="category-list",method="GET"} 2', body)
+        self.assertIn('http_response_size_bytes_bucket{route="category-list",method="GET",le="+Inf"} 2', body)
+        self.assertIn('catalog_cache_hits_total 1', body)
+        self.assertIn('token_cache_max_entries ', body)
+        self.assertNotIn('route="metrics"', self.scrape())
+
+    def test_async_views_are_counted(self):
+        self.client.force_authenticate(None)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=self.user).key}')
+        with serving(['user-cart']):
+            self.client.get(reverse('user-cart'))
+        body = self.scrape()
+        self.assertIn('http_requests_total{route="user-cart",method="GET",status="200"} 1', body)
+        self.assertRegex(body, r'http_request_db_queries_sum\{route="user-cart",method="GET"\} [1-9]')
+
+    def test_query_timer_is_only_hooked_up_when_enabled(self):
+        try:
+            connection_created.disconnect(install_query_timer)
+            with override_settings(METRICS_ENABLED=False), self.assertRaises(MiddlewareNotUsed):
+                MetricsMiddleware(lambda request: None)
+            self.assertFalse(connection_created.disconnect(install_query_timer))
+        finally:
+            MetricsMiddleware(lambda request: None)
+        self.assertTrue(connection_created.disconnect(install_query_timer))
+        connection_created.connect(install_query_timer)
+
+    def test_only_the_token_or_staff_may_scrape(self):
+        client = APIClient()
+        self.assertEqual(client.get(reverse('metrics')).status_code, 403)
+        self.assertEqual(client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer guess').status_code, 403)
+        client.force_login(self.user)
+        self.assertEqual(client.get(reverse('metrics')).status_code, 403)
+        self.user.is_staff = True
+        self.user.save()
+        self.assertEqual(client.get(reverse('metrics')).status_code, 200)
+        with override_settings(METRICS_TOKEN=None):
+            self.assertEqual(APIClient().get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer ').status_code, 403)
+
+    @override_settings(METRICS_ENABLED=False)
+    def test_switch_turns_metrics_off(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        client.get(reverse('category-list'))
+        self.assertEqual(client.get(reverse('metrics')).status_code, 404)
+        self.assertNotIn('route="category-list"', metrics.render())
+
+
+class ConditionalGetTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.user = User.objects.create_user(username='poller', email='poller@example.com', password='pass1234')
+        cls.admin = User.objects.create_user(username='clerk', email='clerk@example.com', password='pass1234', is_staff=True)
+        cls.token = Token.objects.create(user=cls.user)
+        cls.category = Category.objects.create(name='Clocks')
+        cls.product = Product.objects.create(category=cls.category, name='Alarm clock', price=12)
+        cls.variant = Variant.objects.create(product=cls.product, variant_name='Red', price=14, stock=50)
+        cls.order = Order.objects.create(user=cls.user)
+        CartItem.objects.create(cart=Cart.objects.create(user=cls.user), product=cls.product, variant=cls.variant)
+
+    def setUp(self):
+        catalog_cache.clear()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.urls = {
+            'categories': reverse('category-list'),
+            'products': reverse('products-by-category', kwargs={'category_id': self.category.id}),
+            'cart': reverse('user-cart'),
+            'orders': reverse('user-orders'),
+        }
+
+    def etags(self):
+        etags = {}
+        for name, url in self.urls.items():
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, url)
+            etags[name] = response['ETag']
+        return etags
+
+    def revalidate(self, etags):
+        """{name: status} for a conditional GET of every URL."""
+        return {name: self.client.get(url, HTTP_IF_NONE_MATCH=etags[name]).status_code for name, url in self.urls.items()}
+
+    def test_unchanged_responses_are_not_rebuilt(self):
+        etags = self.etags()
+        # only the validators: none for the catalog, the cart row, the order summary
+        with self.assertNumQueries(2):
+            self.assertEqual(set(self.revalidate(etags).values()), {304})
+        response = self.client.get(self.urls['cart'], HTTP_IF_NONE_MATCH=etags['cart'])
+        self.assertEqual((response.content, response['ETag']), (b'', etags['cart']))
+
+    def test_changes_produce_new_etags(self):
+        etags = self.etags()
+        self.client.post(reverse('add-to-cart'), {'product': self.product.id, 'variant': self.variant.id, 'quantity': 1})
+        self.assertEqual(self.revalidate(etags), {'categories': 304, 'products': 304, 'cart': 200, 'orders': 304})
+
+        etags = self.etags()
+        self.client.force_authenticate(self.admin)
+        self.client.post(reverse('admin-orders-bulk-status'), {'ids': [self.order.id], 'status': 'Confirmed'}, format='json')
+        self.client.force_authenticate(None)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.assertEqual(self.revalidate(etags), {'categories': 304, 'products': 304, 'cart': 304, 'orders': 200})
+
+        # names and prices are part of every payload
+        etags = self.etags()
+        self.variant.price = 15
+        self.variant.save()
+        self.assertEqual(set(self.revalidate(etags).values()), {200})
+
+    def test_stock_moves_produce_new_etags(self):
+        # stock is written with update(), which sends no signals
+        moves = [
+            lambda: put_stock({self.variant.pk: 5}),
+            lambda: reserve_stock(self.admin, {self.variant.pk: 10}),
+            lambda: release_reservations(StockReservation.objects.all()),
+        ]
+        for move in moves:
+            etags = self.etags()
+            move()
+            statuses = self.revalidate(etags)
+            self.assertEqual((statuses['products'], statuses['cart']), (200, 200))
+        self.assertEqual(Variant.objects.get(pk=self.variant.pk).stock, 55)
+
+    def test_etags_are_per_user(self):
+        etags = self.etags()
+        other = get_user_model().objects.create_user(username='neighbour', email='n@example.com', password='pass1234')
+        Cart.objects.create(user=other)
+        self.client.credentials()
+        self.client.force_authenticate(other)
+        statuses = self.revalidate(etags)
+        self.assertEqual((statuses['cart'], statuses['orders']), (200, 200))
+
+    def test_async_routes_revalidate_the_same_way(self):
+        etags = self.etags()
+        with serving(ROUTES):
+            self.assertEqual(self.etags(), etags)
+            self.assertEqual(set(self.revalidate(etags).values()), {304})
+
+
+class SparseFieldsetTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_dataset(
+            seed=5, users=2, categories=1, products_per_category=8, variants_per_product=3,
+            reviews_per_product=1, cart_items_per_user=1, orders_per_user=6, items_per_order=3,
+        )
+        User = get_user_model()
+        cls.user = User.objects.get(username='bench1')
+        cls.admin = User.objects.get(username='bench0')
+        cls.admin.is_staff = True
+        cls.admin.save()
+        cls.products_url = reverse('products-by-category', kwargs={'category_id': Category.objects.get().id})
+
+    def setUp(self):
+        catalog_cache.clear()
+        self.client.force_authenticate(self.user)
+
+    def get(self, url, params, queries):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200, response.content)
+        selects = [query['sql'] for query in captured.captured_queries if query['sql'].startswith('SELECT')]
+        self.assertEqual(len(selects), queries, selects)
+        return response.json()['results'], selects
+
+    def test_default_output_is_unchanged(self):
+        rows, _ = self.get(self.products_url, {}, queries=2)  # page with category, variants
+        self.assertEqual(list(rows[0]), ProductSerializer.Meta.fields)
+        self.assertEqual(list(rows[0]['variants'][0]), ['id', 'variant_name', 'price', 'stock'])
+
+    def test_fields_trim_output_and_queries(self):
+        rows, selects = self.get(self.products_url, {'fields': 'id,name,price'}, queries=1)
+        self.assertEqual(list(rows[0]), ['id', 'name', 'price'])
+        # no category join, no variant prefetch, large columns left unread
+        self.assertNotIn('shop_category', selects[0])
+        for column in ('"description"', '"rating_count"', '"image_derivatives"', '"search_document"'):
+            self.assertNotIn(column, selects[0])
+
+    def test_unexpanded_relations_are_keys(self):
+        rows, selects = self.get(self.products_url, {'fields': 'id,variants', 'expand': ''}, queries=2)
+        variant_ids = list(Variant.objects.filter(product_id=rows[0]['id']).order_by('pk').values_list('pk', flat=True))
+        self.assertEqual(sorted(rows[0]['variants']), variant_ids)
+        self.assertNotIn('"stock"', selects[1])
+
+        rows, _ = self.get(self.products_url, {'fields': 'name', 'expand': 'variants'}, queries=2)
+        self.assertEqual(list(rows[0]), ['name', 'variants'])
+        self.assertEqual(list(rows[0]['variants'][0]), ['id', 'variant_name', 'price', 'stock'])
+
+    def test_orders_without_items_skip_the_prefetch(self):
+        # ETag validator, page
+        orders, _ = self.get(reverse('user-orders'), {'fields': 'id,status,total_cost'}, queries=2)
+        self.assertEqual([list(order) for order in orders], [['id', 'status', 'total_cost']] * 6)
+        orders, selects = self.get(reverse('user-orders'), {'expand': ''}, queries=3)
+        self.assertEqual(len(orders[0]['items']), 3)
+        self.assertNotIn('shop_product', selects[2])
+
+        self.client.force_authenticate(self.admin)
+        orders, _ = self.get(reverse('admin-orders-list'), {'fields': 'id,user'}, queries=1)
+        self.assertEqual(list(orders[0]), ['id', 'user'])
+
+    def test_search_honours_fields(self):
+        response = self.client.get(reverse('product-search'), {'q': 'product', 'fields': 'name'})
+        self.assertEqual(list(response.json()['results'][0]), ['name', 'score'])
+
+    def test_unknown_names_are_rejected(self):
+        response = self.client.get(self.products_url, {'fields': 'id,secret', 'expand': 'rating'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()), {'fields', 'expand'})
+
+    def test_async_routes_match(self):
+        token = Token.objects.create(user=self.user)
+        self.client.force_authenticate(None)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        urls = [
+            (self.products_url, {'fields': 'id,variants', 'expand': ''}),
+            (reverse('user-orders'), {'fields': 'id,items', 'expand': 'items'}),
+            (self.products_url, {'fields': 'nope'}),
+        ]
+
+        def responses():
+            catalog_cache.clear()
+            return [(response.status_code, response.json()) for response in (self.client.get(*url) for url in urls)]
+
+        expected = responses()
+        with serving(ROUTES):
+            self.assertEqual(responses(), expected)
+
+
+class FastRendererTests(APITestCase):
+    PAYLOADS = [
+        {'name': 'Caf\u00e9 \u2603 \U0001f600', 'note': 'line\u2028para\u2029end', 'ctl': '\x00\x1f\x7f"\\/'},
+        {'price': Decimal('19.99'), 'tiny': Decimal('0.00001'), 'rating': 4.5, 'ratio': 1 / 3},
+        {'big': 1e16, 'small': 1e-7, 'neg': -2.5e-10, 'whole': 123456789012345678.0, 'wide': 2 ** 70},
+        {'at': datetime(2025, 1, 2, 3, 4, 5, 123456, tzinfo=dt_timezone.utc), 'naive': datetime(2025, 1, 2, 3, 4, 5)},
+        {'day': date(2025, 1, 2), 'time': time(3, 4, 5), 'span': timedelta(days=1, seconds=5)},
+        {'id': uuid.UUID(int=42), 'lazy': gettext_lazy('Pending'), 1: 'int key', 'ids': (1, 2, 3), 'set': frozenset()},
+        [None, True, False, 0, -1, '', [], {}, 'scientific 1e5, 0.00001 inside a string'],
+    ]
+
+    def test_output_is_byte_identical(self):
+        for data in self.PAYLOADS:
+            with self.subTest(data=data):
+                self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_indent_falls_back_to_the_stock_renderer(self):
+        data = {'a': [1, 2]}
+        self.assertEqual(
+            ORJSONRenderer().render(data, 'application/json; indent=2'),
+            JSONRenderer().render(data, 'application/json; indent=2'),
+        )
+
+    def test_endpoint_responses_match(self):
+        seed_dataset(seed=6, users=2, categories=1, products_per_category=4, reviews_per_product=2, orders_per_user=2)
+        self.client.force_authenticate(get_user_model().objects.get(username='bench1'))
+        category = Category.objects.get()
+        for url in (reverse('products-by-category', kwargs={'category_id': category.id}), reverse('user-orders')):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertIsInstance(response.accepted_renderer, ORJSONRenderer)
+            self.assertEqual(response.content, JSONRenderer().render(response.data))
+
+    def test_parser_matches_the_stock_parser(self):
+        for body in (b'{"a": [1, 2.5, "\\u00e9"], "b": null}', '{"n": "caf\u00e9"}'.encode(), b'{"wide": 1180591620717411303424}'):
+            with self.subTest(body=body):
+                self.assertEqual(ORJSONParser().parse(io.BytesIO(body)), JSONParser().parse(io.BytesIO(body)))
+        for body in (b'{"a": ', b'{"a": NaN}', b''):
+            with self.subTest(body=body), self.assertRaises(ParseError) as raised:
+                ORJSONParser().parse(io.BytesIO(body))
+            with self.assertRaises(ParseError) as expected:
+                JSONParser().parse(io.BytesIO(body))
+            self.assertEqual(str(raised.exception.detail), str(expected.exception.detail))
+
+    def test_json_requests_are_parsed(self):
+        user = get_user_model().objects.create_user(username='poster', email='poster@example.com', password='pass1234')
+        category = Category.objects.create(name='Posters')
+        variant = Variant.objects.create(
+            product=Product.objects.create(category=category, name='Poster', price=5),
+            variant_name='A2', price=5, stock=3,
+        )
+        self.client.force_authenticate(user)
+        response = self.client.post(reverse('add-to-cart'), {'product': variant.product_id, 'variant': variant.id, 'quantity': 2}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(CartItem.objects.get().quantity, 2)
+
+    def test_msgpack_round_trip(self):
+        data = {'name': 'Caf\u00e9', 'price': Decimal('19.99'), 'ids': [1, 2], 'at': datetime(2025, 1, 2, tzinfo=dt_timezone.utc)}
+        body = MessagePackRenderer().render(data)
+        self.assertEqual(
+            MessagePackParser().parse(io.BytesIO(body)),
+            {'name': 'Caf\u00e9', 'price': 19.99, 'ids': [1, 2], 'at': '2025-01-02T00:00:00Z'},
+        )
+        with self.assertRaises(ParseError):
+            MessagePackParser().parse(io.BytesIO(b'\xc1'))
+
+    def test_msgpack_is_negotiated(self):
+        self.client.force_authenticate(get_user_model().objects.create_user(username='service', password='pass1234'))
+        Category.objects.create(name='Parts')
+        response = self.client.get(reverse('category-list'), HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        self.assertEqual(msgpack.unpackb(response.content), json.loads(JSONRenderer().render(response.data)))
+        self.assertEqual(msgpack.unpackb(response.content)[0]['name'], 'Parts')
+
+        body = msgpack.packb({'product': 0, 'quantity': 1})
+        response = self.client.post(reverse('add-to-cart'), body, content_type='application/msgpack')
+        self.assertEqual(response.status_code, 400)  # parsed and validated, not 415
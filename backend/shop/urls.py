@@ -1,19 +1,31 @@
+from django.conf import settings
 from django.urls import path,include
-from .views import CategoryListView,ProductsByCategoryView
+from . import async_views
+from .views import CategoryListView,ProductsByCategoryView,ProductReviewsListView,CatalogCacheStatsView,ProductSearchView
 from .views import UserCartView, UserOrdersListView
-from .views import AddToCartView, PlaceOrderView, UserOrdersListView,OrderAdminViewSet,CartItemUpdateDeleteView,DirectPlaceOrderView,OrderDeleteView
+from .views import AddToCartView, CartBatchView, CartReserveView, PlaceOrderView, UserOrdersListView,OrderAdminViewSet,CartItemUpdateDeleteView,DirectPlaceOrderView,OrderDeleteView
 from rest_framework.routers import DefaultRouter
 
 
+def read_view(name, sync_view, async_view):
+    # SHOP_ASYNC_VIEWS lists the route names served by shop.async_views
+    return async_view if name in getattr(settings, 'SHOP_ASYNC_VIEWS', ()) else sync_view.as_view()
+
+
 router = DefaultRouter()
 router.register(r'admin/orders', OrderAdminViewSet, basename='admin-orders')
 
 urlpatterns = [
-    path('categories/', CategoryListView.as_view(), name='category-list'),
-    path('categories/<int:category_id>/products/', ProductsByCategoryView.as_view(), name='products-by-category'),
-    path('cart/', UserCartView.as_view(), name='user-cart'),
-    path('orders/', UserOrdersListView.as_view(), name='user-orders'),
+    path('categories/', read_view('category-list', CategoryListView, async_views.category_list), name='category-list'),
+    path('categories/<int:category_id>/products/', read_view('products-by-category', ProductsByCategoryView, async_views.products_by_category), name='products-by-category'),
+    path('products/search/', ProductSearchView.as_view(), name='product-search'),
+    path('products/<int:product_id>/reviews/', ProductReviewsListView.as_view(), name='product-reviews'),
+    path('catalog/cache-stats/', CatalogCacheStatsView.as_view(), name='catalog-cache-stats'),
+    path('cart/', read_view('user-cart', UserCartView, async_views.user_cart), name='user-cart'),
+    path('orders/', read_view('user-orders', UserOrdersListView, async_views.user_orders), name='user-orders'),
     path('cart/add/', AddToCartView.as_view(), name='add-to-cart'),
+    path('cart/batch/', CartBatchView.as_view(), name='cart-batch'),
+    path('cart/reserve/', CartReserveView.as_view(), name='cart-reserve'),
     path('orders/place/', PlaceOrderView.as_view(), name='place-order'),
     path('', include(router.urls)),
     path('orders/', UserOrdersListView.as_view(), name='user-orders'),
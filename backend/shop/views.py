@@ -4,41 +4,144 @@ from rest_framework.response import Response
 from rest_framework.decorators import action
 from rest_framework.generics import RetrieveUpdateDestroyAPIView
 from rest_framework.permissions import IsAuthenticated
-
-from .models import Category, Product, Cart, Order, CartItem
+from django.db import transaction
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.db.models import F, Prefetch
+
+from .cache import CatalogCacheMixin, catalog_cache
+from .conditional import ConditionalGetMixin, cart_etag, catalog_etag, orders_etag
+from .exports import csv_lines, ndjson_lines
+from .fieldsets import ALL, FieldsetViewMixin
+from .inventory import release_reservations, reserve_stock
+from .models import Category, Product, Variant, Review, Cart, Order, CartItem, OrderItem, StockReservation
+from .pagination import ProductCursorPagination, ReviewCursorPagination, OrderCursorPagination, SearchPagination
+from .ratings import RATING_FIELDS
+from .search import ranked_product_ids
 from .serializers import (
     CategorySerializer,
     ProductSerializer,
+    ReviewSerializer,
     CartSerializer,
     OrderSerializer,
     CartItemSerializer,
     AddCartItemSerializer,
+    CartBatchSerializer,
+    OrderFilterSerializer,
+    AdminOrderFilterSerializer,
+    OrderBulkStatusSerializer,
+    OrderExportSerializer,
     PlaceOrderSerializer,
     DirectPlaceOrderSerializer,
 )
 
 
-class CategoryListView(generics.ListAPIView):
+def cart_queryset():
+    """Carts with their total, lines, products and variants loaded in one extra query."""
+    return Cart.with_total(Cart.objects.prefetch_related(
+        Prefetch('items', queryset=CartItem.objects.select_related('product', 'variant'))
+    ))
+
+
+def product_queryset(category_id=None, fieldset=ALL):
+    """Products as the catalog lists them (all of them, or one category's), loading only what `fieldset` returns."""
+    # category is joined in, variants are fetched once per page; ratings
+    # come from the summary columns on Product, not the review table
+    deferred = ['search_document']
+    for name, columns in (('description', ['description']), ('rating', RATING_FIELDS), ('images', ['image_derivatives'])):
+        if not fieldset.includes(name):
+            deferred += columns
+    queryset = Product.objects.defer(*deferred)
+    if category_id is not None:
+        queryset = queryset.filter(category_id=category_id)
+    if fieldset.includes('category_name'):
+        queryset = queryset.select_related('category')
+    if fieldset.includes('variants'):
+        variants = Variant.objects.all() if fieldset.expands('variants') else Variant.objects.only('id', 'product_id')
+        queryset = queryset.prefetch_related(Prefetch('variants', queryset=variants))
+    return queryset
+
+
+def order_queryset(fieldset=ALL):
+    """Orders with their items, products and variants loaded in one extra query, as far as `fieldset` returns them."""
+    if not fieldset.includes('items'):
+        return Order.objects.all()
+    if fieldset.expands('items'):
+        items = OrderItem.objects.select_related('product', 'variant')
+    else:
+        items = OrderItem.objects.only('id', 'order_id')
+    return Order.objects.prefetch_related(Prefetch('items', queryset=items))
+
+
+class CategoryListView(ConditionalGetMixin, CatalogCacheMixin, generics.ListAPIView):
+    catalog_cache_scope = 'categories'
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
     permission_classes = [permissions.IsAuthenticated]  # only logged-in users can access
 
+    def get_etag(self, request):
+        return catalog_etag(self.catalog_cache_scope)
+
+
+class ProductsByCategoryView(FieldsetViewMixin, ConditionalGetMixin, CatalogCacheMixin, generics.ListAPIView):
+    catalog_cache_scope = 'products'
+    serializer_class = ProductSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = ProductCursorPagination
+
+    def get_etag(self, request):
+        return catalog_etag(self.catalog_cache_scope)
+
+    def get_queryset(self):
+        return product_queryset(self.kwargs.get('category_id'), self.get_fieldset())
 
-class ProductsByCategoryView(generics.ListAPIView):
+
+class ProductSearchView(FieldsetViewMixin, generics.GenericAPIView):
     serializer_class = ProductSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = SearchPagination
+
+    def get(self, request):
+        ranked = ranked_product_ids(request.query_params.get('q', ''))
+        if ranked is None:
+            return Response({'detail': 'Provide a search query with ?q=.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        page = self.paginate_queryset(ranked)
+        scores = dict(page)
+        products = product_queryset(fieldset=self.get_fieldset()).in_bulk(scores)
+        rows = [products[pk] for pk, _ in page if pk in products]
+        data = self.get_serializer(rows, many=True).data
+        for row, product in zip(data, rows):
+            row['score'] = scores[product.pk]
+        return self.get_paginated_response(data)
+
+
+class ProductReviewsListView(generics.ListAPIView):
+    serializer_class = ReviewSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = ReviewCursorPagination
 
     def get_queryset(self):
-        category_id = self.kwargs.get('category_id')
-        return Product.objects.filter(category_id=category_id)
+        product_id = self.kwargs.get('product_id')
+        return Review.objects.filter(product_id=product_id).select_related('user')
+
 
+class CatalogCacheStatsView(APIView):
+    permission_classes = [permissions.IsAdminUser]
 
-class UserCartView(generics.RetrieveAPIView):
+    def get(self, request):
+        return Response(catalog_cache.stats())
+
+
+class UserCartView(ConditionalGetMixin, generics.RetrieveAPIView):
     serializer_class = CartSerializer
     permission_classes = [permissions.IsAuthenticated]
 
+    def get_etag(self, request):
+        return cart_etag(request.user)
+
     def get_object(self):
-        cart, created = Cart.objects.get_or_create(user=self.request.user)
+        cart, created = cart_queryset().get_or_create(user=self.request.user)
         return cart
 
 
@@ -49,13 +152,27 @@ class CartItemUpdateDeleteView(RetrieveUpdateDestroyAPIView):
     def get_queryset(self):
         return CartItem.objects.filter(cart__user=self.request.user)
 
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        Cart.touch(self.request.user)
+
+    def perform_destroy(self, instance):
+        super().perform_destroy(instance)
+        Cart.touch(self.request.user)
+
 
-class UserOrdersListView(generics.ListAPIView):
+class UserOrdersListView(FieldsetViewMixin, ConditionalGetMixin, generics.ListAPIView):
     serializer_class = OrderSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = OrderCursorPagination
+
+    def get_etag(self, request):
+        return orders_etag(request.user)
 
     def get_queryset(self):
-        return Order.objects.filter(user=self.request.user).order_by('-created_at')
+        filters = OrderFilterSerializer(data=self.request.query_params)
+        filters.is_valid(raise_exception=True)
+        return filters.filter(order_queryset(self.get_fieldset()).filter(user=self.request.user))
 
 
 class AddToCartView(APIView):
@@ -69,18 +186,24 @@ class AddToCartView(APIView):
         variant = serializer.validated_data.get('variant', None)
         quantity = serializer.validated_data['quantity']
 
-        cart, _ = Cart.objects.get_or_create(user=request.user)
-
-        cart_item, created = CartItem.objects.get_or_create(
-            cart=cart,
-            product=product,
-            variant=variant
-        )
-        if not created:
-            cart_item.quantity += quantity
-        else:
-            cart_item.quantity = quantity
-        cart_item.save()
+        # Hot path: bump an existing line in a single UPDATE, so concurrent
+        # adds are summed by the database instead of racing in Python.
+        updated = CartItem.objects.filter(
+            cart__user=request.user, product=product, variant=variant
+        ).update(quantity=F('quantity') + quantity)
+        if not updated:
+            # First add of this line: lock the cart row so simultaneous first
+            # adds queue up and the loser increments the winner's row. The
+            # lock also covers variant-less lines, which a unique index on a
+            # nullable column cannot protect.
+            with transaction.atomic():
+                cart, _ = Cart.objects.select_for_update().get_or_create(user=request.user)
+                updated = CartItem.objects.filter(
+                    cart=cart, product=product, variant=variant
+                ).update(quantity=F('quantity') + quantity)
+                if not updated:
+                    CartItem.objects.create(cart=cart, product=product, variant=variant, quantity=quantity)
+        Cart.touch(request.user)
 
         variant_info = f" variant {variant.variant_name}" if variant else ""
         return Response(
@@ -89,6 +212,47 @@ class AddToCartView(APIView):
         )
 
 
+class CartBatchView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        serializer = CartBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        with transaction.atomic():
+            cart, _ = Cart.objects.select_for_update().get_or_create(user=request.user)
+            serializer.apply(cart)
+
+        cart = cart_queryset().get(pk=cart.pk)
+        return Response(CartSerializer(cart).data, status=status.HTTP_200_OK)
+
+
+class CartReserveView(APIView):
+    """Start checkout: hold stock for the cart's variant lines until the reservation expires."""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        with transaction.atomic():
+            # Re-reserving replaces (and so extends) any earlier hold.
+            release_reservations(StockReservation.objects.filter(user=request.user))
+            quantities = {}
+            for variant_id, quantity in CartItem.objects.filter(
+                cart__user=request.user, variant__isnull=False
+            ).values_list('variant_id', 'quantity'):
+                quantities[variant_id] = quantities.get(variant_id, 0) + quantity
+            if not quantities:
+                return Response({'detail': 'Cart has nothing to reserve'}, status=status.HTTP_400_BAD_REQUEST)
+            reservations = reserve_stock(request.user, quantities)
+
+        return Response({
+            'expires_at': reservations[0].expires_at,
+            'reservations': [
+                {'variant': reservation.variant_id, 'quantity': reservation.quantity}
+                for reservation in reservations
+            ],
+        }, status=status.HTTP_201_CREATED)
+
+
 class PlaceOrderView(generics.CreateAPIView):
     serializer_class = PlaceOrderSerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -97,10 +261,56 @@ class PlaceOrderView(generics.CreateAPIView):
         return {'request': self.request}
 
 
-class OrderAdminViewSet(viewsets.ModelViewSet):
-    queryset = Order.objects.all()
+class OrderAdminViewSet(FieldsetViewMixin, viewsets.ModelViewSet):
     serializer_class = OrderSerializer
     permission_classes = [permissions.IsAdminUser]  # Only admins can access
+    pagination_class = OrderCursorPagination
+
+    def get_queryset(self):
+        queryset = order_queryset(self.get_fieldset())
+        if self.action == 'list':
+            filters = AdminOrderFilterSerializer(data=self.request.query_params)
+            filters.is_valid(raise_exception=True)
+            queryset = filters.filter(queryset)
+        return queryset
+
+    @action(detail=False, methods=['post'], url_path='bulk-status')
+    def bulk_status(self, request):
+        serializer = OrderBulkStatusSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = set(serializer.validated_data['ids'])
+        target = serializer.validated_data['status']
+
+        with transaction.atomic():
+            current = dict(Order.objects.select_for_update().filter(pk__in=ids).values_list('pk', 'status'))
+            allowed = sorted(pk for pk, status_value in current.items() if target in Order.STATUS_TRANSITIONS[status_value])
+            if allowed:
+                Order.objects.filter(pk__in=allowed).update(status=target, updated_at=timezone.now())
+
+        return Response({
+            'status': target,
+            'updated': allowed,
+            'rejected': [
+                {'id': pk, 'status': status_value}
+                for pk, status_value in sorted(current.items()) if target not in Order.STATUS_TRANSITIONS[status_value]
+            ],
+            'not_found': sorted(ids - set(current)),
+        })
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        params = OrderExportSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        # no prefetching here: the export reads orders and items in batches itself
+        queryset = params.filter(Order.objects.all())
+        output = params.validated_data['output']
+        lines = csv_lines(queryset) if output == 'csv' else ndjson_lines(queryset)
+        response = StreamingHttpResponse(
+            lines, content_type='text/csv' if output == 'csv' else 'application/x-ndjson',
+        )
+        filename = f"orders-{timezone.now():%Y%m%d-%H%M%S}.{output}"
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
 
     @action(detail=True, methods=['patch'])
     def update_status(self, request, pk=None):
@@ -108,8 +318,15 @@ class OrderAdminViewSet(viewsets.ModelViewSet):
         status_value = request.data.get('status')
         if status_value not in dict(Order.STATUS_CHOICES):
             return Response({'error': 'Invalid status'}, status=status.HTTP_400_BAD_REQUEST)
-        order.status = status_value
-        order.save()
+        # guarded like bulk_status: only orders still in a status that may move to the target change
+        sources = [source for source, targets in Order.STATUS_TRANSITIONS.items() if status_value in targets]
+        now = timezone.now()
+        if not Order.objects.filter(pk=order.pk, status__in=sources).update(status=status_value, updated_at=now):
+            return Response(
+                {'error': f'Cannot move an order from {order.status} to {status_value}'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        order.status, order.updated_at = status_value, now
         return Response(self.get_serializer(order).data)
 
 